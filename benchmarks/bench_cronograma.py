@@ -0,0 +1,170 @@
+"""
+Benchmark del pivot del cronograma (columnas 'abr 25', 'grati jul 25', ...).
+
+Compara, sobre datos sintéticos, las versiones fila a fila que usaban la
+exportación a Excel (``.apply`` para etiquetas y orden + ``pivot_table``) y
+``anexar_cronograma_a_dataframe`` (``cron.at[pid, col] = ...`` celda a
+celda) contra ``pivot_cronograma``, y verifica que den lo mismo.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_cronograma.py [--prestamos 10000] [-n 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from prestamos.services import (  # noqa: E402
+    MESES_ABBR,
+    anexar_cronograma_a_dataframe,
+    pivot_cronograma,
+    preparar_columnas_cronograma_desde_hoy,
+)
+
+
+def _datos(n_prestamos: int, semilla: int = 7):
+    """Préstamos de 1 a 24 cuotas entre 2023 y 2027, ~1 de cada 6 con grati."""
+    rnd = random.Random(semilla)
+    prestamos, filas = [], []
+    for pid in range(1, n_prestamos + 1):
+        anio, mes = rnd.randint(2023, 2026), rnd.randint(1, 12)
+        cuotas = []
+        for _ in range(rnd.randint(1, 24)):
+            grati = mes in (7, 12) and rnd.random() < 0.4
+            monto = round(rnd.uniform(50, 500), 2)
+            etiqueta = f"{'Gratificación ' if grati else ''}mes {mes} {anio}"
+            cuotas.append(SimpleNamespace(anio=anio, mes=mes, es_grati=grati, monto=monto, etiqueta=etiqueta))
+            filas.append(
+                {
+                    "ID_PRESTAMO": pid,
+                    "FECHA_COBRO": date(anio, mes, 1).strftime("%Y-%m-%d"),
+                    "ETIQUETA": etiqueta,
+                    "MONTO": monto,
+                }
+            )
+            if not grati:
+                mes, anio = (1, anio + 1) if mes == 12 else (mes + 1, anio)
+        prestamos.append(SimpleNamespace(id=pid, cuotas=cuotas))
+    df = pd.DataFrame({"id": [p.id for p in prestamos], "NOMBRE": "x", "AÑO": 2025, "OBS": ""})
+    return prestamos, pd.DataFrame(filas), df
+
+
+# ------------------ Versiones anteriores (referencia) ------------------
+
+def export_antes(df_c: pd.DataFrame) -> pd.DataFrame:
+    df_c = df_c.copy()
+    df_c["FECHA_COBRO"] = pd.to_datetime(df_c["FECHA_COBRO"], errors="coerce")
+    df_c["is_grati"] = df_c["ETIQUETA"].str.contains("grat", case=False, na=False)
+    df_c["col"] = df_c["FECHA_COBRO"].apply(
+        lambda d: f"{MESES_ABBR.get(d.month,'')} {str(d.year)[-2:]}" if pd.notnull(d) else None
+    )
+    df_c.loc[df_c["is_grati"], "col"] = df_c.loc[df_c["is_grati"], "FECHA_COBRO"].apply(
+        lambda d: f"grati {MESES_ABBR.get(d.month,'')} {str(d.year)[-2:]}" if pd.notnull(d) else None
+    )
+    today = pd.Timestamp.today().normalize()
+
+    def sort_key(r):
+        d = r["FECHA_COBRO"]
+        if pd.isna(d):
+            return 9e9
+        months = (d.year - today.year) * 12 + (d.month - today.month)
+        return months + (-0.5 if r["is_grati"] else 0.0)
+
+    df_c["sort_key"] = df_c.apply(sort_key, axis=1)
+    col_order = (
+        df_c.loc[df_c["col"].notna(), ["col", "sort_key"]].drop_duplicates().sort_values("sort_key")
+    )["col"].tolist()
+    return (
+        pd.pivot_table(df_c, index=["ID_PRESTAMO"], columns=["col"], values="MONTO", aggfunc="sum")
+        .reindex(columns=col_order)
+        .fillna(0.0)
+    )
+
+
+def anexar_antes(df, prestamos):
+    cols, valores = preparar_columnas_cronograma_desde_hoy(prestamos)
+    pos = df.columns.get_loc("AÑO") + 1
+    base = df.set_index("id", drop=False)
+    cron = pd.DataFrame(0.0, index=base.index, columns=cols)
+    for pid, mapping in valores.items():
+        if pid in cron.index:
+            for col, monto in mapping.items():
+                if col in cron.columns:
+                    cron.at[pid, col] = float(monto)
+    return pd.concat([base.iloc[:, :pos], cron, base.iloc[:, pos:]], axis=1).reset_index(drop=True)
+
+
+# ------------------ Versión vectorizada ------------------
+
+def export_ahora(df_c: pd.DataFrame) -> pd.DataFrame:
+    fecha = pd.to_datetime(df_c["FECHA_COBRO"], errors="coerce")
+    return pivot_cronograma(
+        pd.DataFrame(
+            {
+                "prestamo_id": df_c["ID_PRESTAMO"],
+                "anio": fecha.dt.year,
+                "mes": fecha.dt.month,
+                "es_grati": df_c["ETIQUETA"].str.contains("grat", case=False, na=False),
+                "monto": df_c["MONTO"],
+            }
+        )
+    )
+
+
+def _medir(fn, n: int):
+    tiempos = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        out = fn()
+        tiempos.append(time.perf_counter() - t0)
+    return out, statistics.median(tiempos) * 1000
+
+
+def _iguales(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    return list(a.columns) == list(b.columns) and np.allclose(
+        a.to_numpy(dtype=float), b.to_numpy(dtype=float)
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--prestamos", type=int, default=10_000)
+    ap.add_argument("-n", type=int, default=5, help="repeticiones por variante (se reporta la mediana)")
+    args = ap.parse_args()
+
+    prestamos, df_c, df = _datos(args.prestamos)
+    print(f"{args.prestamos} préstamos, {len(df_c)} cuotas")
+
+    casos = [
+        ("export-excel", lambda: export_antes(df_c), lambda: export_ahora(df_c), None),
+        (
+            "anexar_cronograma",
+            lambda: anexar_antes(df, prestamos),
+            lambda: anexar_cronograma_a_dataframe(df, prestamos),
+            lambda out: out.iloc[:, 3:-1],  # solo las columnas del cronograma
+        ),
+    ]
+    print(f"{'caso':>20}  {'antes_ms':>10}  {'ahora_ms':>10}  {'x':>6}  iguales")
+    for nombre, antes, ahora, recorte in casos:
+        ref, t_antes = _medir(antes, args.n)
+        out, t_ahora = _medir(ahora, args.n)
+        if recorte:
+            ref, out = recorte(ref), recorte(out)
+        print(
+            f"{nombre:>20}  {t_antes:>10.1f}  {t_ahora:>10.1f}  {t_antes / t_ahora:>6.1f}  "
+            f"{_iguales(ref.reset_index(drop=True), out.reset_index(drop=True))}"
+        )
+
+
+if __name__ == "__main__":
+    main()
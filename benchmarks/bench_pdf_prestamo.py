@@ -0,0 +1,153 @@
+"""
+Benchmark del PDF GP-R-004: WeasyPrint (HTML -> PDF) vs ReportLab (dibujo directo).
+
+Cada motor se mide en un proceso aparte (para que el pico de memoria de uno
+no contamine al otro) sobre una base SQLite temporal con un préstamo de
+``--cuotas`` cuotas. Se reporta latencia (primer render, p50, p95, media) y
+memoria (RSS máximo del proceso y pico de asignaciones Python con tracemalloc;
+WeasyPrint reserva buena parte en C -Pango/cairo-, que solo se ve en el RSS).
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_pdf_prestamo.py [-n 50] [--cuotas 12]
+    python benchmarks/bench_pdf_prestamo.py --motor reportlab   # solo uno
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOTORES = ("weasyprint", "reportlab")
+
+
+def _preparar_app(n_cuotas: int):
+    tmp = tempfile.mkdtemp(prefix="bench_pdf_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmp}/bench.db"
+    os.environ["PDF_CACHE_DIR"] = os.path.join(tmp, "cache")
+    os.environ["PDF_WARMUP"] = "0"
+    os.environ["PDF_POOL_WORKERS"] = "0"
+    os.environ["TAREAS_WORKER"] = "0"
+    os.environ["DOCUMENT_GC"] = "0"
+    sys.path.insert(0, RAIZ)
+    os.chdir(RAIZ)
+
+    from prototipo_convenios_vacaciones_app import create_app
+    from models import db, Empleado
+    from prestamos.models import Prestamo, Cuota
+    from prestamos.services import generar_cronograma
+
+    app = create_app()
+    with app.app_context():
+        e = Empleado(dni="00000001", nombre="Colaborador Benchmark", cargo="ANALISTA",
+                     fecha_ingreso=date(2020, 1, 1))
+        db.session.add(e)
+        db.session.flush()
+        monto = 150 * n_cuotas
+        p = Prestamo(empleado_id=e.id, tipo="Salud", fecha_solicitud=date.today(),
+                     monto_total=monto, n_cuotas=n_cuotas, fecha_firma=date.today())
+        db.session.add(p)
+        db.session.flush()
+        hoy = date.today()
+        for it in generar_cronograma(monto, n_cuotas, hoy.month, hoy.year, False, None):
+            db.session.add(Cuota(prestamo_id=p.id, orden=it["orden"], etiqueta=it["etiqueta"],
+                                 anio=it["anio"], mes=it["mes"], monto=it["monto"]))
+        db.session.commit()
+        return app, p.id
+
+
+def medir(motor: str, n: int, n_cuotas: int) -> dict:
+    app, pid = _preparar_app(n_cuotas)
+
+    from documentos.render import render_pdf
+    from prestamos.models import Prestamo
+    from prestamos.pdf_reportlab import render_prestamo_reportlab
+    from prestamos.routes import _contexto_pdf_prestamo
+    from prestamos.services import PDF_CSS
+
+    with app.test_request_context():
+        p = Prestamo.query.get(pid)
+        if motor == "weasyprint":
+            from flask import render_template
+
+            def render():
+                html = render_template("prestamos/pdf.html", **_contexto_pdf_prestamo(p))
+                return render_pdf(html, css=(PDF_CSS,))
+        else:
+            def render():
+                return render_prestamo_reportlab(**_contexto_pdf_prestamo(p))
+
+        t0 = time.perf_counter()
+        pdf = render()
+        primero = time.perf_counter() - t0
+        tiempos = []
+        for _ in range(n):
+            t0 = time.perf_counter()
+            render()
+            tiempos.append(time.perf_counter() - t0)
+
+        # Pico de memoria en una pasada aparte: tracemalloc infla los tiempos
+        tracemalloc.start()
+        render()
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    tiempos.sort()
+    return {
+        "motor": motor,
+        "bytes_pdf": len(pdf),
+        "primer_ms": primero * 1000,
+        "p50_ms": statistics.median(tiempos) * 1000,
+        "p95_ms": tiempos[max(0, int(len(tiempos) * 0.95) - 1)] * 1000,
+        "media_ms": statistics.fmean(tiempos) * 1000,
+        "pico_python_mb": pico / 2**20,
+        # ru_maxrss: KB en Linux
+        "rss_max_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("-n", type=int, default=50, help="renders medidos por motor")
+    ap.add_argument("--cuotas", type=int, default=12)
+    ap.add_argument("--motor", choices=MOTORES, help="medir solo este motor (en este proceso)")
+    args = ap.parse_args()
+
+    if args.motor:
+        print(json.dumps(medir(args.motor, args.n, args.cuotas)))
+        return
+
+    filas = []
+    for motor in MOTORES:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--motor", motor,
+             "-n", str(args.n), "--cuotas", str(args.cuotas)],
+            capture_output=True, text=True,
+        )
+        if out.returncode != 0:
+            print(f"[{motor}] falló:\n{out.stderr}", file=sys.stderr)
+            continue
+        filas.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    cols = ["motor", "bytes_pdf", "primer_ms", "p50_ms", "p95_ms", "media_ms",
+            "pico_python_mb", "rss_max_mb"]
+    print(f"{args.n} renders, {args.cuotas} cuotas")
+    print("  ".join(f"{c:>14}" for c in cols))
+    for f in filas:
+        print("  ".join(
+            f"{f[c]:>14.1f}" if isinstance(f[c], float) else f"{f[c]:>14}" for c in cols
+        ))
+    if len(filas) == 2 and filas[0]["p50_ms"] and filas[1]["p50_ms"]:
+        lento, rapido = sorted(filas, key=lambda f: f["p50_ms"], reverse=True)
+        print(f"\n{rapido['motor']} es {lento['p50_ms'] / rapido['p50_ms']:.1f}x "
+              f"más rápido que {lento['motor']} (p50)")
+
+
+if __name__ == "__main__":
+    main()
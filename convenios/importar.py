@@ -0,0 +1,347 @@
+# convenios/importar.py
+"""
+Importación masiva de colaboradores y periodos vacacionales (Excel / CSV).
+
+Columnas (sin importar mayúsculas ni tildes): DNI, NOMBRE, CARGO,
+FECHA_INGRESO, DIRECCION y, opcional, DIAS_PERIODO (30 por defecto).
+
+- DNI, nombre y fechas se validan por columna (pandas), no fila por fila.
+- ``Empleado`` se crea o actualiza por DNI; las celdas vacías no pisan lo
+  que ya está registrado (el nombre solo es obligatorio para DNIs nuevos,
+  así un archivo con solo CARGO o DIRECCION actualiza esos campos).
+- Con fecha de ingreso se generan los periodos aniversario a aniversario
+  (del año de ingreso hasta el vigente), con sus días pendientes/truncos y
+  el movimiento de ALTA, igual que ``new_period``. Un ingreso el 29/02
+  cumple aniversario el 28/02 en los años no bisiestos. Los periodos que el
+  colaborador ya tiene no se duplican.
+- Todo se escribe con INSERT/UPDATE masivos, en transacciones de
+  ``IMPORT_LOTE`` filas: si un lote falla se revierte solo ese lote y sus
+  filas quedan en el reporte.
+
+El resultado es un reporte con contadores y los errores por fila (número de
+fila del archivo, con el encabezado como fila 1).
+"""
+from __future__ import annotations
+
+import io
+import os
+import unicodedata
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import insert, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Empleado, PeriodoVacacional, MovimientoVacacional
+from utils import calcular_dias_truncos
+
+LOTE = int(os.getenv("IMPORT_LOTE", "1000"))
+DIAS_PERIODO = 30
+
+# encabezado normalizado -> campo
+ALIAS = {
+    "DNI": "dni",
+    "NRO_DNI": "dni",
+    "NOMBRE": "nombre",
+    "NOMBRES": "nombre",
+    "NOMBRE_COMPLETO": "nombre",
+    "APELLIDOS_Y_NOMBRES": "nombre",
+    "CARGO": "cargo",
+    "PUESTO": "cargo",
+    "FECHA_INGRESO": "fecha_ingreso",
+    "INGRESO": "fecha_ingreso",
+    "F_INGRESO": "fecha_ingreso",
+    "DIRECCION": "direccion",
+    "DOMICILIO": "direccion",
+    "DIAS_PERIODO": "dias_periodo",
+    "DIAS": "dias_periodo",
+}
+CAMPOS = ("dni", "nombre", "cargo", "fecha_ingreso", "direccion", "dias_periodo")
+LARGOS = {"nombre": 100, "cargo": 100, "direccion": 200}
+
+
+class ErrorImportacion(ValueError):
+    """El archivo no se puede leer o le faltan columnas obligatorias."""
+
+
+def _encabezado(col) -> str:
+    txt = unicodedata.normalize("NFKD", str(col)).encode("ascii", "ignore").decode()
+    return "_".join(txt.strip().upper().replace(".", " ").split())
+
+
+def leer_tabla(
+    origen, nombre: str = "", alias=None, obligatorias=("dni",), campos=CAMPOS
+) -> pd.DataFrame:
+    """
+    Lee ``origen`` (ruta o archivo abierto) como texto: .xlsx/.xls por
+    extensión, lo demás como CSV (separador ``,`` o ``;`` detectado).
+    Renombra los encabezados con ``alias`` y deja solo ``campos``.
+    """
+    alias = ALIAS if alias is None else alias
+    nombre = (nombre or getattr(origen, "name", "") or str(origen)).lower()
+    try:
+        if nombre.endswith((".xlsx", ".xlsm", ".xls")):
+            df = pd.read_excel(origen, dtype=str)
+        else:
+            datos = origen.read() if hasattr(origen, "read") else open(origen, "rb").read()
+            if isinstance(datos, str):
+                datos = datos.encode("utf-8")
+            try:
+                texto = datos.decode("utf-8-sig")
+            except UnicodeDecodeError:
+                texto = datos.decode("latin-1")
+            df = pd.read_csv(io.StringIO(texto), dtype=str, sep=None, engine="python")
+    except (ValueError, OSError, pd.errors.ParserError) as e:
+        raise ErrorImportacion(f"No se pudo leer el archivo: {e}") from e
+    return normalizar_tabla(df, alias, obligatorias, campos)
+
+
+def normalizar_tabla(df: pd.DataFrame, alias, obligatorias, campos) -> pd.DataFrame:
+    """Encabezados a ``campos`` (vía ``alias``), numera las filas como en el archivo."""
+    df = df.rename(columns=lambda c: alias.get(_encabezado(c), _encabezado(c)))
+    faltan = [c for c in obligatorias if c not in df.columns]
+    if faltan:
+        raise ErrorImportacion("Faltan columnas obligatorias: " + ", ".join(c.upper() for c in faltan))
+    df = df.loc[:, ~df.columns.duplicated()]
+    for c in campos:
+        if c not in df.columns:
+            df[c] = None
+    df = df[list(campos)]
+    # Fila del archivo (la 1 es el encabezado)
+    df.index = pd.RangeIndex(2, len(df) + 2, name="fila")
+    return df.dropna(how="all")
+
+
+def normalizar_dni(s: pd.Series) -> pd.Series:
+    """Texto sin espacios; Excel suele leer el DNI como número: quita el '.0' y repone ceros."""
+    dni = s.astype("string").str.strip().replace("", pd.NA).str.replace(r"\.0$", "", regex=True)
+    solo_digitos = dni.str.fullmatch(r"\d{1,8}").fillna(False)
+    return dni.where(~solo_digitos, dni.str.zfill(8))
+
+
+def dni_invalido(dni: pd.Series) -> pd.Series:
+    return dni.notna() & ~dni.str.fullmatch(r"\d{8}").fillna(False)
+
+
+def marcar_errores(reglas, index):
+    """``reglas``: [(máscara, mensaje)]. Devuelve ``({fila: [mensajes]}, filas_malas)``."""
+    errores: Dict[int, List[str]] = {}
+    malas = pd.Series(False, index=index)
+    for mascara, mensaje in reglas:
+        mascara = mascara.fillna(False).astype(bool)
+        for fila in mascara.index[mascara]:
+            errores.setdefault(int(fila), []).append(mensaje)
+        malas |= mascara
+    return errores, malas
+
+
+def lista_errores(errores: Dict[int, List[str]], dni: pd.Series) -> List[dict]:
+    """Reporte ordenado por fila: ``[{fila, dni, errores}]``."""
+    return [
+        {"fila": fila, "dni": None if pd.isna(dni.get(fila)) else str(dni[fila]), "errores": msgs}
+        for fila, msgs in sorted(errores.items())
+    ]
+
+
+def parsear_fechas(s: pd.Series) -> pd.Series:
+    """aaaa-mm-dd (con o sin hora, como las deja Excel) o dd/mm/aaaa, dd-mm-aaaa."""
+    s = s.str.strip().str.replace(r"[ T]00:00:00$", "", regex=True)
+    iso = pd.to_datetime(s, format="%Y-%m-%d", errors="coerce")
+    dmy = pd.to_datetime(s.str.replace("-", "/", regex=False), format="%d/%m/%Y", errors="coerce")
+    return iso.fillna(dmy)
+
+
+def _dnis_registrados(dnis) -> set:
+    dnis = [d for d in dict.fromkeys(dnis) if isinstance(d, str)]
+    registrados = set()
+    for ini in range(0, len(dnis), LOTE):
+        registrados.update(
+            d for (d,) in db.session.query(Empleado.dni).filter(Empleado.dni.in_(dnis[ini : ini + LOTE]))
+        )
+    return registrados
+
+
+def validar(df: pd.DataFrame, hoy: Optional[date] = None):
+    """
+    Normaliza columnas y marca errores por columna.
+
+    Devuelve ``(validas, errores)``: el DataFrame de filas sin errores
+    (``fecha_ingreso`` como ``date`` o None) y ``{fila: [mensajes]}``.
+    """
+    hoy = hoy or date.today()
+    df = df.copy()
+    for c in ("nombre", "cargo", "direccion", "dias_periodo"):
+        df[c] = df[c].astype("string").str.strip().replace("", pd.NA)
+    df["nombre"] = df["nombre"].str.upper()
+    df["cargo"] = df["cargo"].str.upper()
+    df["dni"] = normalizar_dni(df["dni"])
+
+    fecha_txt = df["fecha_ingreso"].astype("string").replace("", pd.NA)
+    fecha = parsear_fechas(fecha_txt)
+    dias = pd.to_numeric(df["dias_periodo"], errors="coerce")
+    registrado = df["dni"].isin(_dnis_registrados(df["dni"].dropna()))
+
+    reglas = [
+        (df["dni"].isna(), "DNI vacío"),
+        (dni_invalido(df["dni"]), "DNI inválido (8 dígitos)"),
+        (df["dni"].notna() & df["dni"].duplicated(keep="first"), "DNI repetido en el archivo"),
+        (df["nombre"].isna() & ~registrado, "Nombre vacío (obligatorio para un DNI nuevo)"),
+        (fecha_txt.notna() & fecha.isna(), "Fecha de ingreso inválida (aaaa-mm-dd o dd/mm/aaaa)"),
+        (fecha.notna() & (fecha > pd.Timestamp(hoy)), "Fecha de ingreso futura"),
+        (df["dias_periodo"].notna() & ~dias.between(1, 60), "DIAS_PERIODO inválido (1 a 60)"),
+    ]
+    for campo, largo in LARGOS.items():
+        reglas.append((df[campo].str.len().gt(largo).fillna(False), f"{campo.capitalize()} excede {largo} caracteres"))
+
+    errores, malas = marcar_errores(reglas, df.index)
+    df["fecha_ingreso"] = [d.date() if pd.notna(d) else None for d in fecha]
+    df["dias_periodo"] = dias.fillna(DIAS_PERIODO).astype(int)
+    validas = df.loc[~malas].astype(object).where(df.loc[~malas].notna(), None)
+    return validas, errores
+
+
+def _aniversario(fecha_ingreso: date, anio: int) -> date:
+    """Aniversario del ingreso en ``anio``; un 29/02 cae el 28/02 si el año no es bisiesto."""
+    try:
+        return fecha_ingreso.replace(year=anio)
+    except ValueError:
+        return date(anio, 2, 28)
+
+
+def _periodos(fecha_ingreso: date, dias: int, hoy: date, desde_anio: Optional[int]):
+    """
+    Periodos desde el año de ingreso hasta el que está en curso hoy (como
+    ``periodo_from_ingreso``, pero sin fallar con un ingreso el 29/02).
+    """
+    k = 0
+    while True:
+        inicio = _aniversario(fecha_ingreso, fecha_ingreso.year + k)
+        fin = _aniversario(fecha_ingreso, fecha_ingreso.year + k + 1) - timedelta(days=1)
+        periodo = f"{inicio.year}-{fin.year}"
+        if inicio > hoy:
+            return
+        if desde_anio is None or inicio.year >= desde_anio:
+            ganados = calcular_dias_truncos(fecha_ingreso, hoy, inicio, fin)
+            pendientes, truncos = (dias, 0) if ganados >= dias else (0, ganados)
+            yield dict(
+                periodo=periodo,
+                fecha_inicio=inicio,
+                fecha_fin=fin,
+                dias_periodo=dias,
+                dias_tomados=0,
+                dias_pendientes=pendientes,
+                dias_truncos=truncos,
+            )
+        k += 1
+
+
+def _importar_lote(lote: pd.DataFrame, hoy: date, con_periodos: bool, desde_anio, res):
+    filas = lote.to_dict("records")
+    existentes = dict(
+        db.session.query(Empleado.dni, Empleado.id).filter(Empleado.dni.in_([f["dni"] for f in filas]))
+    )
+
+    nuevos, cambios = [], []
+    for f in filas:
+        datos = {c: f[c] for c in ("dni", "nombre", "cargo", "fecha_ingreso", "direccion")}
+        if f["dni"] in existentes:
+            # Celdas vacías: se conserva el valor registrado
+            cambios.append({"id": existentes[f["dni"]], **{k: v for k, v in datos.items() if v is not None}})
+        else:
+            nuevos.append(datos)
+
+    if cambios:
+        db.session.execute(update(Empleado), cambios)
+    ids = dict(existentes)
+    if nuevos:
+        creados = db.session.execute(
+            insert(Empleado).returning(Empleado.dni, Empleado.id, sort_by_parameter_order=True), nuevos
+        )
+        ids.update(creados.tuples().all())
+
+    n_periodos = 0
+    if con_periodos:
+        ya = set(
+            db.session.query(PeriodoVacacional.id_empleado, PeriodoVacacional.periodo).filter(
+                PeriodoVacacional.id_empleado.in_(list(existentes.values()))
+            )
+        ) if existentes else set()
+        periodos = []
+        for f in filas:
+            if f["fecha_ingreso"] is None:
+                continue
+            eid = ids[f["dni"]]
+            for p in _periodos(f["fecha_ingreso"], f["dias_periodo"], hoy, desde_anio):
+                if (eid, p["periodo"]) not in ya:
+                    periodos.append({"id_empleado": eid, **p})
+        if periodos:
+            pids = db.session.execute(
+                insert(PeriodoVacacional).returning(PeriodoVacacional.id, sort_by_parameter_order=True),
+                periodos,
+            ).scalars().all()
+            db.session.execute(
+                insert(MovimientoVacacional),
+                [
+                    dict(
+                        id_empleado=p["id_empleado"],
+                        id_periodo=pid,
+                        tipo=p["periodo"],
+                        fecha=hoy,
+                        dias=p["dias_periodo"],
+                        saldo_resultante=p["dias_pendientes"],
+                    )
+                    for p, pid in zip(periodos, pids)
+                ],
+            )
+            n_periodos = len(periodos)
+
+    res["empleados_creados"] += len(nuevos)
+    res["empleados_actualizados"] += len(cambios)
+    res["periodos_creados"] += n_periodos
+
+
+def importar_empleados(
+    origen,
+    nombre: str = "",
+    *,
+    con_periodos: bool = True,
+    desde_anio: Optional[int] = None,
+    simular: bool = False,
+    hoy: Optional[date] = None,
+) -> dict:
+    """
+    Importa colaboradores (y sus periodos) desde ``origen``.
+
+    ``desde_anio`` limita los periodos generados a los que empiezan ese año o
+    después; ``simular=True`` solo valida. Lanza ``ErrorImportacion`` si el
+    archivo no se puede leer; los problemas por fila van en el reporte.
+    """
+    hoy = hoy or date.today()
+    df = leer_tabla(origen, nombre)
+    validas, errores = validar(df, hoy)
+    res = {
+        "filas": int(len(df)),
+        "validas": int(len(validas)),
+        "empleados_creados": 0,
+        "empleados_actualizados": 0,
+        "periodos_creados": 0,
+        "simulacion": simular,
+    }
+
+    if not simular:
+        validas = validas.assign(_fila=validas.index.astype(int))
+        for ini in range(0, len(validas), LOTE):
+            lote = validas.iloc[ini : ini + LOTE]
+            try:
+                _importar_lote(lote, hoy, con_periodos, desde_anio, res)
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                motivo = f"Lote revertido: {e.__class__.__name__}: {str(getattr(e, 'orig', e))[:200]}"
+                for fila in lote.index:
+                    errores.setdefault(int(fila), []).append(motivo)
+
+    res["errores"] = lista_errores(errores, df["dni"].astype("string"))
+    res["filas_con_error"] = len(res["errores"])
+    return res
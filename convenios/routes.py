@@ -1,8 +1,11 @@
 # convenios/routes.py
 import io
+import re
 from datetime import datetime, date, timedelta
 from io import BytesIO
 
+import click
+
 from flask import (
     render_template,
     request,
@@ -13,14 +16,22 @@ from flask import (
     abort,
     jsonify,
     Response,
+    stream_with_context,
 )
 from flask_login import login_required
-from weasyprint import HTML
+from sqlalchemy.orm import joinedload
+
+from documentos import pdf_asset, pdf_cache, render_pdf
+from documentos.vista import pide_vista_html, respuesta_vista_html
+from documentos.lote import DocumentoLote, fecha_arg, lista_arg, pdfs_en_paralelo, zip_en_stream
+from tareas import encolar_desde_request
 
 # IMPORTA el único blueprint definido en __init__.py
 from . import convenios_bp
+from .importar import ErrorImportacion, importar_empleados
 
 from models import db, Empleado, PeriodoVacacional, MovimientoVacacional, Convenio
+from presupuesto_sql import presupuesto_sql
 from utils import (
     fecha_literal,
     fecha_firma_literal,
@@ -155,11 +166,9 @@ def convenios_index():
         order_col = getattr(Convenio, candidate, None)
         if order_col is not None:
             break
-    convenios = (
-        Convenio.query.order_by(order_col.desc()).all()
-        if order_col
-        else Convenio.query.all()
-    )
+    # La lista muestra nombre/cargo/DNI de cada convenio: empleado en el mismo SELECT
+    q = Convenio.query.options(joinedload(Convenio.empleado))
+    convenios = q.order_by(order_col.desc()).all() if order_col else q.all()
     return render_template("convenios_list.html", convenios=convenios)
 
 
@@ -225,6 +234,66 @@ def new_employee():
     return render_template("new_employee.html")
 
 
+@convenios_bp.route("/importar", methods=["GET", "POST"], endpoint="import_employees")
+@login_required
+@presupuesto_sql(None)  # crece con el número de lotes
+def import_employees():
+    """Carga masiva desde Excel/CSV. Responde JSON si se pide (?formato=json o Accept)."""
+    if request.method == "GET":
+        return render_template("convenios/importar.html", reporte=None)
+
+    quiere_json = request.args.get("formato") == "json" or not request.accept_mimetypes.accept_html
+    archivo = request.files.get("archivo")
+    if not archivo or not archivo.filename:
+        if quiere_json:
+            return jsonify({"error": "Adjunta un archivo .xlsx o .csv en 'archivo'."}), 400
+        flash("Selecciona un archivo .xlsx o .csv.", "warning")
+        return render_template("convenios/importar.html", reporte=None)
+
+    desde = (request.form.get("desde_anio") or "").strip()
+    try:
+        reporte = importar_empleados(
+            archivo.stream,
+            archivo.filename,
+            con_periodos=request.form.get("periodos", "1") not in ("0", "false", "off"),
+            desde_anio=int(desde) if desde.isdigit() else None,
+            simular=request.form.get("simular") in ("1", "true", "on"),
+        )
+    except ErrorImportacion as e:
+        if quiere_json:
+            return jsonify({"error": str(e)}), 400
+        flash(str(e), "warning")
+        return render_template("convenios/importar.html", reporte=None)
+
+    if quiere_json:
+        return jsonify(reporte)
+    return render_template("convenios/importar.html", reporte=reporte)
+
+
+@convenios_bp.cli.command("importar-empleados")
+@click.argument("archivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--sin-periodos", is_flag=True, help="Solo colaboradores, sin generar periodos.")
+@click.option("--desde-anio", type=int, help="Generar solo periodos que empiezan desde este año.")
+@click.option("--simular", is_flag=True, help="Validar sin escribir nada.")
+def importar_empleados_cli(archivo, sin_periodos, desde_anio, simular):
+    """Importa colaboradores y periodos desde un .xlsx/.csv (flask convenios importar-empleados)."""
+    try:
+        reporte = importar_empleados(
+            archivo, con_periodos=not sin_periodos, desde_anio=desde_anio, simular=simular
+        )
+    except ErrorImportacion as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"{reporte['filas']} filas, {reporte['validas']} válidas: "
+        f"{reporte['empleados_creados']} creados, {reporte['empleados_actualizados']} actualizados, "
+        f"{reporte['periodos_creados']} periodos" + (" (simulación)" if simular else "")
+    )
+    for err in reporte["errores"]:
+        click.echo(f"  fila {err['fila']} [{err['dni'] or '-'}]: {'; '.join(err['errores'])}", err=True)
+    if reporte["errores"]:
+        raise SystemExit(1)
+
+
 @convenios_bp.get("/empleados/<int:empleado_id>", endpoint="view_employee")
 @login_required
 def view_employee(empleado_id):
@@ -234,6 +303,7 @@ def view_employee(empleado_id):
     )
     movimientos = (
         MovimientoVacacional.query.filter_by(id_empleado=empleado_id)
+        .options(joinedload(MovimientoVacacional.periodo_vacacional))
         .order_by(MovimientoVacacional.fecha.desc())
         .all()
     )
@@ -466,6 +536,7 @@ def solicitar_vacaciones(empleado_id):
             ),
             movimientos=(
                 MovimientoVacacional.query.filter_by(id_empleado=e.id)
+                .options(joinedload(MovimientoVacacional.periodo_vacacional))
                 .order_by(MovimientoVacacional.fecha.desc())
                 .all()
             ),
@@ -585,15 +656,17 @@ def solicitar_vacaciones(empleado_id):
 # PDFs de Convenio
 # =============================
 
+# Versión de formato de cada plantilla; forma parte de la clave de pdf_cache
+FORMATO_CONVENIO_ACUMULACION = "convenio_pdf v1"
+FORMATO_CONVENIO_ADELANTO = "adelanto_pdf v1"
+
 
 @convenios_bp.get("/generar_convenio/<int:id>", endpoint="generar_convenio")
 @login_required
 def generar_convenio(id):
-    from weasyprint import HTML
-
     convenio = db.session.get(Convenio, id)
     html_content = render_template("convenio.html", convenio=convenio)
-    pdf = HTML(string=html_content).write_pdf()
+    pdf = render_pdf(html_content)
     return Response(pdf, mimetype="application/pdf")
 
 
@@ -603,9 +676,6 @@ def generar_convenio(id):
 )
 @login_required
 def generar_convenio_acumulacion_pdf(empleado_id: int):
-    from weasyprint import HTML as _HTML
-    import re
-
     e = Empleado.query.get_or_404(empleado_id)
 
     # === Fecha de firma: prioriza ISO del form ===
@@ -736,14 +806,15 @@ def generar_convenio_acumulacion_pdf(empleado_id: int):
         },
         firma={"fecha": firma, "fecha_larga": fecha_firma_literal(firma)},
     )
+    if pide_vista_html():
+        return respuesta_vista_html(html, titulo=f"Convenio de acumulación · {e.nombre}")
 
-    pdf_io = io.BytesIO()
-    _HTML(string=html, base_url=request.host_url).write_pdf(pdf_io)
-    pdf_io.seek(0)
-
-    def _sanitize(s: str) -> str:
-        s = re.sub(r"\s+", "_", (s or "").strip())
-        return re.sub(r"[^A-Za-z0-9_\-]", "", s)
+    pdf = pdf_cache.get_or_render(
+        html,
+        FORMATO_CONVENIO_ACUMULACION,
+        lambda: render_pdf(html),
+    )
+    pdf_io = io.BytesIO(pdf)
 
     safe_nombre = _sanitize(e.nombre or "Empleado")
     fecha_base = raw_iso if raw_iso else firma.isoformat()
@@ -754,17 +825,17 @@ def generar_convenio_acumulacion_pdf(empleado_id: int):
     )
 
 
-@convenios_bp.get("/convenio/<int:convenio_id>/pdf", endpoint="convenio_pdf")
-@login_required
-def convenio_pdf(convenio_id):
-    from weasyprint import HTML
-
-    conv = Convenio.query.get_or_404(convenio_id)
+def _html_convenio(conv, firma: date, fecha_larga: str) -> str:
+    """
+    HTML del convenio de acumulación a partir de los dos últimos periodos
+    del empleado. Compartido por la vista, la descarga y el lote.
+    Lanza ValueError si el empleado no tiene al menos dos periodos.
+    """
     e = conv.empleado
 
     periodos = sorted(e.periodos, key=lambda x: (x.fecha_inicio or date.min))
     if len(periodos) < 2:
-        abort(400, description="El empleado no tiene al menos dos periodos.")
+        raise ValueError("El empleado no tiene al menos dos periodos.")
     p1_db = periodos[-2]
     p2_db = periodos[-1]
 
@@ -777,7 +848,6 @@ def convenio_pdf(convenio_id):
         .order_by(MovimientoVacacional.fecha_inicio.asc())
         .all()
     )
-
     bloques_p1 = []
     for m in movs_p1_hist:
         ini, fin = m.fecha_inicio, m.fecha_fin
@@ -790,7 +860,7 @@ def convenio_pdf(convenio_id):
                 "periodo": p1_db.periodo,
                 "inicio": ini,
                 "fin": fin,
-                "verbo": verbo_por_bloque(ini, fin, conv.fecha_firma or date.today()),
+                "verbo": verbo_por_bloque(ini, fin, firma),
             }
         )
     total_p1_bloques = sumar_dias(bloques_p1)
@@ -816,7 +886,7 @@ def convenio_pdf(convenio_id):
     ventana_p2_desde = p2_db.fecha_inicio.replace(year=p2_db.fecha_inicio.year + 1)
     ventana_p2_hasta = p2_db.fecha_fin.replace(year=p2_db.fecha_fin.year + 1)
 
-    html = render_template(
+    return render_template(
         "convenio_pdf.html",
         empresa={
             "razon_social": "CONTRANS S.A.C.",
@@ -845,10 +915,37 @@ def convenio_pdf(convenio_id):
             "ventana_p2_desde": ventana_p2_desde,
             "ventana_p2_hasta": ventana_p2_hasta,
         },
-        firma={"fecha_larga": fecha_literal(conv.fecha_firma or date.today())},
+        firma={"fecha": firma, "fecha_larga": fecha_larga},
     )
 
-    pdf = HTML(string=html, base_url=request.host_url).write_pdf()
+
+def _sanitize(s: str) -> str:
+    s = re.sub(r"\s+", "_", (s or "").strip())
+    return re.sub(r"[^A-Za-z0-9_\-]", "", s)
+
+
+def _nombre_pdf_convenio(conv, firma: date) -> str:
+    safe_nombre = _sanitize(conv.empleado.nombre or "Empleado")
+    return f"{firma.isoformat()}_CONVENIO_ACUMULACIÓN_{safe_nombre}_{conv.id}.pdf"
+
+
+@convenios_bp.get("/convenio/<int:convenio_id>/pdf", endpoint="convenio_pdf")
+@login_required
+def convenio_pdf(convenio_id):
+    conv = Convenio.query.get_or_404(convenio_id)
+    firma = conv.fecha_firma or date.today()
+    try:
+        html = _html_convenio(conv, firma, fecha_literal(firma))
+    except ValueError as ex:
+        abort(400, description=str(ex))
+    if pide_vista_html():
+        return respuesta_vista_html(html, titulo=f"Convenio {conv.id}")
+
+    pdf = pdf_cache.get_or_render(
+        html,
+        FORMATO_CONVENIO_ACUMULACION,
+        lambda: render_pdf(html),
+    )
     return send_file(
         BytesIO(pdf),
         download_name=f"convenio_{conv.id}.pdf",
@@ -867,122 +964,40 @@ def convenio_pdf(convenio_id):
 )
 @login_required
 def descargar_convenio_pdf(convenio_id):
-    from weasyprint import HTML
-    import re
-
     conv = Convenio.query.get_or_404(convenio_id)
-    e = conv.empleado
 
+    vista = pide_vista_html()
     raw_ff = (request.values.get("fecha_firma") or "").strip()
     if raw_ff:
         try:
             firma = datetime.strptime(raw_ff, "%Y-%m-%d").date()
         except ValueError:
             abort(400, description="fecha_firma inválida")
-        conv.fecha_firma = firma
-        db.session.add(conv)
-        db.session.commit()
+        # En vista previa la fecha solo se usa para el texto, no se guarda
+        if not vista:
+            conv.fecha_firma = firma
+            db.session.add(conv)
+            db.session.commit()
     else:
         firma = conv.fecha_firma or date.today()
 
-    periodos = sorted(e.periodos, key=lambda x: (x.fecha_inicio or date.min))
-    if len(periodos) < 2:
-        abort(400, description="El empleado no tiene al menos dos periodos.")
-    p1_db = periodos[-2]
-    p2_db = periodos[-1]
-
-    movs_p1_hist = (
-        MovimientoVacacional.query.filter(
-            MovimientoVacacional.id_empleado == e.id,
-            MovimientoVacacional.id_periodo == p1_db.id,
-            MovimientoVacacional.tipo.in_(("GOCE", "SOLICITUD_VACACIONES")),
-        )
-        .order_by(MovimientoVacacional.fecha_inicio.asc())
-        .all()
-    )
-    bloques_p1 = []
-    for m in movs_p1_hist:
-        ini, fin = m.fecha_inicio, m.fecha_fin
-        if not (ini and fin):
-            continue
-        dias_bloque = (fin - ini).days + 1 if m.dias is None else abs(int(m.dias))
-        bloques_p1.append(
-            {
-                "dias": dias_bloque,
-                "periodo": p1_db.periodo,
-                "inicio": ini,
-                "fin": fin,
-                "verbo": verbo_por_bloque(ini, fin, firma),
-            }
-        )
-    total_p1_bloques = sumar_dias(bloques_p1)
-
-    remanentes_p1_de_este_convenio = sum(
-        abs(m.dias or 0)
-        for m in conv.movimientos
-        if m.tipo == "CONVENIO" and m.id_periodo == p1_db.id
-    )
-    if remanentes_p1_de_este_convenio:
-        remanentes_p1 = remanentes_p1_de_este_convenio
-    else:
-        remanentes_p1 = int(p1_db.dias_pendientes or 0)
-        if remanentes_p1 == 0:
-            gozados_nc = sum(abs(m.dias or 0) for m in movs_p1_hist)
-            dias_periodo = int(p1_db.dias_periodo or 30)
-            remanentes_p1 = max(0, dias_periodo - gozados_nc)
-
-    dias_p2 = 30
-    total_acum = remanentes_p1 + dias_p2
-
-    ventana_p1_hasta = p1_db.fecha_fin.replace(year=p1_db.fecha_fin.year + 2)
-    ventana_p2_desde = p2_db.fecha_inicio.replace(year=p2_db.fecha_inicio.year + 1)
-    ventana_p2_hasta = p2_db.fecha_fin.replace(year=p2_db.fecha_fin.year + 1)
-
-    html = render_template(
-        "convenio_pdf.html",
-        empresa={
-            "razon_social": "CONTRANS S.A.C.",
-            "ruc": "20392952455",
-            "rep_nombre": "FRANCISCO JOSE GONZALEZ HURTADO",
-            "rep_dni": "40106879",
-            "direccion": "Avenida A N.° 204 – Ex Fundo Oquendo (Alt. Km 8.5 de Av. Néstor Gambetta – Callao)",
-            "lugar_firma": "Lima",
-        },
-        empleado=e,
-        p1={
-            "periodo": p1_db.periodo,
-            "inicio": p1_db.fecha_inicio,
-            "fin": p1_db.fecha_fin,
-            "bloques": bloques_p1,
-            "total": total_p1_bloques,
-        },
-        p2={
-            "periodo": p2_db.periodo,
-            "inicio": p2_db.fecha_inicio,
-            "fin": p2_db.fecha_fin,
-            "remanentes_p1": remanentes_p1,
-            "dias_p2": dias_p2,
-            "total": total_acum,
-            "ventana_p1_hasta": ventana_p1_hasta,
-            "ventana_p2_desde": ventana_p2_desde,
-            "ventana_p2_hasta": ventana_p2_hasta,
-        },
-        firma={"fecha": firma, "fecha_larga": fecha_firma_literal(firma)},
+    try:
+        html = _html_convenio(conv, firma, fecha_firma_literal(firma))
+    except ValueError as ex:
+        abort(400, description=str(ex))
+    if vista:
+        return respuesta_vista_html(html, titulo=_nombre_pdf_convenio(conv, firma))
+
+    pdf = pdf_cache.get_or_render(
+        html,
+        FORMATO_CONVENIO_ACUMULACION,
+        lambda: render_pdf(html),
     )
 
-    pdf = HTML(string=html, base_url=request.host_url).write_pdf()
-
-    def _sanitize(s: str) -> str:
-        s = re.sub(r"\s+", "_", (s or "").strip())
-        return re.sub(r"[^A-Za-z0-9_\-]", "", s)
-
-    safe_nombre = _sanitize(e.nombre or "Empleado")
-    filename = f"{firma.isoformat()}_CONVENIO_ACUMULACIÓN_{safe_nombre}_{conv.id}.pdf"
-
     response = send_file(
         BytesIO(pdf),
         as_attachment=True,
-        download_name=filename,
+        download_name=_nombre_pdf_convenio(conv, firma),
         mimetype="application/pdf",
     )
     response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
@@ -990,6 +1005,79 @@ def descargar_convenio_pdf(convenio_id):
     return response
 
 
+#!###########################DESCARGA EN LOTE##################################
+
+
+def ids_convenios_lote(args) -> list:
+    """
+    IDs de los convenios de acumulación que cumplan los filtros de ``args``
+    (request.args o MultiDict de una tarea):
+    - estado_firma: Pendiente / Firmado / ...
+    - desde, hasta: rango sobre fecha_firma (AAAA-MM-DD, inclusivo)
+    - dni: uno o varios (repetido o separado por comas)
+    Los convenios de adelanto se excluyen (su PDF depende del formulario).
+    """
+    q = Convenio.query.join(Empleado, Convenio.id_empleado == Empleado.id).filter(
+        db.or_(
+            Convenio.descripcion.is_(None),
+            ~Convenio.descripcion.ilike("%adelanto%"),
+        )
+    )
+    estado = (args.get("estado_firma") or "").strip()
+    if estado:
+        q = q.filter(Convenio.estado_firma == estado)
+    desde = fecha_arg("desde", args)
+    hasta = fecha_arg("hasta", args)
+    if desde:
+        q = q.filter(Convenio.fecha_firma >= desde)
+    if hasta:
+        q = q.filter(Convenio.fecha_firma <= hasta)
+    dnis = lista_arg("dni", args)
+    if dnis:
+        q = q.filter(Empleado.dni.in_(dnis))
+    return [cid for (cid,) in q.with_entities(Convenio.id).order_by(Convenio.id).all()]
+
+
+def documentos_convenios_lote(ids):
+    """DocumentoLote por convenio (se consultan de a uno mientras avanza el ZIP)."""
+    for cid in ids:
+        conv = db.session.get(Convenio, cid)
+        firma = conv.fecha_firma or date.today()
+        nombre = _nombre_pdf_convenio(conv, firma)
+        try:
+            html = _html_convenio(conv, firma, fecha_firma_literal(firma))
+        except ValueError as ex:
+            yield DocumentoLote(nombre, error=ex)
+            continue
+        yield DocumentoLote(nombre, html=html, version=FORMATO_CONVENIO_ACUMULACION)
+
+
+@convenios_bp.get("/pdf/lote", endpoint="convenios_pdf_lote")
+@login_required
+def convenios_pdf_lote():
+    """
+    ZIP con los convenios de acumulación filtrados (ver ``ids_convenios_lote``).
+    Con ?async=1 se encola como tarea y se responde 202 con la URL de estado.
+    """
+    if request.args.get("async"):
+        return encolar_desde_request("pdf_lote_convenios")
+    try:
+        ids = ids_convenios_lote(request.args)
+    except ValueError as ex:
+        abort(400, description=str(ex))
+    if not ids:
+        abort(404, description="No hay convenios para los filtros indicados.")
+
+    nombre_zip = f"convenios_{date.today().isoformat()}.zip"
+    return Response(
+        stream_with_context(
+            zip_en_stream(pdfs_en_paralelo(documentos_convenios_lote(ids)))
+        ),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{nombre_zip}"'},
+    )
+
+
 ############################SELECTOR##################################
 
 
@@ -1115,24 +1203,12 @@ def adelanto_registrar(empleado_id):
 @convenios_bp.post("/adelanto/<int:empleado_id>/pdf", endpoint="adelanto_pdf")
 @login_required
 def adelanto_pdf(empleado_id):
-    from weasyprint import HTML
     from io import BytesIO
-    from flask import current_app
-    import os, base64, re
     from datetime import date
     from sqlalchemy import func  # para el fallback a la última fecha en DB
 
     emp = Empleado.query.get_or_404(empleado_id)
 
-    # Convierte archivo estático a data URI (para que WeasyPrint lo embeba)
-    def data_uri_static(rel_path, mime="image/png"):
-        abs_path = os.path.join(
-            current_app.root_path, "static", rel_path.replace("/", os.sep)
-        )
-        with open(abs_path, "rb") as f:
-            b64 = base64.b64encode(f.read()).decode("ascii")
-        return f"data:{mime};base64,{b64}"
-
     # Periodo actual (para el texto del cuerpo)
     per = (
         PeriodoVacacional.query.filter(PeriodoVacacional.id_empleado == empleado_id)
@@ -1198,27 +1274,30 @@ def adelanto_pdf(empleado_id):
         # Si no recibiste literal, el backend lo genera con tu helper
         "fecha_firma_literal": fecha_firma_literal_str or fecha_firma_literal(firma_dt),
         "periodo_vacacional": periodo_vacacional,
-        "firma_francisco_url": data_uri_static("imagenes/firma_de_francisco.png"),
+        # data URI cacheado por proceso (documentos.assets)
+        "firma_francisco_url": pdf_asset("imagenes/firma_de_francisco.png"),
     }
 
     # Render del HTML y generación del PDF
     html = render_template("convenios/adelanto_pdf.html", **ctx)
-    pdf_bytes = HTML(string=html, base_url=request.url_root).write_pdf()
+    if pide_vista_html():
+        return respuesta_vista_html(html, titulo=f"Adelanto de vacaciones · {emp.nombre}")
+    pdf_bytes = pdf_cache.get_or_render(
+        html,
+        FORMATO_CONVENIO_ADELANTO,
+        lambda: render_pdf(html),
+    )
 
     # ====== Nombre del archivo usando PRIORIDAD de fecha ======
     # 1) ISO del form; 2) literal del form normalizado; 3) ISO de firma_dt (DB/fallback)
-    def sanitize(s: str) -> str:
-        s = re.sub(r"\s+", "_", s.strip())
-        return re.sub(r"[^A-Za-z0-9_\-]", "", s)
-
     if fecha_firma_iso_str:
-        fecha_base = sanitize(fecha_firma_iso_str)
+        fecha_base = _sanitize(fecha_firma_iso_str)
     elif fecha_firma_literal_str:
-        fecha_base = sanitize(
+        fecha_base = _sanitize(
             fecha_firma_literal_str.replace(" del ", " ").replace(" de ", " ")
         )
     else:
-        fecha_base = sanitize(firma_dt.isoformat())
+        fecha_base = _sanitize(firma_dt.isoformat())
 
     fname = f"{fecha_base}_CONVENIO_ADELANTO_{emp.nombre.replace(' ', '_')}.pdf"
     # =========================================================
@@ -0,0 +1,16 @@
+# documentos/__init__.py
+"""Utilidades compartidas para la generación de PDFs (convenios y préstamos)."""
+from .fetcher import BASE_DIR, BASE_URL, local_url_fetcher  # noqa: F401
+from .cache import pdf_cache  # noqa: F401
+from .assets import assets_pdf, pdf_asset  # noqa: F401
+from .storage import DocumentStore, LocalDocumentStore, document_store  # noqa: F401
+from .render import precalentar, precalentar_en_segundo_plano  # noqa: F401
+from .vista import pide_vista_html, respuesta_vista_html  # noqa: F401
+from .salida import SalidaEnStream  # noqa: F401
+from .pool import (  # noqa: F401
+    RenderError,
+    RenderSaturado,
+    RenderTimeout,
+    pdf_pool,
+    render_pdf,
+)
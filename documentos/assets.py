@@ -0,0 +1,107 @@
+# documentos/assets.py
+"""
+Imágenes embebidas en los PDFs como data URI, preparadas una vez por proceso.
+
+Las plantillas de PDF (encabezados, logo, firma) usan siempre los mismos
+archivos de ``static/``. En vez de leerlos y pasarlos a base64 en cada
+render, ``pdf_asset`` los guarda en memoria y solo los vuelve a procesar si
+cambia el mtime del archivo. Si se indica el ancho impreso (``ancho_mm``),
+la imagen se reduce a la resolución de impresión (PDF_ASSETS_DPI, default
+150; 0 = sin reducir) cuando es más grande que eso.
+
+Uso en plantillas (global Jinja registrado en la app)::
+
+    <img src="{{ pdf_asset('imagenes/Encabezado2.png', ancho_mm=190) }}">
+"""
+import base64
+import io
+import logging
+import mimetypes
+import os
+import threading
+from typing import Optional
+
+from .fetcher import STATIC_DIR, _dentro_de
+
+log = logging.getLogger(__name__)
+
+try:  # Pillow llega con WeasyPrint; sin él solo se omite la reducción
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+
+def _dpi_impresion() -> int:
+    try:
+        return max(0, int(os.getenv("PDF_ASSETS_DPI", 150)))
+    except ValueError:
+        return 150
+
+
+def _reducir(data: bytes, ancho_px: int) -> Optional[bytes]:
+    """PNG reducido a ``ancho_px`` (None si no hace falta o no conviene)."""
+    if Image is None:
+        return None
+    with Image.open(io.BytesIO(data)) as im:
+        if im.width <= ancho_px:
+            return None
+        alto_px = max(1, round(im.height * ancho_px / im.width))
+        im = im.resize((ancho_px, alto_px), Image.LANCZOS)
+        out = io.BytesIO()
+        im.save(out, format="PNG", optimize=True)
+    reducido = out.getvalue()
+    return reducido if len(reducido) < len(data) else None
+
+
+class AssetRegistry:
+    """(ruta relativa a static, ancho_mm) -> data URI, invalidado por mtime."""
+
+    def __init__(self, base_dir: str = STATIC_DIR):
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+        self._cache = {}  # (ruta, ancho_mm) -> (mtime, data_uri)
+
+    def _ruta_absoluta(self, ruta: str) -> str:
+        path = os.path.join(self.base_dir, *ruta.strip("/").split("/"))
+        if not _dentro_de(path, self.base_dir):
+            raise ValueError(f"Asset fuera de static: {ruta}")
+        return path
+
+    def data_uri(self, ruta: str, ancho_mm: Optional[float] = None) -> str:
+        path = self._ruta_absoluta(ruta)
+        mtime = os.path.getmtime(path)
+        key = (ruta, ancho_mm)
+        with self._lock:
+            hit = self._cache.get(key)
+        if hit and hit[0] == mtime:
+            return hit[1]
+
+        with open(path, "rb") as f:
+            data = f.read()
+        mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        dpi = _dpi_impresion()
+        if ancho_mm and dpi and mime.startswith("image/"):
+            try:
+                reducido = _reducir(data, max(1, round(ancho_mm / 25.4 * dpi)))
+            except Exception:
+                log.warning("No se pudo reducir %s; se embebe el original", ruta)
+                reducido = None
+            if reducido is not None:
+                data, mime = reducido, "image/png"
+
+        uri = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        with self._lock:
+            self._cache[key] = (mtime, uri)
+        return uri
+
+    def limpiar(self):
+        with self._lock:
+            self._cache.clear()
+
+
+assets_pdf = AssetRegistry()
+
+
+def pdf_asset(ruta: str, ancho_mm: Optional[float] = None) -> str:
+    """Data URI de ``static/<ruta>`` listo para <img src> en un PDF."""
+    return assets_pdf.data_uri(ruta, ancho_mm=ancho_mm)
@@ -0,0 +1,162 @@
+# documentos/cache.py
+"""
+Caché de PDFs direccionada por contenido.
+
+La clave es el SHA-256 del HTML final más la versión del formato, así que
+dos clics sobre el mismo documento (mismo HTML byte a byte) devuelven el PDF
+ya generado sin volver a pasar por WeasyPrint. El almacén vive en disco, con
+tamaño máximo y expulsión LRU; los contadores de aciertos/fallos se exponen
+con ``stats()``.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import weasyprint
+
+from .fetcher import BASE_DIR
+
+
+def _env_int(nombre: str, default: int) -> int:
+    try:
+        return int(os.getenv(nombre, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class PdfCache:
+    def __init__(self, carpeta: Optional[str] = None, max_bytes: Optional[int] = None):
+        # Si no se pasan, se leen del entorno al primer uso (después de load_dotenv)
+        self.carpeta = carpeta
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # clave -> bytes
+        self._total = 0
+        self._lock = threading.Lock()
+        self._cargado = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ---------- claves ----------
+    @staticmethod
+    def clave(html: str, version: str) -> str:
+        """SHA-256 de (motor + versión de formato + HTML)."""
+        h = hashlib.sha256()
+        h.update(f"weasyprint {weasyprint.__version__}|{version}".encode("utf-8"))
+        h.update(b"\0")
+        h.update(html.encode("utf-8"))
+        return h.hexdigest()
+
+    # ---------- almacenamiento ----------
+    def _cargar(self):
+        if self._cargado:
+            return
+        if self.carpeta is None:
+            self.carpeta = os.getenv(
+                "PDF_CACHE_DIR", os.path.join(BASE_DIR, "storage", "cache", "pdf")
+            )
+        if self.max_bytes is None:
+            self.max_bytes = _env_int("PDF_CACHE_MAX_MB", 256) * 1024 * 1024
+        os.makedirs(self.carpeta, exist_ok=True)
+
+        # Reconstruye el índice LRU desde disco (más antiguo primero)
+        entradas = []
+        for nombre in os.listdir(self.carpeta):
+            if not nombre.endswith(".pdf"):
+                continue
+            st = os.stat(os.path.join(self.carpeta, nombre))
+            entradas.append((st.st_mtime, nombre[:-4], st.st_size))
+        for _, key, size in sorted(entradas):
+            self._index[key] = size
+            self._total += size
+        self._cargado = True
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.carpeta, f"{key}.pdf")
+
+    def get(self, key: str) -> Optional[bytes]:
+        # Bajo el candado solo el índice; la lectura del disco va fuera para que
+        # los aciertos de distintos hilos no se atiendan de uno en uno
+        with self._lock:
+            self._cargar()
+            if key in self._index:
+                self._index.move_to_end(key)
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            # Puede haberla expulsado otro hilo o worker
+            with self._lock:
+                size = self._index.pop(key, None)
+                if size is not None:
+                    self._total -= size
+                self.misses += 1
+            return None
+        try:
+            os.utime(path)  # refresca el orden LRU para otros procesos
+        except OSError:
+            pass
+        with self._lock:
+            if key not in self._index:  # escrita por otro proceso
+                self._index[key] = len(data)
+                self._total += len(data)
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._cargar()
+            if len(data) > self.max_bytes:
+                return
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self._total -= old
+            self._index[key] = len(data)
+            self._total += len(data)
+            self._expulsar()
+
+    def _expulsar(self):
+        while self._total > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get_or_render(self, html: str, version: str, render: Callable[[], bytes]) -> bytes:
+        """Devuelve el PDF cacheado para ``html`` o lo genera con ``render()``."""
+        key = self.clave(html, version)
+        pdf = self.get(key)
+        if pdf is None:
+            pdf = render()
+            self.put(key, pdf)
+        return pdf
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "entradas": len(self._index),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# Instancia por proceso
+pdf_cache = PdfCache()
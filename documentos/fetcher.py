@@ -0,0 +1,113 @@
+# documentos/fetcher.py
+"""
+Resolución local de recursos para WeasyPrint.
+
+WeasyPrint pide cada <img>, hoja de estilos o fuente a un ``url_fetcher``.
+El fetcher por defecto hace HTTP contra ``base_url`` (nuestro propio
+gunicorn), lo que ocupa hilos del servidor y puede bloquearse bajo carga.
+Aquí servimos ``/static`` y los recursos de plantillas directamente desde
+disco (con caché en memoria) y rechazamos cualquier otra petición saliente.
+"""
+import mimetypes
+import os
+import threading
+from urllib.parse import unquote, urlsplit
+from urllib.request import url2pathname
+
+from weasyprint import default_url_fetcher
+
+# Raíz del proyecto: ancla de las carpetas de storage/ (documentos, caché,
+# tareas, exports) sin depender del directorio de trabajo
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+
+# base_url sintética: las rutas relativas se resuelven contra ella y el
+# fetcher la traduce a disco, así nunca sale una petición a la red.
+BASE_URL = "http://pdf.local/"
+
+# Prefijo de URL -> carpeta en disco
+RUTAS_LOCALES = {
+    "/static/": STATIC_DIR,
+}
+
+# Fuentes para PDFs: primero las que se distribuyen con la app, luego las del sistema
+FUENTES_DIRS = [
+    os.path.join(STATIC_DIR, "fonts"),
+    os.getenv("PDF_FONTS_DIR", "/usr/share/fonts"),
+]
+
+# Carpetas desde las que se aceptan URLs file://
+CARPETAS_PERMITIDAS = [
+    STATIC_DIR,
+    os.path.join(BASE_DIR, "templates"),
+    os.path.join(BASE_DIR, "prestamos", "templates"),
+    *FUENTES_DIRS,
+]
+
+# path -> (mtime, bytes, mime)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class RecursoNoPermitido(ValueError):
+    """La URL no apunta a un recurso local permitido."""
+
+
+def _dentro_de(path: str, carpeta: str) -> bool:
+    path = os.path.realpath(path)
+    carpeta = os.path.realpath(carpeta)
+    try:
+        return os.path.commonpath([path, carpeta]) == carpeta
+    except ValueError:  # distintas unidades en Windows
+        return False
+
+
+def _leer(path: str):
+    """Lee un archivo con caché en memoria invalidada por mtime."""
+    mtime = os.path.getmtime(path)
+    with _cache_lock:
+        hit = _cache.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1], hit[2]
+    with open(path, "rb") as f:
+        data = f.read()
+    mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    with _cache_lock:
+        _cache[path] = (mtime, data, mime)
+    return data, mime
+
+
+def _respuesta(path: str, url: str) -> dict:
+    data, mime = _leer(path)
+    return {
+        "string": data,
+        "mime_type": mime,
+        "filename": os.path.basename(path),
+        # Mantiene la URL original para resolver rutas relativas (p. ej. CSS -> fuentes)
+        "redirected_url": url,
+    }
+
+
+def local_url_fetcher(url: str, timeout=10, ssl_context=None) -> dict:
+    """``url_fetcher`` para WeasyPrint que solo sirve recursos locales."""
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+
+    if scheme == "data":
+        return default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+
+    if scheme == "file":
+        path = url2pathname(unquote(parts.path))
+        if os.path.isfile(path) and any(_dentro_de(path, c) for c in CARPETAS_PERMITIDAS):
+            return _respuesta(path, url)
+
+    elif scheme in ("http", "https"):
+        ruta = unquote(parts.path)
+        for prefijo, carpeta in RUTAS_LOCALES.items():
+            if not ruta.startswith(prefijo):
+                continue
+            path = os.path.join(carpeta, *ruta[len(prefijo):].split("/"))
+            if _dentro_de(path, carpeta) and os.path.isfile(path):
+                return _respuesta(path, url)
+
+    raise RecursoNoPermitido(f"Recurso no permitido en PDF: {url}")
@@ -0,0 +1,155 @@
+# documentos/lote.py
+"""
+Generación de PDFs en lote y empaquetado ZIP en streaming.
+
+Los documentos se renderizan en paralelo en el pool de procesos (manteniendo
+una ventana de trabajos en vuelo) y se van escribiendo a un ZIP que se emite
+por trozos, sin armar el archivo completo en memoria.
+
+Una vez empezado el stream ya no se puede responder un error: si el pool está
+saturado por otras peticiones se espera con backoff hasta LOTE_ESPERA_MAX
+segundos (default 120) y, si no hay cupo, el documento va a ERRORES.txt.
+"""
+import os
+import time
+import zipfile
+from collections import deque
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+from flask import request
+
+from .cache import pdf_cache
+from .pool import RenderSaturado, pdf_pool
+from .salida import SalidaEnStream
+
+
+def lista_arg(nombre: str, args=None) -> list:
+    """Filtro de lote con varios valores: admite ?dni=1&dni=2 y ?dni=1,2"""
+    args = request.args if args is None else args
+    valores = []
+    for raw in args.getlist(nombre):
+        valores.extend(v.strip() for v in raw.split(",") if v.strip())
+    return valores
+
+
+def fecha_arg(nombre: str, args=None):
+    """Filtro de lote con fecha AAAA-MM-DD; None si no viene, ValueError si es inválida."""
+    args = request.args if args is None else args
+    raw = (args.get(nombre) or "").strip()
+    if not raw:
+        return None
+    try:
+        return datetime.strptime(raw, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError(f"{nombre} inválida (use AAAA-MM-DD)")
+
+
+class DocumentoLote:
+    """
+    Un documento del lote: PDF ya disponible (``pdf``), HTML a renderizar o
+    un ``error`` detectado al preparar su contexto (se reporta en el ZIP).
+    """
+
+    __slots__ = ("nombre", "html", "css", "version", "pdf", "error")
+
+    def __init__(self, nombre: str, html: Optional[str] = None, css=(),
+                 version: Optional[str] = None, pdf: Optional[bytes] = None,
+                 error: Optional[Exception] = None):
+        self.nombre = nombre
+        self.html = html
+        self.css = tuple(css)
+        self.version = version
+        self.pdf = pdf
+        self.error = error
+
+
+Resultado = Tuple[str, Union[bytes, Exception]]
+
+ESPERA_MAX = float(os.getenv("LOTE_ESPERA_MAX", "120"))
+
+
+def pdfs_en_paralelo(docs: Iterable[DocumentoLote], ventana: Optional[int] = None) -> Iterator[Resultado]:
+    """
+    Devuelve ``(nombre, pdf | excepción)`` en el mismo orden de ``docs``.
+
+    Usa ``pdf_cache`` cuando hay ``version`` y mantiene como máximo
+    ``ventana`` renders en vuelo en el pool.
+    """
+    ventana = ventana or max(2, 2 * (pdf_pool.workers if pdf_pool.activo else 1))
+    en_vuelo = deque()  # (doc, clave_cache, Future | None, resultado)
+
+    def _terminar(item) -> Resultado:
+        doc, clave, fut, res = item
+        if fut is not None:
+            try:
+                res = pdf_pool.resultado(fut)
+                if clave:
+                    pdf_cache.put(clave, res)
+            except Exception as e:  # se informa en el ZIP, no corta el stream
+                res = e
+        return doc.nombre, res
+
+    for doc in docs:
+        clave = fut = res = None
+        if doc.error is not None:
+            res = doc.error
+        elif doc.pdf is not None:
+            res = doc.pdf
+        else:
+            if doc.version:
+                clave = pdf_cache.clave(doc.html, doc.version)
+                res = pdf_cache.get(clave)
+            if res is None:
+                limite, pausa = time.monotonic() + ESPERA_MAX, 0.25
+                while True:
+                    try:
+                        fut = pdf_pool.submit(doc.html, doc.css)
+                        break
+                    except RenderSaturado as e:
+                        if en_vuelo:
+                            # liberar un cupo propio antes de reintentar
+                            yield _terminar(en_vuelo.popleft())
+                        elif time.monotonic() >= limite:
+                            res = e
+                            break
+                        else:
+                            # cupos ocupados por otras peticiones: esperar
+                            time.sleep(pausa)
+                            pausa = min(pausa * 2, 5.0)
+                    except Exception as e:  # p. ej. pool reiniciado: al ZIP, no corta el stream
+                        res = e
+                        break
+        en_vuelo.append((doc, clave, fut, res))
+        while len(en_vuelo) >= ventana:
+            yield _terminar(en_vuelo.popleft())
+
+    while en_vuelo:
+        yield _terminar(en_vuelo.popleft())
+
+
+def zip_en_stream(resultados: Iterable[Resultado]) -> Iterator[bytes]:
+    """
+    Empaqueta ``(nombre, pdf | excepción)`` en un ZIP emitido por trozos.
+    Los fallos se listan en ``ERRORES.txt`` al final del archivo.
+    """
+    salida = SalidaEnStream()
+    errores = []
+    usados = set()
+    # Los PDF ya vienen comprimidos: ZIP_STORED evita gastar CPU en deflate
+    with zipfile.ZipFile(salida, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for nombre, res in resultados:
+            if isinstance(res, Exception):
+                errores.append(f"{nombre}: {str(res) or type(res).__name__}")
+                continue
+            base, ext = (nombre.rsplit(".", 1) + ["pdf"])[:2]
+            final, n = nombre, 1
+            while final in usados:
+                n += 1
+                final = f"{base}_{n}.{ext}"
+            usados.add(final)
+            zf.writestr(final, res)
+            yield salida.vaciar()
+        if errores:
+            zf.writestr("ERRORES.txt", "\n".join(errores) + "\n")
+    yield salida.vaciar()
@@ -0,0 +1,264 @@
+# documentos/pool.py
+"""
+Pool de procesos para renderizar PDFs fuera del hilo de la petición.
+
+WeasyPrint es CPU puro; si corre en los hilos de gunicorn, unos cuantos
+renders simultáneos bloquean endpoints baratos y se acercan al --timeout.
+Aquí los renders se envían a procesos aparte:
+
+- cola acotada: si hay demasiados trabajos en vuelo se responde 503 en lugar
+  de encolar sin límite;
+- timeout por trabajo, contado desde que el trabajo sale de la cola (no
+  mientras espera detrás de otros): al vencer, el executor sale de servicio
+  (los trabajos nuevos van a uno nuevo) pero los demás trabajos que ya tenía
+  en vuelo terminan en él, hasta PDF_POOL_TIMEOUT más; recién entonces se
+  matan sus procesos (matar uno solo rompería el executor entero y con él
+  los renders de otras peticiones);
+- aislamiento de caídas: si un proceso muere, el pool se reconstruye y la
+  petición recibe un error en vez de tumbar el worker web;
+- arranque perezoso: los procesos se levantan con el primer render, no en
+  ``create_app`` (los comandos ``flask ...`` no los crean);
+- reciclado: cada proceso se reemplaza tras N trabajos (fugas de memoria de
+  Pango/cairo).
+
+Configuración (entorno):
+    PDF_POOL_WORKERS   procesos (0 = render en el propio hilo), default nº CPUs
+    PDF_POOL_PENDIENTES trabajos en vuelo máximos, default 4 × procesos
+    PDF_POOL_TIMEOUT   segundos por trabajo, default 60
+    PDF_POOL_MAX_TAREAS trabajos por proceso antes de reciclarlo, default 200
+"""
+import logging
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures import wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Optional, Set
+
+from . import render as _render
+
+log = logging.getLogger(__name__)
+
+
+class RenderError(RuntimeError):
+    """Fallo al generar un PDF en el pool."""
+
+    status_code = 500
+
+
+class RenderSaturado(RenderError):
+    """La cola de renders está llena."""
+
+    status_code = 503
+
+
+class RenderTimeout(RenderError):
+    """El render superó el tiempo máximo."""
+
+    status_code = 504
+
+
+def _env_int(nombre: str, default: int) -> int:
+    try:
+        return int(os.getenv(nombre, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _inicializar_proceso(css, avisos):
+    # Avisa su pid (para poder matarlo al reciclar el executor) y deja listo
+    # su contexto (fuentes + CSS conocidos)
+    avisos.put(os.getpid())
+    _render.precalentar(css=css)
+
+
+class PdfPool:
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._cupos: Optional[threading.BoundedSemaphore] = None
+        self.workers = None
+        self.timeout = None
+        self.max_tareas = None
+        self.css_precalentar = ()
+        # Estado por executor; los retirados siguen aquí hasta reciclarse
+        self._en_vuelo: Dict[ProcessPoolExecutor, Set[Future]] = {}
+        self._pids: Dict[ProcessPoolExecutor, Set[int]] = {}
+        self._avisos: Dict[ProcessPoolExecutor, object] = {}  # SimpleQueue con los pids
+        self._retirados: Set[ProcessPoolExecutor] = set()
+        self._origen = weakref.WeakKeyDictionary()  # Future -> executor
+
+    def _configurar(self):
+        if self.workers is not None:
+            return
+        self.workers = max(0, _env_int("PDF_POOL_WORKERS", os.cpu_count() or 1))
+        self.timeout = _env_int("PDF_POOL_TIMEOUT", 60)
+        self.max_tareas = _env_int("PDF_POOL_MAX_TAREAS", 200) or None
+        pendientes = _env_int("PDF_POOL_PENDIENTES", 4 * max(1, self.workers))
+        self._cupos = threading.BoundedSemaphore(max(1, pendientes))
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: no hereda el estado de Flask/SQLAlchemy/cairo del worker web
+                ctx = multiprocessing.get_context("spawn")
+                avisos = ctx.SimpleQueue()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=ctx,
+                    initializer=_inicializar_proceso,
+                    initargs=(tuple(self.css_precalentar), avisos),
+                    max_tasks_per_child=self.max_tareas,
+                )
+                self._en_vuelo[self._executor] = set()
+                self._pids[self._executor] = set()
+                self._avisos[self._executor] = avisos
+                for _ in range(self.workers):
+                    # Trabajos vacíos: levantan (y precalientan) todos los procesos ya
+                    self._executor.submit(len, "")
+            return self._executor
+
+    def _leer_pids(self, executor: ProcessPoolExecutor) -> Set[int]:
+        """Pids avisados por los procesos de ``executor`` (llamar con el lock)."""
+        pids = self._pids.get(executor, set())
+        avisos = self._avisos.get(executor)
+        if avisos is not None:
+            # Se vacía seguido: con el reciclado por N trabajos llegan pids
+            # nuevos y un pipe lleno bloquearía el arranque de los procesos
+            while not avisos.empty():
+                pids.add(avisos.get())
+            if len(pids) > 4 * max(1, self.workers):
+                pids &= {p.pid for p in multiprocessing.active_children()}
+        return pids
+
+    def _terminado(self, executor: ProcessPoolExecutor, fut: Future):
+        with self._lock:
+            self._en_vuelo.get(executor, set()).discard(fut)
+            self._leer_pids(executor)
+        self._cupos.release()
+
+    def _retirar(self, executor: ProcessPoolExecutor, lento: Future):
+        """
+        Saca de servicio el executor de un trabajo vencido sin cortar los
+        demás: esperan hasta ``timeout`` en un hilo aparte y luego se recicla.
+        """
+        with self._lock:
+            if executor in self._retirados or executor not in self._en_vuelo:
+                return
+            self._retirados.add(executor)
+            if self._executor is executor:
+                self._executor = None
+            otros = [f for f in self._en_vuelo[executor] if f is not lento]
+
+        def _drenar():
+            wait(otros, timeout=self.timeout)
+            self._reciclar(executor)
+
+        threading.Thread(target=_drenar, name="pdf-pool-drenar", daemon=True).start()
+
+    def _reciclar(self, executor: ProcessPoolExecutor):
+        """Descarta el executor (si sigue siendo el actual) y mata sus procesos."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+            pids = set(self._leer_pids(executor))
+            avisos = self._avisos.pop(executor, None)
+            self._en_vuelo.pop(executor, None)
+            self._pids.pop(executor, None)
+            self._retirados.discard(executor)
+        executor.shutdown(wait=False, cancel_futures=True)
+        for proc in multiprocessing.active_children():
+            if proc.pid in pids:
+                try:
+                    proc.kill()
+                except Exception:
+                    pass
+        if avisos is not None:
+            avisos.close()
+
+    @property
+    def activo(self) -> bool:
+        self._configurar()
+        return self.workers > 0
+
+    def iniciar(self, css: Iterable[str] = ()):
+        """
+        Arranque del worker web: registra el CSS a precalentar. Los procesos
+        se levantan con el primer ``submit``; sin pool, se precalienta aquí.
+        """
+        self.css_precalentar = tuple(css)
+        if not self.activo:
+            _render.precalentar_en_segundo_plano(css=self.css_precalentar)
+
+    def submit(self, html: str, css: Iterable[str] = ()) -> Future:
+        """Encola un render y devuelve el Future (bytes del PDF)."""
+        if not self.activo:
+            fut = Future()
+            try:
+                fut.set_result(_render.render_pdf(html, css=tuple(css)))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        if not self._cupos.acquire(timeout=1):
+            raise RenderSaturado("Demasiados PDFs en proceso, reintente en unos segundos.")
+        try:
+            executor = self._get_executor()
+            fut = executor.submit(_render.render_pdf, html, tuple(css))
+        except BrokenProcessPool:
+            self._cupos.release()
+            self._reciclar(executor)
+            raise RenderError("El pool de PDFs se reinició, reintente.")
+        except Exception:
+            self._cupos.release()
+            raise
+        with self._lock:
+            self._origen[fut] = executor
+            self._en_vuelo.setdefault(executor, set()).add(fut)
+        fut.add_done_callback(lambda f: self._terminado(executor, f))
+        return fut
+
+    def resultado(self, fut: Future, timeout: Optional[float] = None) -> bytes:
+        """
+        Espera un Future de ``submit`` aplicando timeout y aislamiento. El
+        timeout corre desde que el trabajo pasa a ejecutarse: la espera en la
+        cola (acotada por PDF_POOL_PENDIENTES) no cuenta.
+        """
+        executor = self._origen.get(fut)
+        try:
+            while not (fut.running() or fut.done()):
+                wait((fut,), timeout=0.05)
+            return fut.result(timeout=timeout or self.timeout)
+        except FuturesTimeout:
+            log.error("Render PDF excedió %ss; retirando su executor", timeout or self.timeout)
+            if executor is not None:
+                self._retirar(executor, fut)
+            raise RenderTimeout("La generación del PDF tardó demasiado.")
+        except CancelledError:
+            raise RenderError("El render del PDF se canceló, reintente.")
+        except BrokenProcessPool:
+            log.error("Un proceso del pool de PDFs terminó abruptamente; reciclando")
+            if executor is not None:
+                self._reciclar(executor)
+            raise RenderError("Falló el proceso de render del PDF.")
+
+    def render(self, html: str, css: Iterable[str] = (), timeout: Optional[float] = None) -> bytes:
+        if not self.activo:
+            return _render.render_pdf(html, css=tuple(css))
+        return self.resultado(self.submit(html, css), timeout=timeout)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+pdf_pool = PdfPool()
+
+
+def render_pdf(html: str, css: Iterable[str] = (), timeout: Optional[float] = None) -> bytes:
+    """HTML -> PDF en el pool de procesos (o en línea si PDF_POOL_WORKERS=0)."""
+    return pdf_pool.render(html, css=css, timeout=timeout)
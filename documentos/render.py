@@ -0,0 +1,180 @@
+# documentos/render.py
+"""
+Contexto de render WeasyPrint reutilizable por proceso.
+
+Crear un ``FontConfiguration`` y parsear hojas de estilo cuesta más que
+maquetar los documentos cortos que generamos. Aquí se mantiene una pequeña
+reserva de contextos (fuentes registradas + CSS ya parseado) que se prestan
+de forma exclusiva a cada render: así se reutilizan entre peticiones sin
+compartir el mismo objeto entre hilos a la vez.
+
+Las fuentes que nombran las plantillas (Inter, Calibri, Arial/Helvetica,
+Courier New, DejaVu Sans) se registran con @font-face apuntando a archivos
+locales, de modo que fontconfig no tiene que resolver familias inexistentes
+en cada documento. Se buscan primero en ``static/fonts`` y luego en
+``/usr/share/fonts`` (ver paquetes de fuentes en el Dockerfile).
+"""
+import hashlib
+import logging
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Iterable
+
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from .fetcher import BASE_URL, FUENTES_DIRS, local_url_fetcher
+
+log = logging.getLogger(__name__)
+
+# familia CSS -> [(archivo, font-weight, font-style)]; se usa el primero que exista
+FUENTES_PDF = {
+    "Inter": [
+        ("Inter-Regular.otf", 400, "normal"),
+        ("Inter-Regular.ttf", 400, "normal"),
+        ("Inter-Bold.otf", 700, "normal"),
+        ("Inter-Bold.ttf", 700, "normal"),
+    ],
+    "Calibri": [
+        ("Carlito-Regular.ttf", 400, "normal"),
+        ("Carlito-Bold.ttf", 700, "normal"),
+        ("Carlito-Italic.ttf", 400, "italic"),
+    ],
+    "Arial": [
+        ("LiberationSans-Regular.ttf", 400, "normal"),
+        ("LiberationSans-Bold.ttf", 700, "normal"),
+        ("LiberationSans-Italic.ttf", 400, "italic"),
+    ],
+    "Helvetica": [
+        ("LiberationSans-Regular.ttf", 400, "normal"),
+        ("LiberationSans-Bold.ttf", 700, "normal"),
+        ("LiberationSans-Italic.ttf", 400, "italic"),
+    ],
+    "Courier New": [
+        ("LiberationMono-Regular.ttf", 400, "normal"),
+        ("LiberationMono-Bold.ttf", 700, "normal"),
+    ],
+    "DejaVu Sans": [
+        ("DejaVuSans.ttf", 400, "normal"),
+        ("DejaVuSans-Bold.ttf", 700, "normal"),
+    ],
+}
+
+_archivos_fuente = None  # nombre de archivo -> ruta absoluta
+_archivos_lock = threading.Lock()
+
+
+def _indexar_fuentes() -> dict:
+    """Recorre las carpetas de fuentes una sola vez por proceso."""
+    global _archivos_fuente
+    with _archivos_lock:
+        if _archivos_fuente is None:
+            buscados = {a for caras in FUENTES_PDF.values() for a, _, _ in caras}
+            encontrados = {}
+            for carpeta in FUENTES_DIRS:
+                for raiz, _, archivos in os.walk(carpeta):
+                    for nombre in archivos:
+                        if nombre in buscados and nombre not in encontrados:
+                            encontrados[nombre] = os.path.join(raiz, nombre)
+            _archivos_fuente = encontrados
+    return _archivos_fuente
+
+
+def css_fuentes() -> str:
+    """Reglas @font-face para las familias de FUENTES_PDF presentes en disco."""
+    archivos = _indexar_fuentes()
+    reglas = []
+    for familia, caras in FUENTES_PDF.items():
+        vistas = set()
+        for archivo, peso, estilo in caras:
+            ruta = archivos.get(archivo)
+            if not ruta or (peso, estilo) in vistas:
+                continue
+            vistas.add((peso, estilo))
+            reglas.append(
+                "@font-face { font-family: '%s'; src: url('file://%s');"
+                " font-weight: %d; font-style: %s; }"
+                % (familia, ruta.replace(os.sep, "/"), peso, estilo)
+            )
+    return "\n".join(reglas)
+
+
+class ContextoRender:
+    """FontConfiguration + hojas de estilo parseadas, para un hilo a la vez."""
+
+    def __init__(self):
+        self.font_config = FontConfiguration()
+        self._css = {}  # sha1(css) -> CSS
+        self.fuentes = CSS(
+            string=css_fuentes() or "/* sin fuentes locales */",
+            base_url=BASE_URL,
+            url_fetcher=local_url_fetcher,
+            font_config=self.font_config,
+        )
+
+    def css(self, texto: str) -> CSS:
+        key = hashlib.sha1(texto.encode("utf-8")).hexdigest()
+        hoja = self._css.get(key)
+        if hoja is None:
+            hoja = CSS(
+                string=texto,
+                base_url=BASE_URL,
+                url_fetcher=local_url_fetcher,
+                font_config=self.font_config,
+            )
+            self._css[key] = hoja
+        return hoja
+
+
+_libres: "queue.LifoQueue[ContextoRender]" = queue.LifoQueue()
+
+
+@contextmanager
+def contexto():
+    """Presta un ContextoRender libre (o crea uno) durante el bloque."""
+    try:
+        ctx = _libres.get_nowait()
+    except queue.Empty:
+        ctx = ContextoRender()
+    try:
+        yield ctx
+    finally:
+        _libres.put(ctx)
+
+
+def render_pdf(html: str, css: Iterable[str] = (), base_url: str = BASE_URL) -> bytes:
+    """HTML -> PDF reutilizando fuentes y CSS ya preparados."""
+    with contexto() as ctx:
+        hojas = [ctx.fuentes] + [ctx.css(c) for c in css]
+        return HTML(
+            string=html, base_url=base_url, url_fetcher=local_url_fetcher
+        ).write_pdf(stylesheets=hojas, font_config=ctx.font_config)
+
+
+_HTML_PRECALENTADO = """<!doctype html><html><body>
+<p style="font-family: Inter">Inter <b>negrita</b></p>
+<p style="font-family: Calibri">Calibri <b>negrita</b></p>
+<p style="font-family: Helvetica, Arial">Helvetica <b>negrita</b></p>
+<p style="font-family: 'Courier New', monospace">Courier <b>negrita</b></p>
+<p style="font-family: 'DejaVu Sans'">DejaVu <b>negrita</b> ÁÉÍÓÚ ñ °</p>
+<img src="/static/imagenes/Logo_contrans.png" style="width: 10mm">
+</body></html>"""
+
+
+def precalentar(css: Iterable[str] = ()):
+    """Render de arranque: carga fuentes, parsea ``css`` y deja el contexto listo."""
+    try:
+        render_pdf(_HTML_PRECALENTADO, css=tuple(css))
+    except Exception:
+        log.exception("Falló el precalentamiento de WeasyPrint")
+
+
+def precalentar_en_segundo_plano(css: Iterable[str] = ()):
+    """Igual que ``precalentar`` pero sin bloquear el arranque del worker."""
+    t = threading.Thread(
+        target=precalentar, args=(tuple(css),), name="pdf-precalentar", daemon=True
+    )
+    t.start()
+    return t
@@ -0,0 +1,34 @@
+# documentos/salida.py
+"""Destino de bytes para escritores que emiten por trozos (ZIP, Parquet, Arrow)."""
+
+
+class SalidaEnStream:
+    """
+    Archivo de solo escritura y no posicionable (ZipFile, pyarrow): acumula
+    lo escrito hasta ``vaciar()``, que lo devuelve para emitirlo.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._partes = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self._partes.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self) -> bytes:
+        data = b"".join(self._partes)
+        self._partes.clear()
+        return data
@@ -0,0 +1,194 @@
+# documentos/storage.py
+"""
+Almacén de documentos direccionado por contenido.
+
+Cada archivo se guarda bajo el SHA-256 de sus bytes; el mismo contenido se
+guarda una sola vez aunque lo referencien varias filas. ``DocumentStore``
+define la interfaz y ``LocalDocumentStore`` la implementa en disco con
+carpetas repartidas por prefijo del hash (``ab/cd/abcd....pdf``) y escrituras
+atómicas (archivo temporal + rename). Otro backend (p. ej. un sustituto local
+compatible con S3) solo tiene que implementar ``put``/``get``/``existe``/
+``borrar``/``claves`` y registrarse en ``BACKENDS``.
+
+Configuración (entorno):
+    DOCUMENT_STORE      backend a usar, default "local"
+    DOCUMENT_STORE_DIR  raíz del backend local, default storage/documentos
+"""
+import hashlib
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+from .fetcher import BASE_DIR
+
+log = logging.getLogger(__name__)
+
+
+def clave_contenido(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class DocumentStore(ABC):
+    """Interfaz del almacén. Las claves son el SHA-256 hex del contenido."""
+
+    def __init__(self):
+        # clave -> bytes aún no persistidos (ver put_diferido)
+        self._pendientes: Dict[str, bytes] = {}
+        self._pendientes_lock = threading.Lock()
+        self._escritor = None
+
+    # ---- a implementar por cada backend ----
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        ...
+
+    @abstractmethod
+    def get(self, clave: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def existe(self, clave: str) -> bool:
+        ...
+
+    @abstractmethod
+    def borrar(self, clave: str) -> None:
+        ...
+
+    @abstractmethod
+    def claves(self) -> Iterator[Tuple[str, float]]:
+        """(clave, mtime) de todo lo almacenado (para el GC)."""
+
+    # ---- escritura fuera del camino de la petición ----
+    def put_diferido(self, data: bytes) -> str:
+        """Devuelve la clave ya; la escritura ocurre en un hilo aparte."""
+        clave = clave_contenido(data)
+        with self._pendientes_lock:
+            self._pendientes[clave] = data
+            if self._escritor is None:
+                self._escritor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="doc-escritor"
+                )
+        self._escritor.submit(self._persistir, clave, data)
+        return clave
+
+    def _persistir(self, clave: str, data: bytes):
+        try:
+            self.put(data)
+        except Exception:
+            log.exception("No se pudo guardar el documento %s", clave)
+        finally:
+            with self._pendientes_lock:
+                self._pendientes.pop(clave, None)
+
+    def pendiente(self, clave: str) -> bool:
+        with self._pendientes_lock:
+            return clave in self._pendientes
+
+    def leer(self, clave: str) -> Optional[bytes]:
+        """Como ``get`` pero también ve lo que aún está en cola de escritura."""
+        with self._pendientes_lock:
+            data = self._pendientes.get(clave)
+        return data if data is not None else self.get(clave)
+
+    def disponible(self, clave: str) -> bool:
+        return self.pendiente(clave) or self.existe(clave)
+
+
+class LocalDocumentStore(DocumentStore):
+    def __init__(self, raiz: Optional[str] = None, extension: str = ".pdf"):
+        super().__init__()
+        self.raiz = raiz or os.getenv(
+            "DOCUMENT_STORE_DIR", os.path.join(BASE_DIR, "storage", "documentos")
+        )
+        self.extension = extension
+
+    def ruta(self, clave: str) -> str:
+        if len(clave) != 64 or not all(ch in "0123456789abcdef" for ch in clave):
+            raise ValueError(f"Clave de documento inválida: {clave!r}")
+        return os.path.join(self.raiz, clave[:2], clave[2:4], clave + self.extension)
+
+    def put(self, data: bytes) -> str:
+        clave = clave_contenido(data)
+        path = self.ruta(clave)
+        if os.path.exists(path):
+            return clave
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return clave
+
+    def get(self, clave: str) -> Optional[bytes]:
+        try:
+            with open(self.ruta(clave), "rb") as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def existe(self, clave: str) -> bool:
+        try:
+            return os.path.isfile(self.ruta(clave))
+        except ValueError:
+            return False
+
+    def borrar(self, clave: str) -> None:
+        try:
+            os.remove(self.ruta(clave))
+        except FileNotFoundError:
+            pass
+
+    def claves(self) -> Iterator[Tuple[str, float]]:
+        for raiz, _, archivos in os.walk(self.raiz):
+            for nombre in archivos:
+                if not nombre.endswith(self.extension):
+                    continue  # .tmp a medio escribir, etc.
+                clave = nombre[: -len(self.extension)]
+                if len(clave) != 64:
+                    continue
+                try:
+                    yield clave, os.path.getmtime(os.path.join(raiz, nombre))
+                except OSError:
+                    continue
+
+
+# nombre -> clase; DOCUMENT_STORE elige cuál se instancia
+BACKENDS = {
+    "local": LocalDocumentStore,
+}
+
+
+def crear_store(nombre: Optional[str] = None) -> DocumentStore:
+    nombre = (nombre or os.getenv("DOCUMENT_STORE", "local")).strip().lower()
+    try:
+        return BACKENDS[nombre]()
+    except KeyError:
+        raise ValueError(f"DOCUMENT_STORE desconocido: {nombre}")
+
+
+class _StorePerezoso:
+    """Instancia el backend al primer uso (cuando ya se cargó el .env)."""
+
+    def __init__(self):
+        self._store = None
+        self._lock = threading.Lock()
+
+    def _get(self) -> DocumentStore:
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = crear_store()
+        return self._store
+
+    def __getattr__(self, nombre):
+        return getattr(self._get(), nombre)
+
+
+document_store = _StorePerezoso()
@@ -0,0 +1,75 @@
+# documentos/vista.py
+"""
+Vista previa HTML de los documentos PDF.
+
+Con ``?vista=html`` (o el campo ``vista=html`` en un formulario) las rutas de
+PDF devuelven el mismo HTML que se mandaría a WeasyPrint, con las hojas de
+estilo del PDF incrustadas y unas reglas de pantalla que simulan la hoja A4.
+Sirve para revisar redacción y fechas sin pasar por el motor de PDF; no
+guarda nada ni registra documentos.
+"""
+from typing import Iterable
+
+from flask import request
+from markupsafe import escape
+
+_CSS_PANTALLA = """
+@media screen {
+  html { background: #e6e6e6; }
+  body {
+    box-sizing: border-box;
+    width: 210mm;
+    min-height: 297mm;
+    margin: 10mm auto;
+    padding: 16mm 18mm;
+    background: #fff;
+    box-shadow: 0 2px 12px rgba(0, 0, 0, .25);
+  }
+  .vista-previa-aviso {
+    position: sticky; top: 0; z-index: 10;
+    margin: -16mm -18mm 8mm; padding: 6px 12px;
+    background: #fff3cd; color: #664d03; border-bottom: 1px solid #ffe69c;
+    font: 12px/1.4 Arial, sans-serif; text-align: center;
+  }
+}
+@media print { .vista-previa-aviso { display: none; } }
+"""
+
+
+def pide_vista_html() -> bool:
+    return (request.values.get("vista") or "").strip().lower() == "html"
+
+
+def html_vista_previa(html: str, css: Iterable[str] = (), titulo: str = "") -> str:
+    """Incrusta ``css`` + estilos de pantalla y un aviso de vista previa."""
+    estilos = "".join(f"<style>{c}</style>" for c in css)
+    estilos += f"<style>{_CSS_PANTALLA}</style>"
+    aviso = (
+        '<div class="vista-previa-aviso">Vista previa'
+        + (f" — {escape(titulo)}" if titulo else "")
+        + " · no es el documento final</div>"
+    )
+
+    bajo = html.lower()
+    i = bajo.find("</head>")
+    html = html[:i] + estilos + html[i:] if i >= 0 else estilos + html
+    bajo = html.lower()
+    i = bajo.find("<body")
+    if i >= 0:
+        fin = bajo.find(">", i) + 1
+        html = html[:fin] + aviso + html[fin:]
+    else:
+        html = aviso + html
+    return html
+
+
+def respuesta_vista_html(html: str, css: Iterable[str] = (), titulo: str = ""):
+    """Respuesta text/html sin caché con la vista previa del documento."""
+    return (
+        html_vista_previa(html, css=css, titulo=titulo),
+        200,
+        {
+            "Content-Type": "text/html; charset=utf-8",
+            "Cache-Control": "no-store",
+        },
+    )
@@ -0,0 +1,45 @@
+# migraciones/__init__.py
+"""Migraciones versionadas del esquema y chequeo de planes de consultas calientes."""
+import click
+from flask.cli import with_appcontext
+
+from .motor import MIGRACIONES, aplicar, estado, migracion, preparar_base, ultima_version  # noqa: F401
+from . import versiones  # noqa: E402,F401  (registra las migraciones)
+from .planes import consultas_calientes, verificar_planes  # noqa: F401
+
+
+@click.group("migraciones")
+def migraciones_cli():
+    """Esquema de la base: estado, aplicar migraciones, chequear planes."""
+
+
+@migraciones_cli.command("estado")
+@with_appcontext
+def _estado():
+    e = estado()
+    click.echo(f"Versión aplicada: {e['version']} (última: {ultima_version()})")
+    for m in e["pendientes"]:
+        click.echo(f"  pendiente {m['version']}: {m['descripcion']}")
+
+
+@migraciones_cli.command("aplicar")
+@click.option("--solo-marcar", is_flag=True, help="Registrar como aplicadas sin ejecutarlas.")
+@with_appcontext
+def _aplicar(solo_marcar):
+    hechas = aplicar(solo_marcar=solo_marcar)
+    click.echo(f"Aplicadas: {', '.join(map(str, hechas))}" if hechas else "Sin migraciones pendientes.")
+
+
+@migraciones_cli.command("planes")
+@click.option("-v", "--detalle", is_flag=True, help="Mostrar el plan completo de cada consulta.")
+@with_appcontext
+def _planes(detalle):
+    """Falla (código 1) si alguna consulta caliente recorre una tabla completa."""
+    resultados = verificar_planes()
+    for r in resultados:
+        click.echo(f"{'OK   ' if r['ok'] else 'SCAN '} {r['consulta']}" + ("" if r["ok"] else f"  ({'; '.join(r['scans'])})"))
+        if detalle:
+            for linea in r["plan"]:
+                click.echo(f"        {linea}")
+    if not all(r["ok"] for r in resultados):
+        raise SystemExit(1)
@@ -0,0 +1,168 @@
+# migraciones/motor.py
+"""
+Migraciones versionadas del esquema.
+
+``db.create_all()`` crea las tablas que faltan pero nunca toca las que ya
+existen. Los cambios a tablas existentes (índices, columnas) se registran
+aquí como funciones numeradas::
+
+    @migracion(3, "descripción")
+    def _m3(conn):
+        ...
+
+Cada migración queda congelada: escribe sus índices, columnas y SQL de
+relleno tal como eran al publicarla, sin leer los modelos ni llamar código
+de la app que pueda cambiar después (si cambiaran, una base vieja recibiría
+otra cosa que la que la migración aplicó en su momento).
+
+La versión aplicada se guarda en ``schema_version`` (una fila por migración).
+Cada migración corre en su propia transacción junto con su fila, tomando un
+candado para que varios workers arrancando a la vez no la apliquen dos veces
+(``pg_advisory_xact_lock`` en PostgreSQL; en SQLite, el candado de escritura
+de la base). Deben ser idempotentes: una base creada desde cero por
+``create_all`` ya trae lo que declaran los modelos y solo se marca.
+
+Configuración (entorno):
+    MIGRACIONES_AUTO   0 = no aplicar al arrancar (usar ``flask migraciones aplicar``)
+"""
+from __future__ import annotations
+
+import logging
+import os
+from datetime import datetime
+from typing import Callable, Dict, NamedTuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+from models import db, Empleado
+
+log = logging.getLogger(__name__)
+
+CANDADO_PG = 0x5CE3A  # llave de pg_advisory_xact_lock para las migraciones
+
+_meta = MetaData()
+schema_version = Table(
+    "schema_version",
+    _meta,
+    Column("version", Integer, primary_key=True),
+    Column("descripcion", String(200), nullable=False),
+    Column("aplicada_en", DateTime, nullable=False),
+)
+
+
+class Migracion(NamedTuple):
+    version: int
+    descripcion: str
+    fn: Callable
+
+
+MIGRACIONES: Dict[int, Migracion] = {}
+
+
+def migracion(version: int, descripcion: str):
+    """Decorador: registra ``fn(conn)`` como la migración ``version``."""
+
+    def _registrar(fn):
+        if version in MIGRACIONES:
+            raise ValueError(f"Migración {version} duplicada")
+        MIGRACIONES[version] = Migracion(version, descripcion, fn)
+        return fn
+
+    return _registrar
+
+
+def ultima_version() -> int:
+    return max(MIGRACIONES, default=0)
+
+
+def _aplicadas(conn) -> set:
+    return set(conn.execute(select(schema_version.c.version)).scalars())
+
+
+def _bloquear(conn):
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": CANDADO_PG})
+    else:
+        # Escritura sin efecto: toma el candado de escritura hasta el commit
+        conn.execute(schema_version.delete().where(schema_version.c.version < 0))
+
+
+def _marcar(conn, m: Migracion):
+    conn.execute(
+        schema_version.insert().values(
+            version=m.version, descripcion=m.descripcion, aplicada_en=datetime.utcnow()
+        )
+    )
+
+
+def estado() -> dict:
+    """Versión aplicada y migraciones pendientes."""
+    schema_version.create(db.engine, checkfirst=True)
+    with db.engine.connect() as conn:
+        aplicadas = _aplicadas(conn)
+    return {
+        "version": max(aplicadas, default=0),
+        "pendientes": [
+            {"version": m.version, "descripcion": m.descripcion}
+            for v, m in sorted(MIGRACIONES.items())
+            if v not in aplicadas
+        ],
+    }
+
+
+def aplicar(solo_marcar: bool = False) -> list:
+    """
+    Aplica (o, con ``solo_marcar``, registra sin ejecutar) las migraciones
+    pendientes en orden. Devuelve las versiones aplicadas en esta llamada.
+    """
+    schema_version.create(db.engine, checkfirst=True)
+    hechas = []
+    for v, m in sorted(MIGRACIONES.items()):
+        with db.engine.begin() as conn:
+            _bloquear(conn)
+            if v in _aplicadas(conn):  # otro worker pudo aplicarla mientras esperábamos
+                continue
+            if not solo_marcar:
+                log.info("Aplicando migración %s: %s", v, m.descripcion)
+                m.fn(conn)
+            _marcar(conn, m)
+        hechas.append(v)
+    return hechas
+
+
+def preparar_base():
+    """
+    Al arrancar: ``create_all`` y migraciones. Una base nueva (sin tablas)
+    sale completa de ``create_all`` y solo se marca en la última versión.
+    """
+    nueva = not inspect(db.engine).has_table(Empleado.__tablename__)
+    db.create_all()
+    if nueva:
+        aplicar(solo_marcar=True)
+    elif os.getenv("MIGRACIONES_AUTO", "1") != "0":
+        hechas = aplicar()
+        if hechas:
+            log.info("Migraciones aplicadas: %s", hechas)
+
+
+# ------------------------ Utilidades para migraciones ------------------------
+
+def ejecutar(conn, *sentencias: str):
+    """Ejecuta SQL literal (válido en SQLite y PostgreSQL)."""
+    for sql in sentencias:
+        conn.execute(text(sql))
+
+
+def agregar_columna(conn, tabla: str, columna: Column) -> bool:
+    """
+    ``ALTER TABLE ... ADD COLUMN`` con la definición de ``columna`` (escrita
+    en la migración: tipo, NOT NULL, server_default), si la tabla aún no la
+    tiene.
+    """
+    if columna.name in {c["name"] for c in inspect(conn).get_columns(tabla)}:
+        return False
+    t = Table(tabla, MetaData(), columna)
+    spec = conn.dialect.ddl_compiler(conn.dialect, None).get_column_specification(columna)
+    conn.execute(text(f"ALTER TABLE {conn.dialect.identifier_preparer.format_table(t)} ADD COLUMN {spec}"))
+    return True
+
@@ -0,0 +1,98 @@
+# migraciones/planes.py
+"""
+Chequeo de planes de ejecución de las consultas calientes.
+
+Cada consulta de ``consultas_calientes()`` se pasa por ``EXPLAIN`` y falla si el plan
+recorre una tabla completa:
+
+- SQLite: ``EXPLAIN QUERY PLAN``; cualquier ``SCAN <tabla>`` (con o sin
+  índice, igual lee todo) en vez de ``SEARCH``.
+- PostgreSQL: ``EXPLAIN (FORMAT JSON)`` con ``enable_seqscan = off`` (en
+  tablas chicas el planificador prefiere Seq Scan aunque haya índice; así
+  solo queda si no hay índice utilizable); cualquier nodo ``Seq Scan``.
+
+Uso: ``flask migraciones planes`` (sale con código 1 si alguna falla).
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import List
+
+from sqlalchemy import select
+
+from models import db, Convenio, Empleado, MovimientoVacacional, PeriodoVacacional
+from prestamos.models import Cuota, Prestamo
+
+
+def consultas_calientes():
+    """nombre -> SELECT representativo (los valores dan igual: solo cuenta el plan)."""
+    return {
+        "empleado_por_dni": select(Empleado).where(Empleado.dni == "00000000"),
+        "periodos_de_empleado": select(PeriodoVacacional).where(PeriodoVacacional.id_empleado == 1),
+        "convenios_de_empleado": select(Convenio).where(Convenio.id_empleado == 1),
+        "movimientos_de_empleado": select(MovimientoVacacional).where(
+            MovimientoVacacional.id_empleado == 1
+        ),
+        "movimientos_de_periodo": select(MovimientoVacacional).where(
+            MovimientoVacacional.id_periodo == 1
+        ),
+        "movimientos_de_convenio": select(MovimientoVacacional).where(
+            MovimientoVacacional.id_convenio == 1
+        ),
+        "prestamos_de_empleado": select(Prestamo).where(Prestamo.empleado_id == 1),
+        "prestamos_por_estado": select(Prestamo).where(Prestamo.estado == "Emitido"),
+        "cuotas_de_prestamo": select(Cuota).where(Cuota.prestamo_id == 1).order_by(Cuota.orden),
+        "cuotas_del_mes": select(Cuota).where(
+            Cuota.anio == 2025, Cuota.mes == 1, Cuota.estado == "Pendiente"
+        ),
+        "cuotas_pendientes_de_prestamo": select(Cuota).where(
+            Cuota.prestamo_id == 1, Cuota.estado == "Pendiente"
+        ),
+    }
+
+
+def _sql(conn, stmt) -> str:
+    return str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+
+
+def _plan_sqlite(conn, stmt):
+    filas = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + _sql(conn, stmt)).all()
+    detalle = [f[-1] for f in filas]
+    scans = [d for d in detalle if re.match(r"SCAN (?!CONSTANT ROW|SUBQUERY)", d)]
+    return detalle, scans
+
+
+def _nodos(plan):
+    yield plan
+    for hijo in plan.get("Plans", []):
+        yield from _nodos(hijo)
+
+
+def _plan_postgres(conn, stmt):
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    crudo = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + _sql(conn, stmt)).scalar()
+    plan = (json.loads(crudo) if isinstance(crudo, str) else crudo)[0]["Plan"]
+    nodos = list(_nodos(plan))
+    detalle = [f"{n['Node Type']} {n.get('Relation Name', '')} {n.get('Index Name', '')}".strip() for n in nodos]
+    scans = [f"Seq Scan {n.get('Relation Name')}" for n in nodos if n["Node Type"] == "Seq Scan"]
+    return detalle, scans
+
+
+def verificar_planes() -> List[dict]:
+    """``[{consulta, ok, plan, scans}]`` para cada consulta de ``consultas_calientes()``."""
+    resultados = []
+    with db.engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            explicar = _plan_postgres
+        elif conn.dialect.name == "sqlite":
+            explicar = _plan_sqlite
+        else:
+            raise RuntimeError(f"Chequeo de planes no soportado en {conn.dialect.name}")
+        try:
+            for nombre, stmt in consultas_calientes().items():
+                detalle, scans = explicar(conn, stmt)
+                resultados.append({"consulta": nombre, "ok": not scans, "plan": detalle, "scans": scans})
+        finally:
+            conn.rollback()
+    return resultados
@@ -0,0 +1,58 @@
+# migraciones/versiones.py
+"""
+Historial de migraciones. Se agregan al final con el número siguiente;
+nunca se edita ni renumera una ya publicada. Cada una escribe su SQL y sus
+columnas literalmente (no lee los modelos ni usa código de la app).
+"""
+from sqlalchemy import Column, DateTime, Integer, Numeric
+
+from .motor import agregar_columna, ejecutar, migracion
+
+
+@migracion(1, "Índices de claves foráneas y de cuotas (pendientes: índice parcial)")
+def _m1_indices(conn):
+    ejecutar(
+        conn,
+        "CREATE INDEX IF NOT EXISTS ix_movimiento_vacacional_id_convenio ON movimiento_vacacional (id_convenio)",
+        "CREATE INDEX IF NOT EXISTS ix_movimiento_vacacional_id_empleado ON movimiento_vacacional (id_empleado)",
+        "CREATE INDEX IF NOT EXISTS ix_movimiento_vacacional_id_periodo ON movimiento_vacacional (id_periodo)",
+        "CREATE INDEX IF NOT EXISTS ix_periodo_vacacional_id_empleado ON periodo_vacacional (id_empleado)",
+        "CREATE INDEX IF NOT EXISTS ix_convenio_id_empleado ON convenio (id_empleado)",
+        "CREATE INDEX IF NOT EXISTS ix_prestamos_empleado_id ON prestamos (empleado_id)",
+        "CREATE INDEX IF NOT EXISTS ix_prestamos_estado ON prestamos (estado)",
+        "CREATE INDEX IF NOT EXISTS ix_prestamo_cuotas_anio_mes_estado ON prestamo_cuotas (anio, mes, estado)",
+        "CREATE INDEX IF NOT EXISTS ix_prestamo_cuotas_orden ON prestamo_cuotas (orden)",
+        "CREATE INDEX IF NOT EXISTS ix_prestamo_cuotas_prestamo_id ON prestamo_cuotas (prestamo_id)",
+        "CREATE INDEX IF NOT EXISTS ix_prestamo_cuotas_pendientes ON prestamo_cuotas (prestamo_id, orden) "
+        "WHERE estado = 'Pendiente'",
+    )
+
+
+@migracion(2, "Saldo, cuotas pendientes y próxima cuota guardados en prestamos")
+def _m2_saldos(conn):
+    agregar_columna(conn, "prestamos", Column("saldo_pendiente", Numeric(10, 2), nullable=False, server_default="0"))
+    agregar_columna(conn, "prestamos", Column("cuotas_pendientes", Integer, nullable=False, server_default="0"))
+    agregar_columna(conn, "prestamos", Column("proxima_cuota", Integer))
+    ejecutar(
+        conn,
+        """
+        UPDATE prestamos SET
+            saldo_pendiente = (
+                SELECT ROUND(COALESCE(SUM(c.monto), 0), 2) FROM prestamo_cuotas c
+                WHERE c.prestamo_id = prestamos.id AND c.estado = 'Pendiente'
+            ),
+            cuotas_pendientes = (
+                SELECT COUNT(c.id) FROM prestamo_cuotas c
+                WHERE c.prestamo_id = prestamos.id AND c.estado = 'Pendiente'
+            ),
+            proxima_cuota = (
+                SELECT MIN(c.orden) FROM prestamo_cuotas c
+                WHERE c.prestamo_id = prestamos.id AND c.estado = 'Pendiente'
+            )
+        """,
+    )
+
+
+@migracion(3, "Latido de las tareas en curso")
+def _m3_latido_tareas(conn):
+    agregar_columna(conn, "tareas", Column("latido_en", DateTime))
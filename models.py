@@ -53,7 +53,7 @@ class Empleado(db.Model):
 class PeriodoVacacional(db.Model):
     __tablename__ = 'periodo_vacacional'
     id = db.Column(db.Integer, primary_key=True)
-    id_empleado = db.Column(db.Integer, db.ForeignKey('empleado.id'), nullable=False)
+    id_empleado = db.Column(db.Integer, db.ForeignKey('empleado.id'), nullable=False, index=True)
     periodo = db.Column(db.String(9), nullable=False)          # "2024-2025"
     dias_periodo = db.Column(db.Integer, nullable=False)       # normalmente 30
     fecha_inicio = db.Column(db.Date)
@@ -74,7 +74,7 @@ class PeriodoVacacional(db.Model):
 class Convenio(db.Model):
     __tablename__ = 'convenio'
     id = db.Column(db.Integer, primary_key=True)
-    id_empleado = db.Column(db.Integer, db.ForeignKey('empleado.id'), nullable=False)
+    id_empleado = db.Column(db.Integer, db.ForeignKey('empleado.id'), nullable=False, index=True)
 
     fecha_firma = db.Column(db.Date)
     fecha_solicitud = db.Column(db.Date)
@@ -97,8 +97,8 @@ class MovimientoVacacional(db.Model):
     __tablename__ = 'movimiento_vacacional'
     id = db.Column(db.Integer, primary_key=True)
 
-    id_empleado = db.Column(db.Integer, db.ForeignKey('empleado.id'), nullable=False)
-    id_periodo  = db.Column(db.Integer, db.ForeignKey('periodo_vacacional.id'), nullable=False)
+    id_empleado = db.Column(db.Integer, db.ForeignKey('empleado.id'), nullable=False, index=True)
+    id_periodo  = db.Column(db.Integer, db.ForeignKey('periodo_vacacional.id'), nullable=False, index=True)
 
     tipo  = db.Column(db.String(50), nullable=False)       # GOCE / AJUSTE / CONVENIO / etc.
     fecha = db.Column(db.Date, nullable=False)
@@ -110,7 +110,7 @@ class MovimientoVacacional(db.Model):
     fecha_fin    = db.Column(db.Date)
 
     # vínculo opcional al convenio que originó el movimiento
-    id_convenio = db.Column(db.Integer, db.ForeignKey('convenio.id'), nullable=True)
+    id_convenio = db.Column(db.Integer, db.ForeignKey('convenio.id'), nullable=True, index=True)
 
     empleado = db.relationship("Empleado", backref="movimientos")
     periodo_vacacional = db.relationship("PeriodoVacacional", back_populates="movimientos")
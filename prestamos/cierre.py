@@ -0,0 +1,136 @@
+# prestamos/cierre.py
+"""
+Cierre y apertura de mes (planilla) en SQL por conjuntos.
+
+Cada operación es un UPDATE sobre las cuotas del mes (``anio``/``mes``/
+``estado``, con el índice ``ix_prestamo_cuotas_anio_mes_estado``) que
+devuelve con RETURNING qué préstamos tocó, y un UPDATE por lote de esos
+préstamos que recalcula ``estado`` con un CASE sobre sus conteos. El saldo
+guardado lo mantiene prestamos/saldos.py en la misma transacción, antes del
+CASE, que lo usa.
+
+Todo corre en una transacción con un candado (``pg_advisory_xact_lock`` en
+PostgreSQL; en SQLite, el de escritura de la base): dos cierres simultáneos
+se ejecutan uno detrás del otro y el segundo ya no encuentra cuotas
+'Pendiente' que cerrar.
+"""
+from __future__ import annotations
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import case, delete, func, select, text, update
+
+from models import db, Empleado
+from .models import Prestamo, Cuota
+from .saldos import LOTE
+
+CANDADO_PG = 0x5CE3B  # llave de pg_advisory_xact_lock del cierre/apertura de mes
+
+
+def _bloquear(session):
+    conn = session.connection()
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": CANDADO_PG})
+    else:
+        # Escritura sin efecto: toma el candado de escritura hasta el commit
+        tabla = Cuota.__table__
+        conn.execute(delete(tabla).where(tabla.c.id < 0))
+
+
+def _cuotas_del_mes(anio: int, mes: int, estado: str, dni: str):
+    criterio = [Cuota.estado == estado, Cuota.anio == anio, Cuota.mes == mes]
+    if dni:
+        criterio.append(
+            Cuota.prestamo_id.in_(
+                select(Prestamo.id)
+                .join(Empleado, Prestamo.empleado_id == Empleado.id)
+                .where(Empleado.dni == dni)
+            )
+        )
+    return criterio
+
+
+def _recalcular_estados(session, ids, con_emitido: bool) -> Counter:
+    """
+    ``estado`` de los préstamos ``ids`` según sus cuotas pendientes:
+    'Cancelado' si no queda ninguna, 'Emitido' (solo con ``con_emitido``) si
+    siguen todas, si no 'Amortizado Parcial'. Devuelve el conteo por estado.
+    """
+    total = (
+        select(func.count(Cuota.id)).where(Cuota.prestamo_id == Prestamo.id).scalar_subquery()
+    )
+    ramas = [(Prestamo.cuotas_pendientes == 0, "Cancelado")]
+    if con_emitido:
+        ramas.append((Prestamo.cuotas_pendientes == total, "Emitido"))
+    nuevo = case(*ramas, else_="Amortizado Parcial")
+
+    ids = sorted(ids)
+    conteo = Counter()
+    for i in range(0, len(ids), LOTE):
+        conteo.update(
+            session.execute(
+                update(Prestamo)
+                .where(Prestamo.id.in_(ids[i : i + LOTE]))
+                .values(estado=nuevo)
+                .returning(Prestamo.estado)
+            ).scalars()
+        )
+    return conteo
+
+
+def cerrar_mes(anio: int, mes: int, fecha_descuento: date, dni: str = "") -> dict:
+    """
+    Pasa a 'Descontada' (con ``fecha_descuento_real``) las cuotas
+    'Pendiente' del mes, opcionalmente de un solo DNI, y recalcula el estado
+    de los préstamos afectados. Hace commit.
+    """
+    session = db.session
+    try:
+        _bloquear(session)
+        filas = session.execute(
+            update(Cuota)
+            .where(*_cuotas_del_mes(anio, mes, "Pendiente", dni))
+            .values(estado="Descontada", fecha_descuento_real=fecha_descuento)
+            .returning(Cuota.prestamo_id, Cuota.monto)
+        ).all()
+        total = sum((Decimal(m) for _pid, m in filas), Decimal("0.00"))
+        estados = _recalcular_estados(session, {pid for pid, _m in filas}, con_emitido=False)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return {
+        "ok": True,
+        "cerradas": len(filas),
+        "monto": float(total.quantize(Decimal("0.01"))),
+        "prestamos_cancelados": estados["Cancelado"],
+        "prestamos_parciales": estados["Amortizado Parcial"],
+    }
+
+
+def aperturar_mes(anio: int, mes: int, dni: str = "", limpiar_fecha: bool = True) -> dict:
+    """
+    Devuelve a 'Pendiente' las cuotas 'Descontada' del mes (las que cerró la
+    planilla), opcionalmente de un solo DNI, y recalcula el estado de los
+    préstamos afectados. Hace commit.
+    """
+    session = db.session
+    valores = {"estado": "Pendiente"}
+    if limpiar_fecha:
+        valores["fecha_descuento_real"] = None
+    try:
+        _bloquear(session)
+        pids = session.execute(
+            update(Cuota)
+            .where(*_cuotas_del_mes(anio, mes, "Descontada", dni))
+            .values(**valores)
+            .returning(Cuota.prestamo_id)
+        ).scalars().all()
+        if pids:
+            _recalcular_estados(session, set(pids), con_emitido=True)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return {"ok": True, "reabiertas": len(pids), "prestamos_afectados": len(set(pids))}
@@ -0,0 +1,115 @@
+# prestamos/consultas.py
+"""
+Consultas de reporte sobre préstamos.
+
+Los agregados por préstamo se calculan en SQL con una subconsulta agrupada
+que se une a ``Prestamo``, en vez de recorrer ``p.amortizaciones`` o
+``p.cuotas`` (una consulta lazy por préstamo y sumas en float). Los montos
+salen como ``Decimal`` (columnas Numeric). El saldo, en cambio, se guarda en
+``Prestamo`` (prestamos/saldos.py) y se lee directo de la fila.
+"""
+from sqlalchemy import func, literal
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import joinedload
+
+from models import db, Empleado
+from .models import Prestamo, Amortizacion, Cuota
+
+SEPARADOR_OBS = "; "
+
+
+def _concatenar(col, orden, sep: str):
+    """string_agg (PostgreSQL, ordenado) / group_concat (SQLite, MySQL)."""
+    if db.session.get_bind().dialect.name == "postgresql":
+        # string_agg(col, sep ORDER BY orden)
+        return func.string_agg(col, aggregate_order_by(literal(sep), orden))
+    return func.aggregate_strings(col, sep)
+
+
+def subconsulta_amortizaciones():
+    """
+    Una fila por préstamo con amortizaciones: ``prestamo_id``, ``total``,
+    ``ultima_fecha`` y ``observaciones`` (no vacías, unidas con '; ').
+    """
+    return (
+        db.session.query(
+            Amortizacion.prestamo_id.label("prestamo_id"),
+            func.sum(Amortizacion.monto).label("total"),
+            func.max(Amortizacion.fecha).label("ultima_fecha"),
+            _concatenar(
+                func.nullif(Amortizacion.observacion, ""), Amortizacion.id, SEPARADOR_OBS
+            ).label("observaciones"),
+        )
+        .group_by(Amortizacion.prestamo_id)
+        .subquery("amortizaciones")
+    )
+
+
+def prestamos_con_amortizaciones():
+    """
+    Query de (Prestamo, Empleado, total, ultima_fecha, observaciones); los
+    préstamos sin amortizaciones traen None en las tres últimas.
+    """
+    am = subconsulta_amortizaciones()
+    return (
+        db.session.query(
+            Prestamo, Empleado, am.c.total, am.c.ultima_fecha, am.c.observaciones
+        )
+        .join(Empleado, Prestamo.empleado_id == Empleado.id)
+        .outerjoin(am, am.c.prestamo_id == Prestamo.id)
+    )
+
+
+def subconsulta_saldos(prestamo_ids=None):
+    """
+    Una fila por préstamo con cuotas pendientes: ``prestamo_id``, ``saldo``
+    (suma de las pendientes), ``pendientes`` y ``proxima_orden`` (la menor
+    ``orden`` pendiente). ``prestamo_ids`` (lista o SELECT de ids) acota el
+    agrupamiento a esos préstamos; usa el índice parcial de pendientes.
+    Es la referencia contra la que se reconcilian las columnas guardadas.
+    """
+    q = (
+        db.session.query(
+            Cuota.prestamo_id.label("prestamo_id"),
+            func.sum(Cuota.monto).label("saldo"),
+            func.count(Cuota.id).label("pendientes"),
+            func.min(Cuota.orden).label("proxima_orden"),
+        )
+        .filter(Cuota.estado == "Pendiente")
+        .group_by(Cuota.prestamo_id)
+    )
+    if prestamo_ids is not None:
+        q = q.filter(Cuota.prestamo_id.in_(prestamo_ids))
+    return q.subquery("saldos")
+
+
+def saldo_prestamo(prestamo_id: int):
+    """
+    (Prestamo, Empleado, saldo, cuotas_pendientes, proxima) o None si no
+    existe; lee las columnas guardadas (prestamos/saldos.py).
+    """
+    fila = (
+        db.session.query(Prestamo, Empleado)
+        .join(Empleado, Prestamo.empleado_id == Empleado.id)
+        .options(joinedload(Prestamo.proxima))
+        .filter(Prestamo.id == prestamo_id)
+        .one_or_none()
+    )
+    if fila is None:
+        return None
+    p, e = fila
+    return p, e, p.saldo_pendiente, p.cuotas_pendientes, p.proxima
+
+
+def cuota_json(c) -> dict | None:
+    """Resumen de la próxima cuota para las APIs (monto como número JSON)."""
+    if c is None:
+        return None
+    return {
+        "orden": c.orden,
+        "etiqueta": c.etiqueta,
+        "anio": c.anio,
+        "mes": c.mes,
+        "es_grati": bool(c.es_grati),
+        "monto": float(c.monto),
+    }
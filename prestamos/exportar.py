@@ -0,0 +1,653 @@
+# prestamos/exportar.py
+"""
+Exportación de préstamos a Excel (hoja Prestamos con el cronograma en
+columnas por mes + Reporte_Pivot). Se usa desde la ruta /prestamos/export-excel
+y desde la tarea en segundo plano ``export_excel``.
+
+Cada exportación escribe en su propio destino (ruta o archivo en memoria,
+ver ``excel_prestamos_temporal``); ``guardar_snapshot`` deja opcionalmente
+una copia con fecha en <EXPORT_EXCEL_DIR>/snapshots (EXPORT_EXCEL_DIR,
+default storage/exports del proyecto).
+
+Caché por versión de datos (``abrir_excel_prestamos``; EXPORT_EXCEL_CACHE=0
+la desactiva): el último libro generado queda en
+<EXPORT_EXCEL_DIR>/cache/Prestamos_v<version>_<desde>-<hasta>.xlsx y se
+sirve mientras no cambien ``version_datos`` ni la ventana del Reporte_Pivot
+(que depende del mes en curso). Con EXPORT_EXCEL_PRECALCULAR=1, tras cada commit
+que cambie la versión se regenera en segundo plano (agrupando los cambios de
+EXPORT_EXCEL_PRECALCULAR_ESPERA segundos, default 30).
+
+Por defecto el libro se escribe en streaming (openpyxl write-only): las
+filas salen de cursores del servidor ordenados por préstamo (los totales de
+amortización vienen agregados en la misma consulta) y cada celda se
+escribe ya con su formato, así que la memoria no crece con préstamos x meses.
+PRESTAMOS_EXCEL_STREAMING=0 vuelve a la versión con DataFrames de pandas.
+"""
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date as _date, datetime
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+import pandas as pd
+from pandas import ExcelWriter
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import column_index_from_string, get_column_letter
+from sqlalchemy import case, func
+
+from documentos import BASE_DIR
+from models import db, Empleado
+from .consultas import prestamos_con_amortizaciones
+from .version import al_cambiar, version_actual
+from .models import Prestamo, Cuota
+from .services import (
+    columna_cronograma,
+    nombre_empleado,
+    orden_columna_cronograma,
+    pivot_cronograma,
+)
+
+FORMATO_MONTO = "#,##0.00"
+FORMATO_FECHA = "YYYY-MM-DD"
+LOTE_FILAS = 2000  # filas por ida al cursor del servidor
+CARPETA_EXPORTS = os.getenv("EXPORT_EXCEL_DIR", os.path.join(BASE_DIR, "storage", "exports"))
+CARPETA_SNAPSHOTS = os.path.join(CARPETA_EXPORTS, "snapshots")
+CARPETA_CACHE = os.path.join(CARPETA_EXPORTS, "cache")
+
+log = logging.getLogger(__name__)
+
+_delgada = Side(style="thin")
+_FUENTE_ENCABEZADO = Font(bold=True)
+_BORDE_ENCABEZADO = Border(left=_delgada, right=_delgada, top=_delgada, bottom=_delgada)
+_ALINEACION_ENCABEZADO = Alignment(horizontal="center", vertical="top")
+
+
+def generar_excel_prestamos(out_path, streaming=None):
+    """
+    Escribe el Excel de préstamos en ``out_path`` (ruta o archivo binario
+    abierto) y lo devuelve.
+    """
+    if streaming is None:
+        streaming = os.getenv("PRESTAMOS_EXCEL_STREAMING", "1") != "0"
+    if streaming:
+        return _generar_excel_streaming(out_path)
+    return _generar_excel_pandas(out_path)
+
+
+def excel_prestamos_temporal():
+    """
+    Excel de préstamos en un archivo temporal propio de quien lo pide
+    (en memoria hasta EXPORT_EXCEL_MEMORIA_MB, default 32; luego a disco),
+    posicionado al inicio. Se borra al cerrarlo.
+    """
+    try:
+        max_mb = int(os.getenv("EXPORT_EXCEL_MEMORIA_MB", 32))
+    except ValueError:
+        max_mb = 32
+    f = tempfile.SpooledTemporaryFile(max_size=max_mb * 2**20, suffix=".xlsx")
+    try:
+        generar_excel_prestamos(f)
+    except Exception:
+        f.close()
+        raise
+    f.seek(0)
+    return f
+
+
+def guardar_snapshot(f, prefijo: str = "Prestamos") -> str:
+    """
+    Copia el contenido de ``f`` a storage/exports/snapshots/<prefijo>_<fecha>.xlsx
+    (escritura atómica) y devuelve la ruta; ``f`` queda al inicio.
+    """
+    os.makedirs(CARPETA_SNAPSHOTS, exist_ok=True)
+    ruta = os.path.join(CARPETA_SNAPSHOTS, f"{prefijo}_{datetime.now():%Y%m%d-%H%M%S-%f}.xlsx")
+    tmp = ruta + ".tmp"
+    f.seek(0)
+    with open(tmp, "wb") as out:
+        shutil.copyfileobj(f, out)
+    os.replace(tmp, ruta)
+    f.seek(0)
+    return ruta
+
+
+# ------------------ Caché por versión de datos ------------------
+
+_cache_lock = threading.Lock()
+_NOMBRE_CACHE = re.compile(r"^Prestamos_v\d+(_[\w-]+)?\.xlsx$")
+
+
+def _mes_abs(m: int) -> str:
+    return f"{m // 12}{m % 12 + 1:02d}"
+
+
+def _clave_cache(version: int) -> str:
+    """'v<version>_<desde>-<hasta>' (AAAAMM de la ventana del pivot; 'todo' sin límite)."""
+    ventana = _ventana_pivot()
+    rango = f"{_mes_abs(ventana[0])}-{_mes_abs(ventana[1])}" if ventana else "todo"
+    return f"v{version}_{rango}"
+
+
+def _ruta_cache(clave: str) -> str:
+    return os.path.join(CARPETA_CACHE, f"Prestamos_{clave}.xlsx")
+
+
+def _limpiar_cache(vigente: str):
+    for nombre in os.listdir(CARPETA_CACHE):
+        ruta = os.path.join(CARPETA_CACHE, nombre)
+        if ruta != vigente and _NOMBRE_CACHE.match(nombre):
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+
+def abrir_excel_prestamos():
+    """
+    (archivo abierto, versión, clave) del Excel de préstamos. Con caché, se
+    reutiliza el libro de la versión actual y la ventana del pivot del mes en
+    curso (``_clave_cache``) o se genera una sola vez por proceso (las
+    peticiones simultáneas esperan al mismo build). Sin caché, es el temporal
+    de ``excel_prestamos_temporal`` (versión y clave None).
+    """
+    if os.getenv("EXPORT_EXCEL_CACHE", "1") == "0":
+        return excel_prestamos_temporal(), None, None
+
+    # La versión se lee antes que los datos: si cambian durante el build, el
+    # libro queda con datos iguales o más nuevos que su versión.
+    version = version_actual()
+    clave = _clave_cache(version)
+    ruta = _ruta_cache(clave)
+    try:
+        return open(ruta, "rb"), version, clave
+    except FileNotFoundError:
+        pass
+    with _cache_lock:
+        if not os.path.isfile(ruta):
+            os.makedirs(CARPETA_CACHE, exist_ok=True)
+            tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                generar_excel_prestamos(tmp)
+                os.replace(tmp, ruta)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            _limpiar_cache(ruta)
+        # Abierto antes de soltar el lock: otro build no lo borra a mitad
+        return open(ruta, "rb"), version, clave
+
+
+def iniciar_precalculo_excel(app):
+    """Hilo que regenera la caché del Excel tras los commits que cambian la versión."""
+    if os.getenv("EXPORT_EXCEL_PRECALCULAR", "0") != "1" or os.getenv("EXPORT_EXCEL_CACHE", "1") == "0":
+        return None
+    try:
+        espera = max(0, int(os.getenv("EXPORT_EXCEL_PRECALCULAR_ESPERA", 30)))
+    except ValueError:
+        espera = 30
+    pendiente = threading.Event()
+    al_cambiar(pendiente.set)
+
+    def _bucle():
+        while True:
+            pendiente.wait()
+            time.sleep(espera)  # agrupa ráfagas de cambios en un solo build
+            pendiente.clear()
+            try:
+                with app.app_context():
+                    f, _, _ = abrir_excel_prestamos()
+                    f.close()
+            except Exception:
+                log.exception("Falló el precálculo del Excel de préstamos")
+
+    t = threading.Thread(target=_bucle, name="excel-precalculo", daemon=True)
+    t.start()
+    return t
+
+
+# ------------------ Streaming (openpyxl write-only) ------------------
+
+def _es_amortizada(estado) -> bool:
+    return (estado or "").strip().lower() == "amortizada"
+
+
+def _sql_es_grati():
+    return func.lower(Cuota.etiqueta).like("%grat%")
+
+
+def _columnas_mes() -> list:
+    """(anio, mes, es_grati) distintos de las cuotas, en el orden de la hoja."""
+    hoy = _date.today()
+    claves = {
+        (anio, mes, bool(grati))
+        for anio, mes, grati in db.session.query(Cuota.anio, Cuota.mes, _sql_es_grati()).distinct()
+        if anio and mes
+    }
+    return sorted(claves, key=lambda k: orden_columna_cronograma(*k, hoy))
+
+
+def _por_prestamo(filas):
+    """
+    Agrupa ``filas`` (ordenadas por su primer campo, el id del préstamo) y
+    devuelve ``tomar(id)``, que entrega las filas de ese id. Los ids se piden
+    en orden ascendente: es un merge-join sobre el cursor, sin cargarlo entero.
+    """
+    grupos = groupby(filas, key=itemgetter(0))
+    actual = next(grupos, None)
+
+    def tomar(prestamo_id):
+        nonlocal actual
+        while actual is not None and actual[0] < prestamo_id:
+            actual = next(grupos, None)
+        if actual is None or actual[0] != prestamo_id:
+            return []
+        encontradas = list(actual[1])
+        actual = next(grupos, None)
+        return encontradas
+
+    return tomar
+
+
+def _encabezado(ws, titulos) -> list:
+    celdas = []
+    for t in titulos:
+        c = WriteOnlyCell(ws, value=t)
+        c.font = _FUENTE_ENCABEZADO
+        c.border = _BORDE_ENCABEZADO
+        c.alignment = _ALINEACION_ENCABEZADO
+        celdas.append(c)
+    return celdas
+
+
+def _celda(ws, valor, formato):
+    c = WriteOnlyCell(ws, value=valor)
+    if valor is not None:
+        c.number_format = formato
+    return c
+
+
+def _preparar_hoja(ws, titulos, columnas_monto):
+    """Anchos y paneles: en write-only van antes de la primera fila."""
+    for i, t in enumerate(titulos, start=1):
+        if t in columnas_monto:
+            ws.column_dimensions[get_column_letter(i)].width = max(12, len(str(t)) + 2)
+    ws.freeze_panes = "A2"
+
+
+# ------------------ Conjuntos de datos (Excel, CSV, Parquet, Arrow) ------------------
+
+class Conjunto(NamedTuple):
+    """Datos tabulares en streaming: nombres y tipos de columna + filas."""
+
+    columnas: List[str]
+    tipos: List[str]  # "int", "float", "str", "date" o "bool"
+    filas: Iterator[tuple]
+
+
+def conjunto_prestamos(columnas_mes=None) -> Conjunto:
+    """
+    Una fila por préstamo, como la hoja Prestamos: datos del préstamo, una
+    columna por mes del cronograma (cuotas amortizadas en 0) y totales de
+    amortización. Se lee con cursores del servidor; nada se carga entero.
+    """
+    columnas_mes = _columnas_mes() if columnas_mes is None else columnas_mes
+    meses = [columna_cronograma(*k) for k in columnas_mes]
+    indice_mes = {k: i for i, k in enumerate(columnas_mes)}
+    columnas = (
+        ["ID_PRESTAMO", "DNI", "NOMBRE", "PRESTAMO", "MONTO TOTAL", "FECHA DE SOLICITUD", "AÑO"]
+        + meses
+        + ["MONTO DE AMORTIZACIÓN", "FECHA DE AMORTIZACIÓN", "OBS DE AMORTIZACIÓN"]
+    )
+    tipos = (
+        ["int", "str", "str", "str", "float", "str", "int"]
+        + ["float"] * len(meses)
+        + ["float", "date", "str"]
+    )
+
+    def filas():
+        prestamos = prestamos_con_amortizaciones().order_by(Prestamo.id).yield_per(LOTE_FILAS)
+        cuotas_de = _por_prestamo(
+            db.session.query(
+                Cuota.prestamo_id, Cuota.anio, Cuota.mes, _sql_es_grati(), Cuota.monto, Cuota.estado
+            )
+            .order_by(Cuota.prestamo_id)
+            .yield_per(LOTE_FILAS)
+        )
+        for p, e, amort_total, amort_fecha, amort_obs in prestamos:
+            montos_mes = [0.0] * len(meses)
+            for _, anio, mes, grati, monto, estado in cuotas_de(p.id):
+                i = indice_mes.get((anio, mes, bool(grati)))
+                if i is not None and not _es_amortizada(estado):
+                    montos_mes[i] += float(monto)
+            yield (
+                p.id,
+                e.dni,
+                nombre_empleado(e),
+                p.tipo if p.tipo != "Otros" else f"Otros: {p.motivo_especifico or ''}",
+                float(p.monto_total),
+                p.fecha_solicitud.strftime("%Y-%m-%d"),
+                p.fecha_solicitud.year,
+                *montos_mes,
+                float(amort_total or 0),
+                amort_fecha,
+                amort_obs or "",
+            )
+
+    return Conjunto(columnas, tipos, filas())
+
+
+def conjunto_cuotas() -> Conjunto:
+    """Una fila por cuota (formato largo del cronograma), ordenadas por préstamo y orden."""
+    columnas = [
+        "ID_PRESTAMO", "DNI", "ORDEN", "ETIQUETA", "ANIO", "MES", "ES_GRATI",
+        "FECHA_COBRO", "MONTO", "ESTADO",
+    ]
+    tipos = ["int", "str", "int", "str", "int", "int", "bool", "date", "float", "str"]
+
+    def filas():
+        q = (
+            db.session.query(
+                Cuota.prestamo_id, Empleado.dni, Cuota.orden, Cuota.etiqueta,
+                Cuota.anio, Cuota.mes, _sql_es_grati(), Cuota.monto, Cuota.estado,
+            )
+            .join(Prestamo, Cuota.prestamo_id == Prestamo.id)
+            .join(Empleado, Prestamo.empleado_id == Empleado.id)
+            .order_by(Cuota.prestamo_id, Cuota.orden)
+            .yield_per(LOTE_FILAS)
+        )
+        for pid, dni, orden, etiqueta, anio, mes, grati, monto, estado in q:
+            yield (
+                pid, dni, orden, etiqueta, anio, mes, bool(grati),
+                _date(anio, mes, 1) if anio and mes else None,
+                float(monto),
+                (estado or "Pendiente").strip(),
+            )
+
+    return Conjunto(columnas, tipos, filas())
+
+
+CONJUNTOS = {"prestamos": conjunto_prestamos, "cuotas": conjunto_cuotas}
+
+
+# ------------------ Hojas del libro (write-only) ------------------
+
+def _escribir_hoja_prestamos(wb, columnas_mes):
+    ws = wb.create_sheet("Prestamos")
+    datos = conjunto_prestamos(columnas_mes)
+    formatos = [
+        FORMATO_MONTO if t == "float" else FORMATO_FECHA if t == "date" else None
+        for t in datos.tipos
+    ]
+    _preparar_hoja(
+        ws, datos.columnas, {c for c, t in zip(datos.columnas, datos.tipos) if t == "float"}
+    )
+    ws.append(_encabezado(ws, datos.columnas))
+
+    filas = 1
+    for fila in datos.filas:
+        ws.append([_celda(ws, v, f) if f else v for v, f in zip(fila, formatos)])
+        filas += 1
+
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(datos.columnas))}{filas}"
+
+
+def _meses_pivot() -> int:
+    try:
+        return max(0, int(os.getenv("EXPORT_PIVOT_MESES", 12)))
+    except ValueError:
+        return 12
+
+
+def _ventana_pivot(hoy: Optional[_date] = None) -> Optional[Tuple[int, int]]:
+    """
+    [desde, hasta) en meses absolutos (anio*12 + mes - 1): del mes actual a
+    EXPORT_PIVOT_MESES meses hacia adelante (default 12). None = sin límite
+    (EXPORT_PIVOT_MESES=0, todo el historial).
+    """
+    n = _meses_pivot()
+    if not n:
+        return None
+    hoy = hoy or _date.today()
+    desde = hoy.year * 12 + hoy.month - 1
+    return desde, desde + n
+
+
+def _orden_etiquetas(filas) -> List[str]:
+    """(etiqueta, mes absoluto, es_grati) -> etiquetas en orden cronológico (grati antes del mes)."""
+    return [e for e, _, _ in sorted(filas, key=lambda f: (f[1], not f[2], f[0])) if e]
+
+
+def _escribir_hoja_pivot(wb):
+    """
+    DNI x ETIQUETA (suma de cuotas, las amortizadas en 0) dentro de la
+    ventana de ``_ventana_pivot``, agregado en SQL con GROUP BY. Disperso:
+    las celdas sin monto quedan vacías.
+    """
+    mes_abs = Cuota.anio * 12 + Cuota.mes - 1
+    ventana = _ventana_pivot()
+    filtros = [mes_abs >= ventana[0], mes_abs < ventana[1]] if ventana else []
+
+    etiquetas = _orden_etiquetas(
+        db.session.query(
+            Cuota.etiqueta, func.min(mes_abs), func.max(case((_sql_es_grati(), 1), else_=0))
+        )
+        .filter(*filtros)
+        .group_by(Cuota.etiqueta)
+    )
+    if not etiquetas:
+        return
+    ws = wb.create_sheet("Reporte_Pivot")
+    titulos = ["DNI"] + etiquetas
+    _preparar_hoja(ws, titulos, set(etiquetas))
+    ws.append(_encabezado(ws, titulos))
+
+    amortizada = func.lower(func.trim(func.coalesce(Cuota.estado, ""))) == "amortizada"
+    total = func.sum(case((amortizada, 0), else_=Cuota.monto))
+    totales = (
+        db.session.query(Empleado.dni, Cuota.etiqueta, total)
+        .join(Prestamo, Cuota.prestamo_id == Prestamo.id)
+        .join(Empleado, Prestamo.empleado_id == Empleado.id)
+        .filter(Empleado.dni.isnot(None), *filtros)
+        .group_by(Empleado.dni, Cuota.etiqueta)
+        .having(total != 0)
+        .order_by(Empleado.dni)
+        .yield_per(LOTE_FILAS)
+    )
+    indice = {e: i for i, e in enumerate(etiquetas)}
+    filas = 1
+    for dni, grupo in groupby(totales, key=itemgetter(0)):
+        fila = [None] * len(etiquetas)
+        for _, etiqueta, monto in grupo:
+            if etiqueta in indice:
+                fila[indice[etiqueta]] = _celda(ws, float(monto), FORMATO_MONTO)
+        ws.append([dni, *fila])
+        filas += 1
+
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(titulos))}{filas}"
+
+
+def _generar_excel_streaming(out_path):
+    wb = Workbook(write_only=True)
+    _escribir_hoja_prestamos(wb, _columnas_mes())
+    _escribir_hoja_pivot(wb)
+    wb.save(out_path)
+    return out_path
+
+
+# ------------------ Versión con DataFrames (pandas) ------------------
+
+def _generar_excel_pandas(out_path):
+    # ------------------ Datos base ------------------
+    Qp = prestamos_con_amortizaciones().all()
+    rows_p = [
+        {
+            "ID_PRESTAMO": p.id,
+            "DNI": e.dni,
+            "NOMBRE": nombre_empleado(e),
+            "PRESTAMO": (
+                p.tipo if p.tipo != "Otros" else f"Otros: {p.motivo_especifico or ''}"
+            ),
+            "MONTO TOTAL": float(p.monto_total),
+            "FECHA DE SOLICITUD": p.fecha_solicitud.strftime("%Y-%m-%d"),
+            "AÑO": p.fecha_solicitud.year,
+            "MONTO DE AMORTIZACIÓN": float(amort_total or 0),
+            "FECHA DE AMORTIZACIÓN": amort_fecha,
+            "OBS DE AMORTIZACIÓN": amort_obs or "",
+        }
+        for p, e, amort_total, amort_fecha, amort_obs in Qp
+    ]
+
+    Qc = (
+        db.session.query(Cuota, Prestamo, Empleado)
+        .join(Prestamo, Cuota.prestamo_id == Prestamo.id)
+        .join(Empleado, Prestamo.empleado_id == Empleado.id)
+        .all()
+    )
+    rows_c = [
+        {
+            "ID_PRESTAMO": p.id,
+            "DNI": e.dni,
+            "FECHA_COBRO": (
+                _date(c.anio, c.mes, 1).strftime("%Y-%m-%d") if c.anio and c.mes else ""
+            ),
+            "ETIQUETA": c.etiqueta,
+            "MONTO": float(c.monto),
+            "ESTADO": (c.estado or "Pendiente").strip(),
+        }
+        for c, p, e in Qc
+    ]
+
+    df_p = pd.DataFrame(rows_p)
+    df_c = pd.DataFrame(rows_c)
+
+    # ------------------ Cronograma en columnas (MISMA hoja) ------------------
+    month_cols = []
+    if not df_c.empty:
+        df_c["ESTADO"] = df_c["ESTADO"].fillna("Pendiente").astype(str)
+        mask_amort = df_c["ESTADO"].str.strip().str.lower().eq("amortizada")
+        df_c.loc[mask_amort, "MONTO"] = 0.0
+
+        fecha = pd.to_datetime(df_c["FECHA_COBRO"], errors="coerce")
+        pivot_mes = pivot_cronograma(
+            pd.DataFrame(
+                {
+                    "prestamo_id": df_c["ID_PRESTAMO"],
+                    "anio": fecha.dt.year,
+                    "mes": fecha.dt.month,
+                    "es_grati": df_c["ETIQUETA"].str.contains("grat", case=False, na=False),
+                    "monto": df_c["MONTO"],
+                }
+            )
+        )
+        col_order = list(pivot_mes.columns)
+        pivot_mes = pivot_mes.rename_axis("ID_PRESTAMO").reset_index()
+
+        df_p = df_p.merge(pivot_mes, on="ID_PRESTAMO", how="left")
+        month_cols = [c for c in col_order if c in df_p.columns]
+        if month_cols:
+            df_p[month_cols] = df_p[month_cols].fillna(0.0)
+            base_cols = list(df_p.columns)
+            base_cols_wo = [c for c in base_cols if c not in month_cols]
+            pos = base_cols_wo.index("AÑO") + 1
+            new_order = base_cols_wo[:pos] + month_cols + base_cols_wo[pos:]
+            df_p = df_p[new_order]
+
+    # ------------------ Pivot extra (ventana de meses, disperso) ------------------
+    pivot = pd.DataFrame()
+    if not df_c.empty:
+        fecha = pd.to_datetime(df_c["FECHA_COBRO"], errors="coerce")
+        df_v = df_c.assign(
+            mes_abs=fecha.dt.year * 12 + fecha.dt.month - 1,
+            grati=df_c["ETIQUETA"].str.contains("grat", case=False, na=False),
+        ).dropna(subset=["mes_abs"])
+        ventana = _ventana_pivot()
+        if ventana:
+            df_v = df_v[(df_v["mes_abs"] >= ventana[0]) & (df_v["mes_abs"] < ventana[1])]
+        if not df_v.empty:
+            info = df_v.groupby("ETIQUETA").agg(mes_abs=("mes_abs", "min"), grati=("grati", "max"))
+            orden = _orden_etiquetas(
+                zip(info.index, info["mes_abs"], info["grati"].astype(bool))
+            )
+            pivot = pd.pivot_table(
+                df_v, index=["DNI"], columns=["ETIQUETA"], values="MONTO", aggfunc="sum"
+            ).reindex(columns=orden)
+            pivot = pivot.mask(pivot == 0).dropna(how="all").reset_index()
+
+    # ------------------ Escribir Excel + FORMATO numérico ------------------
+    with ExcelWriter(out_path, engine="openpyxl") as w:
+        df_p.to_excel(w, index=False, sheet_name="Prestamos")
+        if not pivot.empty:
+            pivot.to_excel(w, index=False, sheet_name="Reporte_Pivot")
+
+        # ===== Formato en hoja Prestamos =====
+        ws = w.sheets["Prestamos"]
+
+        # Mapa encabezado -> letra de columna
+        header_to_col_letter = {cell.value: cell.column_letter for cell in ws[1]}
+
+        # Columnas a formatear (numéricas)
+        targets = ["MONTO TOTAL", "MONTO DE AMORTIZACIÓN"] + month_cols
+
+        for header in targets:
+            col_letter = header_to_col_letter.get(header)
+            if not col_letter:
+                continue
+
+            col_idx = column_index_from_string(col_letter)
+            # Aplica formato a TODA la columna desde fila 2 a max_row
+            for row in ws.iter_rows(
+                min_row=2, max_row=ws.max_row, min_col=col_idx, max_col=col_idx
+            ):
+                cell = row[0]
+                # Si vino como texto por alguna razón, intenta convertir
+                if isinstance(cell.value, str):
+                    try:
+                        cell.value = float(cell.value)
+                    except Exception:
+                        pass
+                if isinstance(cell.value, (int, float)):
+                    cell.number_format = "#,##0.00"
+
+            # Ajuste de ancho
+            ws.column_dimensions[col_letter].width = max(12, len(header) + 2)
+
+        # Autofiltro y panes inmovilizados (ayuda de lectura)
+        ws.auto_filter.ref = ws.dimensions
+        ws.freeze_panes = "A2"
+
+        # ===== Formato en hoja Reporte_Pivot (si existe) =====
+        if "Reporte_Pivot" in w.sheets:
+            ws2 = w.sheets["Reporte_Pivot"]
+            ws2.auto_filter.ref = ws2.dimensions
+            ws2.freeze_panes = "A2"
+            # Formatear todas las columnas numéricas excepto la 1 (DNI)
+            for j, cell in enumerate(ws2[1], start=1):
+                if j == 1:
+                    continue
+                col_letter = cell.column_letter
+                col_idx = column_index_from_string(col_letter)
+                for row in ws2.iter_rows(
+                    min_row=2, max_row=ws2.max_row, min_col=col_idx, max_col=col_idx
+                ):
+                    c = row[0]
+                    if isinstance(c.value, str):
+                        try:
+                            c.value = float(c.value)
+                        except Exception:
+                            pass
+                    if isinstance(c.value, (int, float)):
+                        c.number_format = "#,##0.00"
+                ws2.column_dimensions[col_letter].width = max(
+                    12, len(str(cell.value)) + 2
+                )
+
+    return out_path
+
+
@@ -0,0 +1,116 @@
+# prestamos/formatos.py
+"""
+Salida en streaming de los conjuntos de ``exportar`` (préstamos con el
+cronograma en columnas, cuotas) como CSV gzip, Parquet o Arrow IPC (stream).
+
+Las filas se convierten por lotes de ``exportar.LOTE_FILAS`` y cada lote se
+emite apenas se escribe: la memoria no depende del tamaño del export.
+Parquet y Arrow necesitan ``pyarrow`` (se importa solo al usarlos).
+"""
+import csv
+import io
+import zlib
+from itertools import islice
+from typing import Iterator
+
+from documentos import SalidaEnStream
+from .exportar import LOTE_FILAS, Conjunto
+
+
+def _lotes(filas, n: int = LOTE_FILAS):
+    filas = iter(filas)
+    while True:
+        lote = list(islice(filas, n))
+        if not lote:
+            return
+        yield lote
+
+
+def csv_gz_en_stream(datos: Conjunto) -> Iterator[bytes]:
+    """CSV UTF-8 (coma, fechas ISO) comprimido con gzip, por trozos."""
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: contenedor gzip
+    buf = io.StringIO()
+    w = csv.writer(buf, lineterminator="\n")
+    w.writerow(datos.columnas)
+    for lote in _lotes(datos.filas):
+        w.writerows(lote)
+        trozo = gz.compress(buf.getvalue().encode("utf-8"))
+        buf.seek(0)
+        buf.truncate()
+        if trozo:
+            yield trozo
+    yield gz.compress(buf.getvalue().encode("utf-8")) + gz.flush()
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+    except ImportError as e:  # pragma: no cover
+        raise RuntimeError("Este formato requiere pyarrow (pip install pyarrow)") from e
+    return pa
+
+
+def _esquema(pa, datos: Conjunto):
+    tipos = {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "str": pa.string(),
+        "date": pa.date32(),
+        "bool": pa.bool_(),
+    }
+    return pa.schema([(c, tipos[t]) for c, t in zip(datos.columnas, datos.tipos)])
+
+
+def _batches(pa, esquema, datos: Conjunto):
+    for lote in _lotes(datos.filas):
+        columnas = list(zip(*lote))
+        yield pa.record_batch(
+            [pa.array(col, type=campo.type) for col, campo in zip(columnas, esquema)],
+            schema=esquema,
+        )
+
+
+def parquet_en_stream(datos: Conjunto) -> Iterator[bytes]:
+    """Parquet (zstd), un row group por lote."""
+    pa = _pyarrow()
+    import pyarrow.parquet as pq
+
+    esquema = _esquema(pa, datos)
+    salida = SalidaEnStream()
+    with pq.ParquetWriter(salida, esquema, compression="zstd") as w:
+        for batch in _batches(pa, esquema, datos):
+            w.write_batch(batch)
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+def arrow_en_stream(datos: Conjunto) -> Iterator[bytes]:
+    """Arrow IPC en formato stream, buffers zstd (se lee con ``pyarrow.ipc.open_stream``)."""
+    pa = _pyarrow()
+
+    esquema = _esquema(pa, datos)
+    salida = SalidaEnStream()
+    opciones = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_stream(salida, esquema, options=opciones) as w:
+        for batch in _batches(pa, esquema, datos):
+            w.write_batch(batch)
+            yield salida.vaciar()
+    yield salida.vaciar()
+
+
+# nombre -> (escritor, mimetype, extensión)
+FORMATOS = {
+    "csv": (csv_gz_en_stream, "application/gzip", "csv.gz"),
+    "parquet": (parquet_en_stream, "application/vnd.apache.parquet", "parquet"),
+    "arrow": (arrow_en_stream, "application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+def formato_disponible(nombre: str) -> bool:
+    if nombre == "csv":
+        return True
+    try:
+        _pyarrow()
+    except RuntimeError:
+        return False
+    return True
@@ -0,0 +1,313 @@
+# prestamos/importar.py
+"""
+Carga masiva de préstamos con su cronograma (Excel / CSV o lote JSON).
+
+Columnas / llaves (las mismas de ``POST /api/prestamos``): DNI, TIPO,
+MOTIVO_ESPECIFICO, FECHA_SOLICITUD, MONTO_TOTAL, N_CUOTAS, MES_INICIO,
+ANIO_INICIO, INCLUIR_GRATI, ANIO_GRATI_DESDE y FECHA_FIRMA (si falta, la
+de solicitud).
+
+- Las columnas se validan con pandas y los colaboradores se resuelven por
+  DNI con una sola consulta ``IN``.
+- Se descartan los préstamos que ya existen (mismo colaborador, tipo,
+  fecha de solicitud y monto), así reimportar el mismo archivo no duplica;
+  con la misma llave, dentro del archivo solo entra la primera fila.
+- El cronograma de cada préstamo sale de ``generar_cronograma`` y préstamos
+  y cuotas se insertan con INSERT masivos de ``IMPORT_LOTE`` préstamos,
+  todo en una sola transacción: o entra la carga completa o nada.
+
+Devuelve un reporte con contadores y los errores por fila.
+"""
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+import pandas as pd
+from sqlalchemy import insert
+
+from convenios.importar import (
+    LOTE,
+    ErrorImportacion,
+    dni_invalido,
+    leer_tabla,
+    lista_errores,
+    marcar_errores,
+    normalizar_dni,
+    normalizar_tabla,
+    parsear_fechas,
+)
+from models import db, Empleado
+from .models import Prestamo, Cuota
+from .services import generar_cronograma
+
+ALIAS = {
+    "DNI": "dni",
+    "TIPO": "tipo",
+    "MOTIVO": "motivo_especifico",
+    "MOTIVO_ESPECIFICO": "motivo_especifico",
+    "FECHA_SOLICITUD": "fecha_solicitud",
+    "SOLICITUD": "fecha_solicitud",
+    "MONTO": "monto_total",
+    "MONTO_TOTAL": "monto_total",
+    "N_CUOTAS": "n_cuotas",
+    "NRO_CUOTAS": "n_cuotas",
+    "CUOTAS": "n_cuotas",
+    "MES_INICIO": "mes_inicio",
+    "ANIO_INICIO": "anio_inicio",
+    "ANO_INICIO": "anio_inicio",
+    "INCLUIR_GRATI": "incluir_grati",
+    "GRATI": "incluir_grati",
+    "ANIO_GRATI_DESDE": "anio_grati_desde",
+    "ANO_GRATI_DESDE": "anio_grati_desde",
+    "FECHA_FIRMA": "fecha_firma",
+    "FIRMA": "fecha_firma",
+}
+CAMPOS = (
+    "dni",
+    "tipo",
+    "motivo_especifico",
+    "fecha_solicitud",
+    "monto_total",
+    "n_cuotas",
+    "mes_inicio",
+    "anio_inicio",
+    "incluir_grati",
+    "anio_grati_desde",
+    "fecha_firma",
+)
+OBLIGATORIAS = ("dni", "tipo", "fecha_solicitud", "monto_total", "n_cuotas", "mes_inicio", "anio_inicio")
+MONTO_MAX = Decimal("99999999.99")  # Numeric(10, 2)
+SI = {"1", "SI", "S", "X", "TRUE", "VERDADERO", "YES", "Y"}
+CENT = Decimal("0.01")
+
+
+def _texto(s: pd.Series) -> pd.Series:
+    return s.astype("string").str.strip().replace("", pd.NA)
+
+
+def _monto(s: pd.Series) -> pd.Series:
+    """'1500', '1,500.50', '1.500,50', '1500,50', 'S/ 1 500' -> texto decimal con punto."""
+    s = s.str.replace(r"(?i)s/|\s", "", regex=True)
+    coma_decimal = s.str.fullmatch(r"-?(\d+|\d{1,3}(\.\d{3})+),\d{1,2}|-?\d{1,3}(\.\d{3})+").fillna(False)
+    s = s.where(~coma_decimal, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return s.str.replace(",", "", regex=False)
+
+
+def _entero(s: pd.Series) -> pd.Series:
+    n = pd.to_numeric(s.str.replace(r"\.0$", "", regex=True), errors="coerce")
+    return n.where(n == n.round())
+
+
+def validar(df: pd.DataFrame):
+    """Devuelve ``(validas, errores)`` como ``convenios.importar.validar``."""
+    df = df.copy()
+    for c in CAMPOS:
+        df[c] = _texto(df[c])
+    df["dni"] = normalizar_dni(df["dni"])
+
+    f_sol = parsear_fechas(df["fecha_solicitud"])
+    f_firma = parsear_fechas(df["fecha_firma"])
+    monto_txt = _monto(df["monto_total"])
+    monto = pd.to_numeric(monto_txt, errors="coerce")
+    n_cuotas, mes, anio, anio_grati = (
+        _entero(df[c]) for c in ("n_cuotas", "mes_inicio", "anio_inicio", "anio_grati_desde")
+    )
+    grati = df["incluir_grati"].str.upper().isin(SI).fillna(False).astype(bool)
+
+    reglas = [
+        (df["dni"].isna(), "DNI vacío"),
+        (dni_invalido(df["dni"]), "DNI inválido (8 dígitos)"),
+        (df["tipo"].isna(), "Tipo vacío"),
+        (df["tipo"].str.len().gt(80), "Tipo excede 80 caracteres"),
+        (df["motivo_especifico"].str.len().gt(200), "Motivo excede 200 caracteres"),
+        (f_sol.isna(), "Fecha de solicitud vacía o inválida"),
+        (df["fecha_firma"].notna() & f_firma.isna(), "Fecha de firma inválida"),
+        (monto.isna() | (monto <= 0) | (monto > float(MONTO_MAX)), "Monto total inválido"),
+        (n_cuotas.isna() | (n_cuotas < 1) | (n_cuotas > 240), "N° de cuotas inválido (1 a 240)"),
+        (mes.isna() | ~mes.between(1, 12), "Mes de inicio inválido (1 a 12)"),
+        (anio.isna() | ~anio.between(2000, 2100), "Año de inicio inválido"),
+        (grati & anio_grati.isna(), "Debe indicar 'Año desde' para gratificaciones"),
+    ]
+    errores, malas = marcar_errores(reglas, df.index)
+
+    ok = ~malas
+    validas = pd.DataFrame(
+        {
+            "dni": df["dni"],
+            "tipo": df["tipo"],
+            "motivo_especifico": df["motivo_especifico"],
+            "fecha_solicitud": f_sol,
+            "fecha_firma": f_firma.fillna(f_sol),
+            "monto_total": monto_txt,
+            "n_cuotas": n_cuotas,
+            "mes_inicio": mes,
+            "anio_inicio": anio,
+            "incluir_grati": grati,
+            "anio_grati_desde": anio_grati.where(grati),
+        }
+    )[ok]
+    return validas, errores
+
+
+def _filas(validas: pd.DataFrame):
+    """Registros Python listos para insertar (fechas ``date``, montos ``Decimal``)."""
+    for fila, r in zip(validas.index, validas.itertuples(index=False)):
+        yield int(fila), dict(
+            dni=r.dni,
+            tipo=r.tipo,
+            motivo_especifico=None if pd.isna(r.motivo_especifico) else r.motivo_especifico,
+            fecha_solicitud=r.fecha_solicitud.date(),
+            fecha_firma=r.fecha_firma.date(),
+            monto_total=Decimal(r.monto_total).quantize(CENT, rounding=ROUND_HALF_UP),
+            n_cuotas=int(r.n_cuotas),
+            mes_inicio=int(r.mes_inicio),
+            anio_inicio=int(r.anio_inicio),
+            incluir_grati=bool(r.incluir_grati),
+            anio_grati_desde=None if pd.isna(r.anio_grati_desde) else int(r.anio_grati_desde),
+        )
+
+
+def _ya_registrados(candidatos):
+    """{(empleado_id, tipo, fecha_solicitud, monto)} de los préstamos que ya existen."""
+    ids = {c[0] for c in candidatos}
+    if not ids:
+        return set()
+    claves = set()
+    lista = list(ids)
+    for ini in range(0, len(lista), LOTE):
+        q = db.session.query(
+            Prestamo.empleado_id, Prestamo.tipo, Prestamo.fecha_solicitud, Prestamo.monto_total
+        ).filter(Prestamo.empleado_id.in_(lista[ini : ini + LOTE]))
+        claves.update((e, t, f, Decimal(m).quantize(CENT)) for e, t, f, m in q)
+    return claves & set(candidatos)
+
+
+def _insertar(prestamos, usuario: str):
+    """INSERT masivo de ``prestamos`` (dicts con '_cuotas') y de sus cuotas."""
+    for ini in range(0, len(prestamos), LOTE):
+        lote = prestamos[ini : ini + LOTE]
+        ids = db.session.execute(
+            insert(Prestamo).returning(Prestamo.id, sort_by_parameter_order=True),
+            [
+                {k: v for k, v in p.items() if not k.startswith("_")}
+                | {"estado": "Emitido", "creado_por": usuario}
+                for p in lote
+            ],
+        ).scalars().all()
+        cuotas = [
+            dict(
+                prestamo_id=pid,
+                orden=it["orden"],
+                etiqueta=it["etiqueta"],
+                anio=it["anio"],
+                mes=it["mes"],
+                es_grati=it["es_grati"],
+                monto=it["monto"],
+                fecha_cobro_teorica=date(it["anio"], it["mes"], 1),
+            )
+            for pid, p in zip(ids, lote)
+            for it in p["_cuotas"]
+        ]
+        db.session.execute(insert(Cuota), cuotas)
+
+
+def importar_prestamos(
+    df: pd.DataFrame, *, usuario: str = "importacion", simular: bool = False, estricto: bool = False
+) -> dict:
+    """
+    Importa los préstamos de ``df`` (ya normalizado con ``normalizar_tabla``).
+
+    ``estricto=True``: si alguna fila tiene errores no se guarda nada.
+    ``simular=True``: valida y arma los cronogramas sin escribir.
+    """
+    validas, errores = validar(df)
+
+    dnis = validas["dni"].unique().tolist()
+    empleados = {}
+    for ini in range(0, len(dnis), LOTE):
+        empleados.update(
+            db.session.query(Empleado.dni, Empleado.id).filter(Empleado.dni.in_(dnis[ini : ini + LOTE]))
+        )
+
+    prestamos, claves = [], []
+    for fila, p in _filas(validas):
+        eid = empleados.get(p.pop("dni"))
+        if eid is None:
+            errores.setdefault(fila, []).append("Colaborador no existe. Registre primero.")
+            continue
+        try:
+            cuotas = generar_cronograma(
+                p["monto_total"],
+                p["n_cuotas"],
+                p.pop("mes_inicio"),
+                p.pop("anio_inicio"),
+                p["incluir_grati"],
+                p["anio_grati_desde"],
+            )
+        except (ValueError, AssertionError) as e:
+            errores.setdefault(fila, []).append(f"Cronograma: {e}")
+            continue
+        prestamos.append({"empleado_id": eid, **p, "_fila": fila, "_cuotas": cuotas})
+        claves.append((eid, p["tipo"], p["fecha_solicitud"], p["monto_total"]))
+
+    repetidos = _ya_registrados(claves)
+    if repetidos or len(set(claves)) < len(claves):
+        nuevos, vistos = [], set()
+        for p, clave in zip(prestamos, claves):
+            if clave in repetidos:
+                errores.setdefault(p["_fila"], []).append("Préstamo ya registrado (omitido)")
+            elif clave in vistos:
+                errores.setdefault(p["_fila"], []).append("Fila duplicada en el archivo (omitida)")
+            else:
+                vistos.add(clave)
+                nuevos.append(p)
+        prestamos = nuevos
+
+    res = {
+        "filas": int(len(df)),
+        "prestamos_creados": 0,
+        "cuotas_creadas": 0,
+        "simulacion": simular,
+        "estricto": estricto,
+    }
+    if not (simular or (estricto and errores)) and prestamos:
+        try:
+            _insertar(prestamos, usuario)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        res["prestamos_creados"] = len(prestamos)
+        res["cuotas_creadas"] = sum(len(p["_cuotas"]) for p in prestamos)
+    elif simular:
+        res["prestamos_validos"] = len(prestamos)
+        res["cuotas_a_crear"] = sum(len(p["_cuotas"]) for p in prestamos)
+
+    res["errores"] = lista_errores(errores, df["dni"].astype("string"))
+    res["filas_con_error"] = len(res["errores"])
+    return res
+
+
+def tabla_desde_archivo(origen, nombre: str = "") -> pd.DataFrame:
+    return leer_tabla(origen, nombre, alias=ALIAS, obligatorias=OBLIGATORIAS, campos=CAMPOS)
+
+
+def tabla_desde_json(items) -> pd.DataFrame:
+    """Lista de objetos con las llaves de ``POST /api/prestamos``."""
+    if not isinstance(items, list) or not all(isinstance(x, dict) for x in items):
+        raise ErrorImportacion("Se espera una lista de préstamos (objetos JSON).")
+    df = pd.DataFrame(items, dtype=object)
+    df = df.map(lambda v: None if v is None or v != v else str(v))
+    # Las filas del lote se numeran desde 1 (la "fila" 1 del archivo es el encabezado)
+    df = normalizar_tabla(df, ALIAS, OBLIGATORIAS if items else (), CAMPOS)
+    df.index = df.index - 1
+    return df
+
+
+def importar_prestamos_archivo(origen, nombre: str = "", **kw) -> dict:
+    return importar_prestamos(tabla_desde_archivo(origen, nombre), **kw)
+
+
+def importar_prestamos_json(items, **kw) -> dict:
+    return importar_prestamos(tabla_desde_json(items), **kw)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from datetime import datetime
-from sqlalchemy import Numeric
+from sqlalchemy import Numeric, text
 
 
 # Importa tu db y Empleado desde el models.py de tu app plana
@@ -14,7 +14,8 @@ class Prestamo(db.Model):
     empleado_id = db.Column(
         db.Integer,
         db.ForeignKey(f"{Empleado.__tablename__}.id"),  # ← usa el nombre real de la tabla
-        nullable=False
+        nullable=False,
+        index=True,
     )
     tipo = db.Column(db.String(80), nullable=False)
     motivo_especifico = db.Column(db.String(200))
@@ -24,13 +25,25 @@ class Prestamo(db.Model):
     incluir_grati = db.Column(db.Boolean, default=False)
     anio_grati_desde = db.Column(db.Integer)
     fecha_firma = db.Column(db.Date, nullable=False)
-    estado = db.Column(db.String(30), default="Emitido")
+    estado = db.Column(db.String(30), default="Emitido", index=True)
     version_formato = db.Column(db.String(30), default="GP-R-004 v06")
     creado_por = db.Column(db.String(80))
     creado_en = db.Column(db.DateTime, default=datetime.utcnow)
+    # Resumen de las cuotas 'Pendiente', al día en la misma transacción que
+    # cualquier cambio a sus cuotas (ver prestamos/saldos.py)
+    saldo_pendiente = db.Column(Numeric(10, 2), nullable=False, default=0, server_default="0")
+    cuotas_pendientes = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    proxima_cuota = db.Column(db.Integer)  # ``orden`` de la próxima pendiente; None si no quedan
 
     empleado = db.relationship("Empleado")
     cuotas = db.relationship("Cuota", cascade="all, delete-orphan", order_by="Cuota.orden")
+    proxima = db.relationship(
+        "Cuota",
+        primaryjoin="and_(foreign(Cuota.prestamo_id) == Prestamo.id, "
+        "foreign(Cuota.orden) == Prestamo.proxima_cuota, Cuota.estado == 'Pendiente')",
+        viewonly=True,
+        uselist=False,
+    )
     amortizaciones = db.relationship("Amortizacion", cascade="all, delete-orphan")
 
 class Cuota(db.Model):
@@ -47,6 +60,19 @@ class Cuota(db.Model):
     fecha_cobro_teorica = db.Column(db.Date) # 1ro del mes
     fecha_descuento_real = db.Column(db.Date)
 
+    __table_args__ = (
+        # cierre/apertura de mes y reportes por mes
+        db.Index("ix_prestamo_cuotas_anio_mes_estado", "anio", "mes", "estado"),
+        # saldo y próxima cuota: solo las pendientes (parcial en SQLite y PostgreSQL)
+        db.Index(
+            "ix_prestamo_cuotas_pendientes",
+            "prestamo_id",
+            "orden",
+            sqlite_where=text("estado = 'Pendiente'"),
+            postgresql_where=text("estado = 'Pendiente'"),
+        ),
+    )
+
 
 class Amortizacion(db.Model):
     __tablename__ = "prestamo_amortizaciones"
@@ -65,4 +91,11 @@ class Documento(db.Model):
     ruta_pdf = db.Column(db.String(300), nullable=False)
     hash = db.Column(db.String(64))
     version_formato = db.Column(db.String(30), default="GP-R-004 v06")
-    emitido_en = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    emitido_en = db.Column(db.DateTime, default=datetime.utcnow)
+
+class VersionDatos(db.Model):
+    """Contador que sube con cada escritura a los datos de ``clave`` (ver prestamos/version.py)."""
+    __tablename__ = "version_datos"
+    clave = db.Column(db.String(40), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    actualizado_en = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,296 @@
+# prestamos/pdf_reportlab.py
+"""
+GP-R-004 (solicitud de préstamo / autorización de descuento) dibujado
+directamente con ReportLab.
+
+Reproduce la maquetación de ``prestamos/pdf.html`` (mismos márgenes,
+encabezado, bloques de motivos, cronograma y firmas) sin pasar por
+HTML -> CSS -> layout de WeasyPrint: es un formulario fijo, así que el
+render baja de cientos a unas decenas de milisegundos. Recibe el mismo contexto que la
+plantilla (ver ``_contexto_pdf_prestamo`` en routes).
+"""
+from __future__ import annotations
+import io
+import os
+import threading
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
+
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_JUSTIFY, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from documentos.assets import _dpi_impresion, _reducir
+from documentos.fetcher import STATIC_DIR
+
+ENCABEZADO = os.path.join(STATIC_DIR, "imagenes", "Encabezado2.png")
+
+# @page { margin: 10mm 16mm 10mm 16mm }
+MARGEN_V = 10 * mm
+MARGEN_H = 16 * mm
+ANCHO_UTIL = A4[0] - 2 * MARGEN_H
+
+BASE = 10  # --base-font
+INTERLINEA = BASE * 1.28  # --line-height
+PX = 0.75  # 1px CSS en puntos
+
+TIPOS_PRESTAMO = [
+    "Salud",
+    "Escolar",
+    "Capacitación",
+    "Estudios hijo",
+    "Catástrofe",
+    "Fallecimiento",
+]
+TIPOS_DESCUENTO = [
+    "Campaña Compra de Productos",
+    "Pérdida de Equipos y/o implementos",
+    "Daño a la infraestructura",
+    "Otros",
+]
+
+
+_texto = ParagraphStyle("texto", fontName="Helvetica", fontSize=BASE, leading=INTERLINEA, spaceAfter=BASE)
+_fecha = ParagraphStyle("fecha", parent=_texto, fontSize=BASE + 1, leading=(BASE + 1) * 1.28, alignment=TA_RIGHT)
+_titulo = ParagraphStyle("titulo", parent=_texto, fontName="Helvetica-Bold", spaceAfter=0)
+_item = ParagraphStyle("item", parent=_texto, spaceAfter=0)
+_tabla = ParagraphStyle("tabla", parent=_texto, fontSize=9.5, leading=9.5 * 1.28, spaceAfter=0)
+_politica = ParagraphStyle("politica", parent=_texto, fontSize=BASE - 1, leading=(BASE - 1) * 1.28, alignment=TA_JUSTIFY)
+_firma = ParagraphStyle("firma", parent=_texto, fontName="Helvetica-Bold", spaceAfter=0)
+
+# Encabezado leído una vez por proceso (se recarga si cambia el archivo)
+_encabezado = None  # (mtime, bytes, ancho_px, alto_px)
+_encabezado_lock = threading.Lock()
+
+# ReportLab solo expone el filtro ASCII85 como global (rl_config.useA85), sin
+# opción por documento: se apaga mientras dure algún build de este módulo y se
+# restaura al terminar el último, sin cambiar el valor del resto del proceso.
+_a85_lock = threading.Lock()
+_a85_activos = 0
+_a85_previo = None
+
+
+@contextmanager
+def _sin_ascii85():
+    """
+    Streams binarios (Flate) en vez de Flate+ASCII85 durante el build: el PDF
+    queda ~20% más chico y no se codifican en Python los bytes de la imagen.
+    """
+    global _a85_activos, _a85_previo
+    with _a85_lock:
+        if _a85_activos == 0:
+            _a85_previo = rl_config.useA85
+            rl_config.useA85 = 0
+        _a85_activos += 1
+    try:
+        yield
+    finally:
+        with _a85_lock:
+            _a85_activos -= 1
+            if _a85_activos == 0:
+                rl_config.useA85 = _a85_previo
+
+
+def _imagen_encabezado():
+    global _encabezado
+    mtime = os.path.getmtime(ENCABEZADO)
+    with _encabezado_lock:
+        if _encabezado is None or _encabezado[0] != mtime:
+            with open(ENCABEZADO, "rb") as f:
+                data = f.read()
+            # A resolución de impresión, como los assets del HTML
+            dpi = _dpi_impresion()
+            if dpi:
+                data = _reducir(data, round(ANCHO_UTIL / 72 * dpi)) or data
+            ancho, alto = ImageReader(io.BytesIO(data)).getSize()
+            _encabezado = (mtime, data, ancho, alto)
+        _, data, ancho, alto = _encabezado
+    return Image(io.BytesIO(data), width=ANCHO_UTIL, height=ANCHO_UTIL * alto / ancho)
+
+
+def _moneda(v) -> str:
+    return "S/ {:,.2f}".format(v or 0)
+
+
+def _lista_motivos(titulo: str, opciones, tipo: str, ancho: float, col_parens: float):
+    """Título + viñetas con '( X )' alineado a la derecha."""
+    filas = [[Paragraph(f"{titulo}", _titulo), "", ""]]
+    for op in opciones:
+        marca = "X" if tipo == op else " "
+        filas.append(["•", Paragraph(escape(op), _item), f"({marca:^3})"])
+    t = Table(filas, colWidths=[14, ancho - 14 - col_parens, col_parens])
+    t.setStyle(
+        TableStyle(
+            [
+                ("SPAN", (0, 0), (-1, 0)),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("FONTNAME", (0, 1), (0, -1), "Helvetica"),
+                ("FONTNAME", (2, 1), (2, -1), "Courier-Bold"),
+                ("FONTSIZE", (0, 0), (-1, -1), BASE),
+                ("ALIGN", (2, 1), (2, -1), "CENTER"),
+                ("LEFTPADDING", (0, 0), (-1, -1), 0),
+                ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+                ("TOPPADDING", (0, 0), (-1, 0), 0),
+                ("BOTTOMPADDING", (0, 0), (-1, 0), 6),
+                ("TOPPADDING", (0, 1), (-1, -1), 5 * PX),
+                ("BOTTOMPADDING", (0, 1), (-1, -1), 5 * PX),
+            ]
+        )
+    )
+    return t
+
+
+def _bloque_motivos(p):
+    gap = 18 * PX
+    izq = ANCHO_UTIL * 0.36
+    der = ANCHO_UTIL - izq - gap
+    pad_der = 22 * PX
+    lista_izq = _lista_motivos("PRÉSTAMOS:", TIPOS_PRESTAMO, p.tipo, izq, 30)
+    contenido_der = [
+        _lista_motivos(
+            "AUTORIZACIÓN DE DESCUENTO:",
+            TIPOS_DESCUENTO,
+            p.tipo,
+            der - pad_der - 32 * PX,
+            24 * PX + 6,
+        ),
+        Spacer(1, 6),
+        Paragraph(
+            "<b>Motivo / Observación:</b> " + escape(p.motivo_especifico or ""), _item
+        ),
+    ]
+    t = Table([[lista_izq, "", contenido_der]], colWidths=[izq, gap, der])
+    t.setStyle(
+        TableStyle(
+            [
+                ("VALIGN", (0, 0), (-1, -1), "TOP"),
+                ("LINEBEFORE", (2, 0), (2, 0), 1.5 * PX, colors.black),
+                ("LEFTPADDING", (0, 0), (1, 0), 0),
+                ("RIGHTPADDING", (0, 0), (1, 0), 0),
+                ("LEFTPADDING", (2, 0), (2, 0), pad_der),
+                ("RIGHTPADDING", (2, 0), (2, 0), 32 * PX),
+                ("TOPPADDING", (0, 0), (-1, -1), 0),
+                ("BOTTOMPADDING", (0, 0), (-1, -1), 0),
+            ]
+        )
+    )
+    return t
+
+
+def _tabla_cronograma(p, cuotas):
+    ancho = 130 * mm  # --cronograma-width
+    filas = [
+        [
+            Paragraph("<b>N°</b>", _tabla),
+            Paragraph("<b>Fecha de descuento (Mes y Año)</b>", _tabla),
+            Paragraph("<b>Importe S/.</b>", _tabla),
+        ]
+    ]
+    for c in cuotas:
+        filas.append([str(c.orden), Paragraph(escape(c.etiqueta or ""), _tabla), _moneda(c.monto)])
+    filas.append(["TOTAL", "", _moneda(p.monto_total)])
+    n = len(filas) - 1
+    t = Table(filas, colWidths=[ancho * 0.11, ancho * 0.57, ancho * 0.32], repeatRows=1)
+    t.setStyle(
+        TableStyle(
+            [
+                ("GRID", (0, 0), (-1, -1), PX, colors.black),
+                ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+                ("FONTSIZE", (0, 0), (-1, -1), 9.5),
+                ("ALIGN", (0, 0), (0, -1), "CENTER"),
+                ("ALIGN", (2, 0), (2, -1), "RIGHT"),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+                ("LEFTPADDING", (0, 0), (-1, -1), 6 * PX),
+                ("RIGHTPADDING", (0, 0), (-1, -1), 6 * PX),
+                ("TOPPADDING", (0, 0), (-1, -1), 3 * PX),
+                ("BOTTOMPADDING", (0, 0), (-1, -1), 3 * PX + 1),
+                ("SPAN", (0, n), (1, n)),
+                ("ALIGN", (0, n), (1, n), "RIGHT"),
+                ("FONTNAME", (0, n), (-1, n), "Helvetica-Bold"),
+            ]
+        )
+    )
+    t.hAlign = "LEFT"
+    return t
+
+
+def _firmas():
+    filas = [
+        [Paragraph("Firma del Trabajador", _firma), ":", ""],
+        [Paragraph("V°B° Firma del Subgerente de Gestión de Personas", _firma), ":", ""],
+    ]
+    t = Table(filas, colWidths=[ANCHO_UTIL * 0.46, ANCHO_UTIL * 0.02 + 12 * PX, ANCHO_UTIL * 0.52 - 12 * PX])
+    t.setStyle(
+        TableStyle(
+            [
+                ("FONTNAME", (1, 0), (1, -1), "Helvetica"),
+                ("FONTSIZE", (0, 0), (-1, -1), BASE),
+                ("ALIGN", (1, 0), (1, -1), "CENTER"),
+                ("VALIGN", (0, 0), (-1, -1), "BOTTOM"),
+                ("LINEBELOW", (2, 0), (2, -1), PX, colors.black),
+                ("LEFTPADDING", (0, 0), (-1, -1), 0),
+                ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+                ("TOPPADDING", (0, 1), (-1, 1), 22 * PX),
+                ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+            ]
+        )
+    )
+    return t
+
+
+def render_prestamo_reportlab(p, emp, emp_nombre: str, cuotas, hoy, **_) -> bytes:
+    """PDF GP-R-004 con el mismo contexto que ``prestamos/pdf.html``."""
+    buf = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buf,
+        pagesize=A4,
+        leftMargin=MARGEN_H,
+        rightMargin=MARGEN_H,
+        topMargin=MARGEN_V,
+        bottomMargin=MARGEN_V,
+        title="GP-R-004 — Solicitud de Préstamo/Descuento",
+        author="CONTRANS SAC",
+    )
+    historia = [
+        _imagen_encabezado(),
+        Spacer(1, 7 * mm - 2 * mm),
+        Paragraph(f"Fecha: {hoy.strftime('%d/%m/%Y')}", _fecha),
+        Spacer(1, 5 * mm - BASE),
+        Paragraph("Señores<br/><b>CONTRANS SAC</b><br/>Presente.-", _texto),
+        Paragraph("<b>A quien corresponda:</b>", _texto),
+        Paragraph(
+            f"Yo, <b>{escape(emp_nombre or '')}</b> con DNI <b>{escape(emp.dni or '')}</b>, "
+            f"solicito se me otorgue un préstamo de <b>{_moneda(p.monto_total)}</b> "
+            "por el siguiente motivo:",
+            _texto,
+        ),
+        _bloque_motivos(p),
+        Spacer(1, 9 * mm),
+        Paragraph(
+            "Me comprometo a devolver dicho monto y autorizo se me descuente de mis "
+            f"haberes mensuales en <b>{int(p.n_cuotas or 0):02d}</b> cuotas:",
+            _texto,
+        ),
+        Paragraph("<b>La programación de los descuentos es como sigue:</b>", _titulo),
+        Spacer(1, 6),
+        _tabla_cronograma(p, cuotas),
+        Spacer(1, 12),
+        Paragraph(
+            "<b>Por el presente me comprometo a cumplir la siguiente política de la "
+            "empresa:</b> En el caso que el trabajador deje de laborar en la empresa, "
+            "la deuda pendiente con CONTRANS será descontada automáticamente de su "
+            "liquidación de beneficios sociales, liquidaciones de pago de utilidades o "
+            "de cualquier otro concepto que esté pendiente de pago al suscrito.",
+            _politica,
+        ),
+        Spacer(1, 30 * PX),
+        _firmas(),
+    ]
+    with _sin_ascii85():
+        doc.build(historia)
+    return buf.getvalue()
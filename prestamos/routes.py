@@ -1,7 +1,10 @@
 from __future__ import annotations
 import os
+import unicodedata
+from io import BytesIO
 from datetime import date, datetime
 from flask import (
+    abort,
     request,
     render_template,
     jsonify,
@@ -10,6 +13,8 @@ from flask import (
     current_app,
     flash,
     redirect,
+    Response,
+    stream_with_context,
 )
 from .services import (
     generar_cronograma,
@@ -18,17 +23,34 @@ from .services import (
     amortizar,
     dec,
     nombre_empleado,
+    huella_prestamo,
 )
-from weasyprint import HTML, CSS
+from documentos import render_pdf
+from documentos.vista import pide_vista_html, respuesta_vista_html
+from documentos.lote import DocumentoLote, fecha_arg, lista_arg, pdfs_en_paralelo, zip_en_stream
+from tareas import encolar_desde_request
 from decimal import Decimal, ROUND_HALF_UP
 
+import click
+from werkzeug.exceptions import HTTPException
 from sqlalchemy import and_, or_, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
 from flask_login import login_required
 
 from . import prestamos_bp
 from .models import Prestamo, Cuota, Documento
+from .consultas import cuota_json, prestamos_con_amortizaciones, saldo_prestamo
+from .saldos import reconciliar
+from .cierre import aperturar_mes, cerrar_mes
+from .exportar import CONJUNTOS, abrir_excel_prestamos, guardar_snapshot
+from .formatos import FORMATOS, formato_disponible
+from .importar import ErrorImportacion, importar_prestamos_archivo, importar_prestamos_json
+from .storage import leer_pdf, liberar_pdfs, obtener_pdf_prestamo
+from .pdf_reportlab import render_prestamo_reportlab
 from .services import generar_cronograma, nombre_mes, PDF_CSS, amortizar, dec
 from models import db, Empleado
+from presupuesto_sql import presupuesto_sql
 
 #!#######################################ARREGLO DE VISUALIZACION DATA EN FORMHTML##################################################
 
@@ -46,18 +68,22 @@ def prestamos_index():
     totals_dni = None
 
     if len(dni) == 8 and dni.isdigit():
-        q = Prestamo.query.filter(
-            Prestamo.dni == dni, Prestamo.estado != "Cancelado"
-        ).order_by(Prestamo.id.asc())
+        q = (
+            Prestamo.query.join(Empleado, Prestamo.empleado_id == Empleado.id)
+            .options(contains_eager(Prestamo.empleado))
+            .filter(Empleado.dni == dni, Prestamo.estado != "Cancelado")
+            .order_by(Prestamo.id.asc())
+        )
         pagination = q.paginate(page=page, per_page=per_page, error_out=False)
         prestamos = pagination.items
 
         total_monto, total_saldo = (
             db.session.query(
-                func.coalesce(func.sum(Prestamo.monto), 0.0),
-                func.coalesce(func.sum(Prestamo.saldo), 0.0),
+                func.coalesce(func.sum(Prestamo.monto_total), 0),
+                func.coalesce(func.sum(Prestamo.saldo_pendiente), 0),
             )
-            .filter(Prestamo.dni == dni)
+            .join(Empleado, Prestamo.empleado_id == Empleado.id)
+            .filter(Empleado.dni == dni)
             .one()
         )
         totals_dni = {
@@ -75,12 +101,13 @@ def prestamos_index():
         prestamos = (
             db.session.query(Prestamo)
             .join(sub, Prestamo.id == sub.c.id)
+            .options(joinedload(Prestamo.empleado))
             .order_by(Prestamo.id.asc())
             .all()
         )
 
-    page_totals["monto"] = sum(float(p.monto or 0) for p in prestamos)
-    page_totals["saldo"] = sum(float(p.saldo or 0) for p in prestamos)
+    page_totals["monto"] = sum(float(p.monto_total or 0) for p in prestamos)
+    page_totals["saldo"] = sum(float(p.saldo_pendiente or 0) for p in prestamos)
 
     return render_template(
         "prestamos/index.html",
@@ -252,294 +279,331 @@ def api_crear_prestamo():
     )
 
 
-@prestamos_bp.route("/prestamos/<int:prestamo_id>/pdf")
-def pdf_prestamo(prestamo_id: int):
-    import os, unicodedata
-
-    p = Prestamo.query.get_or_404(prestamo_id)
+def _bandera(valor) -> bool:
+    return str(valor).strip().lower() in ("1", "true", "si", "sí", "on")
 
-    # ---- Helper para limpiar y poner en MAYÚSCULAS con '_' ----
-    def _slug_upper(s: str) -> str:
-        if not s:
-            return ""
-        s = unicodedata.normalize("NFKD", s)
-        s = "".join(ch for ch in s if not unicodedata.combining(ch))  # quita tildes
-        s = s.upper().replace(" ", "_")
-        s = "".join(
-            ch for ch in s if ch.isalnum() or ch in ("_", "-")
-        )  # seguro p/archivo
-        return s
 
+@prestamos_bp.route("/api/prestamos/importar", methods=["POST"])
+@login_required
+@presupuesto_sql(None)  # crece con el número de lotes
+def api_importar_prestamos():
+    """
+    Carga masiva. Multipart con 'archivo' (.xlsx/.csv) o JSON: una lista de
+    préstamos o {"prestamos": [...], "usuario", "estricto", "simular"}.
+    Cada préstamo lleva las mismas llaves que POST /api/prestamos.
+    """
+    opciones = request.form if request.files else (request.args or {})
+    try:
+        if request.files:
+            archivo = request.files.get("archivo")
+            if not archivo or not archivo.filename:
+                return jsonify({"error": "Adjunta un archivo .xlsx o .csv en 'archivo'."}), 400
+            reporte = importar_prestamos_archivo(
+                archivo.stream,
+                archivo.filename,
+                usuario=opciones.get("usuario") or "importacion",
+                estricto=_bandera(opciones.get("estricto")),
+                simular=_bandera(opciones.get("simular")),
+            )
+        else:
+            d = request.get_json(force=True, silent=True)
+            if isinstance(d, dict):
+                opciones, d = {**opciones, **d}, d.get("prestamos")
+            reporte = importar_prestamos_json(
+                d,
+                usuario=opciones.get("usuario") or "importacion",
+                estricto=_bandera(opciones.get("estricto")),
+                simular=_bandera(opciones.get("simular")),
+            )
+    except ErrorImportacion as e:
+        return jsonify({"error": str(e)}), 400
+    except SQLAlchemyError as e:
+        current_app.logger.exception("Falló la importación de préstamos")
+        return jsonify({"error": f"No se guardó nada: {e.__class__.__name__}"}), 500
+    return jsonify(reporte)
+
+
+@prestamos_bp.cli.command("importar")
+@click.argument("archivo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--usuario", default="importacion", show_default=True, help="Valor de creado_por.")
+@click.option("--estricto", is_flag=True, help="No guardar nada si alguna fila tiene errores.")
+@click.option("--simular", is_flag=True, help="Validar y armar cronogramas sin escribir.")
+def importar_prestamos_cli(archivo, usuario, estricto, simular):
+    """Importa préstamos y sus cuotas desde un .xlsx/.csv (flask prestamos importar)."""
+    try:
+        reporte = importar_prestamos_archivo(archivo, usuario=usuario, estricto=estricto, simular=simular)
+    except ErrorImportacion as e:
+        raise click.ClickException(str(e))
+    if simular:
+        resumen = f"{reporte['prestamos_validos']} préstamos / {reporte['cuotas_a_crear']} cuotas válidos (simulación)"
+    else:
+        resumen = f"{reporte['prestamos_creados']} préstamos y {reporte['cuotas_creadas']} cuotas creados"
+    click.echo(f"{reporte['filas']} filas: {resumen}")
+    for err in reporte["errores"]:
+        click.echo(f"  fila {err['fila']} [{err['dni'] or '-'}]: {'; '.join(err['errores'])}", err=True)
+    if reporte["errores"]:
+        raise SystemExit(1)
+
+
+@prestamos_bp.cli.command("reconciliar-saldos")
+@click.option("--reparar", is_flag=True, help="Recalcular los préstamos con diferencias.")
+@click.option("-v", "--detalle", is_flag=True, help="Mostrar cada diferencia.")
+def reconciliar_saldos_cli(reparar, detalle):
+    """Compara saldo/cuotas pendientes/próxima guardados contra las cuotas (código 1 si difieren)."""
+    malas = reconciliar(db.session, reparar=reparar)
+    db.session.commit()
+    if not malas:
+        click.echo("Saldos guardados al día.")
+        return
+    click.echo(f"{len(malas)} préstamos con diferencias" + (": reparados." if reparar else "."))
+    if detalle:
+        for d in malas:
+            click.echo(f"  préstamo {d['prestamo_id']}: guardado {d['guardado']} / esperado {d['esperado']}")
+    if not reparar:
+        raise SystemExit(1)
+
+
+def _con_cuotas_y_empleado():
+    """Opciones de carga para vistas que leen ``p.cuotas`` y ``p.empleado``."""
+    return (selectinload(Prestamo.cuotas), joinedload(Prestamo.empleado))
+
+
+def _slug_upper(s: str) -> str:
+    """Limpia y pone en MAYÚSCULAS con '_' (seguro para nombre de archivo)."""
+    if not s:
+        return ""
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))  # quita tildes
+    s = s.upper().replace(" ", "_")
+    s = "".join(ch for ch in s if ch.isalnum() or ch in ("_", "-"))
+    return s
+
+
+def _contexto_pdf_prestamo(p: Prestamo, hoy: date | None = None) -> dict:
+    """Contexto del GP-R-004, común a la plantilla HTML y a ReportLab."""
     emp = p.empleado
-    emp_nombre = nombre_empleado(emp)
-
-    html = render_template(
-        "prestamos/pdf.html",
+    return dict(
         p=p,
         emp=emp,
-        emp_nombre=emp_nombre,
+        emp_nombre=nombre_empleado(emp),
         cuotas=p.cuotas,
         nombre_mes=nombre_mes,
-        hoy=date.today(),
-    )
-    pdf = HTML(string=html, base_url=request.url_root).write_pdf(
-        stylesheets=[CSS(string=PDF_CSS)]
+        hoy=hoy or date.today(),
     )
 
-    # ---- Construcción del nombre final ----
+
+def _html_prestamo(p: Prestamo, hoy: date | None = None) -> str:
+    return render_template("prestamos/pdf.html", **_contexto_pdf_prestamo(p, hoy))
+
+
+MOTORES_PDF = ("weasyprint", "reportlab")
+
+
+def _motor_pdf() -> str:
+    """?motor=weasyprint|reportlab; por defecto PRESTAMO_PDF_MOTOR (weasyprint)."""
+    motor = (
+        request.args.get("motor")
+        or current_app.config.get("PRESTAMO_PDF_MOTOR")
+        or os.getenv("PRESTAMO_PDF_MOTOR")
+        or "weasyprint"
+    ).strip().lower()
+    return motor if motor in MOTORES_PDF else "weasyprint"
+
+
+def _render_pdf_prestamo(p: Prestamo, motor: str, hoy: date | None = None) -> bytes:
+    if motor == "reportlab":
+        return render_prestamo_reportlab(**_contexto_pdf_prestamo(p, hoy))
+    return render_pdf(_html_prestamo(p, hoy), css=(PDF_CSS,))
+
+
+def _nombre_pdf_prestamo(p: Prestamo) -> str:
     fecha_str = (
         p.fecha_firma.strftime("%Y-%m-%d")
         if p.fecha_firma
         else date.today().strftime("%Y-%m-%d")
     )
     tipo_str = _slug_upper(p.tipo or "OTROS")
-    nombre_str = _slug_upper(emp_nombre or "")
-    filename = f"{fecha_str}_DESCUENTO_{tipo_str}_{nombre_str}.pdf"
+    nombre_str = _slug_upper(nombre_empleado(p.empleado) or "")
+    return f"{fecha_str}_DESCUENTO_{tipo_str}_{nombre_str}.pdf"
 
-    # ---- Guardar en disco con ese nombre ----
-    ruta = os.path.join("storage", "prestamos")
-    os.makedirs(ruta, exist_ok=True)
-    fullpath = os.path.join(ruta, filename)
-    with open(fullpath, "wb") as f:
-        f.write(pdf)
 
-    # ---- Persistir registro del documento ----
-    db.session.add(Documento(prestamo_id=p.id, ruta_pdf=fullpath))
-    db.session.commit()
+@prestamos_bp.route("/prestamos/<int:prestamo_id>/pdf")
+def pdf_prestamo(prestamo_id: int):
+    p = Prestamo.query.options(*_con_cuotas_y_empleado()).get_or_404(prestamo_id)
+    filename = _nombre_pdf_prestamo(p)
+
+    # ?vista=html: mismo contenido en HTML, sin render ni registro de Documento
+    if pide_vista_html():
+        return respuesta_vista_html(_html_prestamo(p), css=(PDF_CSS,), titulo=filename)
+
+    # Reutiliza el PDF emitido si el préstamo no cambió (y es del mismo día:
+    # la huella incluye la 'Fecha:' impresa); si no, renderiza, registra el
+    # Documento y lo guarda a disco fuera de la petición
+    motor = _motor_pdf()
+    hoy = date.today()
+    pdf = obtener_pdf_prestamo(
+        p, lambda: _render_pdf_prestamo(p, motor, hoy), huella=huella_prestamo(p, motor, hoy)
+    )
 
-    # ---- Enviar con nombre de descarga correcto ----
-    return send_file(fullpath, as_attachment=True, download_name=filename)
+    # ---- Enviar desde memoria con nombre de descarga correcto ----
+    return send_file(
+        BytesIO(pdf),
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=filename,
+    )
 
 
-@prestamos_bp.route("/prestamos/export-excel")
-def export_excel():
-    import os
-    import pandas as pd
-    from pandas import ExcelWriter
-    from datetime import date as _date
-    from flask import send_file
-    from openpyxl.utils import column_index_from_string, get_column_letter
-
-    # ------------------ Datos base ------------------
-    Qp = (
-        db.session.query(Prestamo, Empleado)
-        .join(Empleado, Prestamo.empleado_id == Empleado.id)
-        .all()
-    )
-    rows_p = [
-        {
-            "ID_PRESTAMO": p.id,
-            "DNI": e.dni,
-            "NOMBRE": nombre_empleado(e),
-            "PRESTAMO": (
-                p.tipo if p.tipo != "Otros" else f"Otros: {p.motivo_especifico or ''}"
-            ),
-            "MONTO TOTAL": float(p.monto_total),
-            "FECHA DE SOLICITUD": p.fecha_solicitud.strftime("%Y-%m-%d"),
-            "AÑO": p.fecha_solicitud.year,
-            "MONTO DE AMORTIZACIÓN": (
-                float(sum(a.monto for a in p.amortizaciones))
-                if p.amortizaciones
-                else 0.0
-            ),
-            "FECHA DE AMORTIZACIÓN": max(
-                (a.fecha for a in p.amortizaciones), default=None
-            ),
-            "OBS DE AMORTIZACIÓN": (
-                "; ".join(filter(None, [a.observacion for a in p.amortizaciones]))
-                if p.amortizaciones
-                else ""
-            ),
-        }
-        for p, e in Qp
-    ]
+def _pdf_guardado_vigente(p: Prestamo, guardados, hoy: date) -> bytes | None:
+    """PDF guardado si su huella coincide con el estado actual (y la fecha ``hoy``)."""
+    return leer_pdf(guardados.get((p.id, huella_prestamo(p, fecha=hoy))))
 
-    Qc = (
-        db.session.query(Cuota, Prestamo, Empleado)
-        .join(Prestamo, Cuota.prestamo_id == Prestamo.id)
-        .join(Empleado, Prestamo.empleado_id == Empleado.id)
-        .all()
+
+def ids_prestamos_lote(args) -> list:
+    """
+    IDs de los préstamos que cumplan los filtros de ``args`` (request.args o
+    MultiDict de una tarea):
+    - tipo: uno o varios tipos de préstamo
+    - desde, hasta: rango sobre fecha_firma (AAAA-MM-DD, inclusivo)
+    - dni: uno o varios
+    - estado: estado del préstamo (por defecto todos)
+    Lanza ValueError si las fechas son inválidas.
+    """
+    q = db.session.query(Prestamo.id).join(
+        Empleado, Prestamo.empleado_id == Empleado.id
     )
-    rows_c = [
-        {
-            "ID_PRESTAMO": p.id,
-            "DNI": e.dni,
-            "FECHA_COBRO": (
-                _date(c.anio, c.mes, 1).strftime("%Y-%m-%d") if c.anio and c.mes else ""
-            ),
-            "ETIQUETA": c.etiqueta,
-            "MONTO": float(c.monto),
-            "ESTADO": (c.estado or "Pendiente").strip(),
-        }
-        for c, p, e in Qc
-    ]
-
-    df_p = pd.DataFrame(rows_p)
-    df_c = pd.DataFrame(rows_c)
-
-    # ------------------ Cronograma en columnas (MISMA hoja) ------------------
-    month_cols = []
-    if not df_c.empty:
-        df_c["ESTADO"] = df_c["ESTADO"].fillna("Pendiente").astype(str)
-        mask_amort = df_c["ESTADO"].str.strip().str.lower().eq("amortizada")
-        df_c.loc[mask_amort, "MONTO"] = 0.0
-
-        MES_ABBR = {
-            1: "ene",
-            2: "feb",
-            3: "mar",
-            4: "abr",
-            5: "may",
-            6: "jun",
-            7: "jul",
-            8: "ago",
-            9: "set",
-            10: "oct",
-            11: "nov",
-            12: "dic",
+    tipos = lista_arg("tipo", args)
+    if tipos:
+        q = q.filter(Prestamo.tipo.in_(tipos))
+    estado = (args.get("estado") or "").strip()
+    if estado:
+        q = q.filter(Prestamo.estado == estado)
+    desde = fecha_arg("desde", args)
+    hasta = fecha_arg("hasta", args)
+    if desde:
+        q = q.filter(Prestamo.fecha_firma >= desde)
+    if hasta:
+        q = q.filter(Prestamo.fecha_firma <= hasta)
+    dnis = lista_arg("dni", args)
+    if dnis:
+        q = q.filter(Empleado.dni.in_(dnis))
+    return [pid for (pid,) in q.order_by(Prestamo.id).all()]
+
+
+LOTE_PDF = 50
+
+
+def documentos_prestamos_lote(ids):
+    """DocumentoLote por préstamo, reutilizando los PDF guardados vigentes."""
+    # (prestamo_id, hash) -> ruta del último PDF guardado con esa huella
+    guardados = {}
+    for d in (
+        Documento.query.filter(
+            Documento.prestamo_id.in_(ids), Documento.hash.isnot(None)
+        )
+        .order_by(Documento.emitido_en.asc())
+        .all()
+    ):
+        guardados[(d.prestamo_id, d.hash)] = d.ruta_pdf
+
+    hoy = date.today()
+    # De a LOTE_PDF préstamos (con cuotas y empleado) mientras avanza el ZIP
+    for ini in range(0, len(ids), LOTE_PDF):
+        bloque = ids[ini : ini + LOTE_PDF]
+        cargados = {
+            p.id: p
+            for p in Prestamo.query.options(*_con_cuotas_y_empleado()).filter(
+                Prestamo.id.in_(bloque)
+            )
         }
+        for pid in bloque:
+            p = cargados[pid]
+            nombre = _nombre_pdf_prestamo(p)
+            pdf = _pdf_guardado_vigente(p, guardados, hoy)
+            if pdf is not None:
+                yield DocumentoLote(nombre, pdf=pdf)
+            else:
+                yield DocumentoLote(nombre, html=_html_prestamo(p, hoy), css=(PDF_CSS,))
 
-        df_c["FECHA_COBRO"] = pd.to_datetime(df_c["FECHA_COBRO"], errors="coerce")
-        df_c["is_grati"] = df_c["ETIQUETA"].str.contains("grat", case=False, na=False)
 
-        df_c["col"] = df_c["FECHA_COBRO"].apply(
-            lambda d: (
-                f"{MES_ABBR.get(d.month,'')} {str(d.year)[-2:]}"
-                if pd.notnull(d)
-                else None
-            )
-        )
-        df_c.loc[df_c["is_grati"], "col"] = df_c.loc[
-            df_c["is_grati"], "FECHA_COBRO"
-        ].apply(
-            lambda d: (
-                f"grati {MES_ABBR.get(d.month,'')} {str(d.year)[-2:]}"
-                if pd.notnull(d)
-                else None
-            )
-        )
+@prestamos_bp.route("/prestamos/pdf/lote")
+@login_required
+def pdf_prestamos_lote():
+    """
+    ZIP con los PDF GP-R-004 de los préstamos filtrados (ver
+    ``ids_prestamos_lote``). Reutiliza los PDF guardados cuyo contenido sigue
+    vigente. Con ?async=1 se encola como tarea y responde 202.
+    """
+    if request.args.get("async"):
+        return encolar_desde_request("pdf_lote_prestamos")
+    try:
+        ids = ids_prestamos_lote(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not ids:
+        return jsonify({"error": "No hay préstamos para los filtros indicados"}), 404
+
+    nombre_zip = f"prestamos_{date.today().isoformat()}.zip"
+    return Response(
+        stream_with_context(
+            zip_en_stream(pdfs_en_paralelo(documentos_prestamos_lote(ids)))
+        ),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{nombre_zip}"'},
+    )
 
-        today = pd.Timestamp.today().normalize()
-
-        def sort_key(r):
-            d = r["FECHA_COBRO"]
-            if pd.isna(d):
-                return 9e9
-            months = (d.year - today.year) * 12 + (d.month - today.month)
-            return months + (-0.5 if r["is_grati"] else 0.0)
-
-        df_c["sort_key"] = df_c.apply(sort_key, axis=1)
-        col_order = (
-            df_c.loc[df_c["col"].notna(), ["col", "sort_key"]]
-            .drop_duplicates()
-            .sort_values("sort_key")
-        )["col"].tolist()
-
-        pivot_mes = (
-            pd.pivot_table(
-                df_c,
-                index=["ID_PRESTAMO"],
-                columns=["col"],
-                values="MONTO",
-                aggfunc="sum",
-            )
-            .reindex(columns=col_order)
-            .fillna(0.0)
-            .reset_index()
-        )
 
-        df_p = df_p.merge(pivot_mes, on="ID_PRESTAMO", how="left")
-        month_cols = [c for c in col_order if c in df_p.columns]
-        if month_cols:
-            df_p[month_cols] = df_p[month_cols].fillna(0.0)
-            base_cols = list(df_p.columns)
-            base_cols_wo = [c for c in base_cols if c not in month_cols]
-            pos = base_cols_wo.index("AÑO") + 1
-            new_order = base_cols_wo[:pos] + month_cols + base_cols_wo[pos:]
-            df_p = df_p[new_order]
-
-    # ------------------ Pivot extra (opcional) ------------------
-    pivot = (
-        pd.pivot_table(
-            df_c, index=["DNI"], columns=["ETIQUETA"], values="MONTO", aggfunc="sum"
-        )
-        .fillna(0)
-        .reset_index()
-        if not df_c.empty
-        else pd.DataFrame()
+@prestamos_bp.route("/prestamos/export-excel")
+def export_excel():
+    # ?async=1: el Excel se arma en una tarea y se descarga desde /tareas/<id>
+    if request.args.get("async"):
+        return encolar_desde_request("export_excel")
+    # Libro cacheado por versión de datos y mes (o temporal propio de la petición);
+    # ?snapshot=1 o EXPORT_EXCEL_SNAPSHOT=1 guardan además una copia con fecha
+    f, version, clave = abrir_excel_prestamos()
+    snapshot = None
+    if request.args.get("snapshot") or os.getenv("EXPORT_EXCEL_SNAPSHOT") == "1":
+        snapshot = guardar_snapshot(f)
+    resp = send_file(
+        f,
+        as_attachment=True,
+        download_name="Prestamos.xlsx",
+        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        etag=f"prestamos-{clave}" if clave is not None else False,
     )
+    resp.headers["Cache-Control"] = "no-cache" if clave is not None else "no-store"
+    if version is not None:
+        resp.headers["X-Datos-Version"] = str(version)
+    if snapshot:
+        resp.headers["X-Export-Snapshot"] = os.path.basename(snapshot)
+    return resp
 
-    # ------------------ Escribir Excel + FORMATO numérico ------------------
-    os.makedirs("storage/exports", exist_ok=True)
-    out_path = os.path.join("storage/exports", "Prestamos.xlsx")
-    with ExcelWriter(out_path, engine="openpyxl") as w:
-        df_p.to_excel(w, index=False, sheet_name="Prestamos")
-        if not pivot.empty:
-            pivot.to_excel(w, index=False, sheet_name="Reporte_Pivot")
-
-        # ===== Formato en hoja Prestamos =====
-        ws = w.sheets["Prestamos"]
-
-        # Mapa encabezado -> letra de columna
-        header_to_col_letter = {cell.value: cell.column_letter for cell in ws[1]}
-
-        # Columnas a formatear (numéricas)
-        targets = ["MONTO TOTAL", "MONTO DE AMORTIZACIÓN"] + month_cols
-
-        for header in targets:
-            col_letter = header_to_col_letter.get(header)
-            if not col_letter:
-                continue
-
-            col_idx = column_index_from_string(col_letter)
-            # Aplica formato a TODA la columna desde fila 2 a max_row
-            for row in ws.iter_rows(
-                min_row=2, max_row=ws.max_row, min_col=col_idx, max_col=col_idx
-            ):
-                cell = row[0]
-                # Si vino como texto por alguna razón, intenta convertir
-                if isinstance(cell.value, str):
-                    try:
-                        cell.value = float(cell.value)
-                    except Exception:
-                        pass
-                if isinstance(cell.value, (int, float)):
-                    cell.number_format = "#,##0.00"
-
-            # Ajuste de ancho
-            ws.column_dimensions[col_letter].width = max(12, len(header) + 2)
-
-        # Autofiltro y panes inmovilizados (ayuda de lectura)
-        ws.auto_filter.ref = ws.dimensions
-        ws.freeze_panes = "A2"
-
-        # ===== Formato en hoja Reporte_Pivot (si existe) =====
-        if "Reporte_Pivot" in w.sheets:
-            ws2 = w.sheets["Reporte_Pivot"]
-            ws2.auto_filter.ref = ws2.dimensions
-            ws2.freeze_panes = "A2"
-            # Formatear todas las columnas numéricas excepto la 1 (DNI)
-            for j, cell in enumerate(ws2[1], start=1):
-                if j == 1:
-                    continue
-                col_letter = cell.column_letter
-                col_idx = column_index_from_string(col_letter)
-                for row in ws2.iter_rows(
-                    min_row=2, max_row=ws2.max_row, min_col=col_idx, max_col=col_idx
-                ):
-                    c = row[0]
-                    if isinstance(c.value, str):
-                        try:
-                            c.value = float(c.value)
-                        except Exception:
-                            pass
-                    if isinstance(c.value, (int, float)):
-                        c.number_format = "#,##0.00"
-                ws2.column_dimensions[col_letter].width = max(
-                    12, len(str(cell.value)) + 2
-                )
 
-    return send_file(out_path, as_attachment=True, download_name="Prestamos.xlsx")
+@prestamos_bp.route("/prestamos/export/<conjunto>")
+@login_required
+def export_datos(conjunto: str):
+    """
+    prestamos (cronograma en columnas) o cuotas, en streaming:
+    ?formato=csv (gzip, default) | parquet | arrow (IPC stream).
+    """
+    formato = (request.args.get("formato") or "csv").strip().lower()
+    if conjunto not in CONJUNTOS:
+        return jsonify({"error": f"Conjunto desconocido: {conjunto}"}), 404
+    if formato not in FORMATOS:
+        return jsonify({"error": f"Formato no soportado: {formato}"}), 400
+    if not formato_disponible(formato):
+        return jsonify({"error": f"El formato {formato} requiere pyarrow en el servidor"}), 501
+
+    escritor, mimetype, ext = FORMATOS[formato]
+    nombre = f"{conjunto}_{date.today().isoformat()}.{ext}"
+    return Response(
+        stream_with_context(escritor(CONJUNTOS[conjunto]())),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{nombre}"',
+            "Cache-Control": "no-store",
+        },
+    )
 
 
 @prestamos_bp.route("/api/prestamos")
@@ -547,9 +611,8 @@ def api_listar_prestamos():
     dni = (request.args.get("dni") or "").strip()
     limit = request.args.get("limit", type=int)
 
-    base = db.session.query(Prestamo, Empleado).join(
-        Empleado, Prestamo.empleado_id == Empleado.id
-    )
+    # Amortizaciones agregadas en SQL; saldo guardado en la fila del préstamo
+    base = prestamos_con_amortizaciones().options(joinedload(Prestamo.proxima))
 
     if dni:
         q = base.filter(Empleado.dni == dni, Prestamo.estado != "Cancelado").order_by(Prestamo.id.asc())
@@ -564,13 +627,8 @@ def api_listar_prestamos():
         )
         q = base.join(sub, Prestamo.id == sub.c.id).order_by(Prestamo.id.asc())
 
-    rows = q.all()
-
     data = []
-    for p, e in rows:
-        saldo = float(
-            sum(c.monto for c in p.cuotas if (c.estado or "Pendiente") == "Pendiente")
-        )
+    for p, e, amort_total, amort_fecha, amort_obs in q.all():
         data.append(
             {
                 "id": p.id,
@@ -578,9 +636,16 @@ def api_listar_prestamos():
                 "nombre": nombre_empleado(e),
                 "tipo": p.tipo,
                 "monto_total": float(p.monto_total),
-                "saldo_pendiente": round(saldo, 2),
+                "saldo_pendiente": float(p.saldo_pendiente),
+                "cuotas_pendientes": p.cuotas_pendientes,
+                "proxima_cuota": cuota_json(p.proxima),
                 "estado": p.estado,
                 "fecha_solicitud": p.fecha_solicitud.strftime("%Y-%m-%d"),
+                "monto_amortizado": round(float(amort_total or 0), 2),
+                "fecha_ultima_amortizacion": (
+                    amort_fecha.strftime("%Y-%m-%d") if amort_fecha else None
+                ),
+                "obs_amortizacion": amort_obs or "",
             }
         )
     return jsonify(data)
@@ -600,9 +665,12 @@ def api_amortizacion(prestamo_id: int):
 @prestamos_bp.route("/api/prestamos/<int:prestamo_id>/cuotas", methods=["GET"])
 def api_cuotas_prestamo(prestamo_id: int):
     try:
-        p = Prestamo.query.get_or_404(prestamo_id)
+        fila = saldo_prestamo(prestamo_id)
+        if fila is None:
+            abort(404)
+        p, emp, saldo, pendientes, proxima = fila
         cuotas = []
-        for c in p.cuotas:
+        for c in Cuota.query.filter_by(prestamo_id=p.id).order_by(Cuota.orden):
             anio = int(c.anio) if c.anio is not None else 0
             mes = int(c.mes) if c.mes is not None else 0
             fecha_cobro = f"{anio:04d}-{mes:02d}-01" if anio and mes else ""
@@ -621,18 +689,21 @@ def api_cuotas_prestamo(prestamo_id: int):
                     ),
                 }
             )
-        saldo = round(sum(r["monto"] for r in cuotas if r["estado"] == "Pendiente"), 2)
         return jsonify(
             {
                 "id": p.id,
-                "dni": p.empleado.dni,
-                "nombre": nombre_empleado(p.empleado),
+                "dni": emp.dni,
+                "nombre": nombre_empleado(emp),
                 "tipo": p.tipo,
                 "monto_total": float(p.monto_total or 0),
-                "saldo_pendiente": saldo,
+                "saldo_pendiente": float(saldo),
+                "cuotas_pendientes": pendientes,
+                "proxima_cuota": cuota_json(proxima),
                 "cuotas": cuotas,
             }
         )
+    except HTTPException:
+        raise
     except Exception:
         current_app.logger.exception("Error en /api/prestamos/<id>/cuotas")
         return jsonify({"error": "Error interno"}), 500
@@ -642,17 +713,21 @@ def api_cuotas_prestamo(prestamo_id: int):
 @prestamos_bp.route("/api/prestamos/<int:prestamo_id>/saldo", methods=["GET"])
 def api_saldo_prestamo(prestamo_id: int):
     try:
-        p = Prestamo.query.get_or_404(prestamo_id)
-        # Misma regla que usas en /api/prestamos y /api/prestamos/<id>/cuotas
-        saldo = round(
-            sum(
-                float(c.monto or 0)
-                for c in p.cuotas
-                if (c.estado or "Pendiente").strip() == "Pendiente"
-            ),
-            2,
+        # Columnas guardadas, igual que /api/prestamos y /api/prestamos/<id>/cuotas
+        fila = saldo_prestamo(prestamo_id)
+        if fila is None:
+            abort(404)
+        p, _emp, saldo, pendientes, proxima = fila
+        return jsonify(
+            {
+                "id": p.id,
+                "saldo": float(saldo),
+                "cuotas_pendientes": pendientes,
+                "proxima_cuota": cuota_json(proxima),
+            }
         )
-        return jsonify({"id": p.id, "saldo": saldo})
+    except HTTPException:
+        raise
     except Exception:
         current_app.logger.exception("Error en /api/prestamos/<id>/saldo")
         return jsonify({"error": "Error interno"}), 500
@@ -755,12 +830,11 @@ def _collect_pdf_paths(prestamo_id: int):
 
 
 def _remove_files(paths):
-    for pth in paths or []:
-        try:
-            if pth and os.path.exists(pth):
-                os.remove(pth)
-        except Exception:
-            current_app.logger.warning("No se pudo borrar archivo %s", pth)
+    # Solo borra lo que ya no referencia ningún Documento (contenido compartido)
+    try:
+        liberar_pdfs(paths or [])
+    except Exception:
+        current_app.logger.exception("No se pudieron liberar PDFs %s", paths)
 
 
 # ======= API: borrado duro =======
@@ -841,46 +915,8 @@ def api_cerrar_mes():
         fecha_desc = datetime.strptime(fdesc, "%Y-%m-%d").date()
         dni = (d.get("dni") or "").strip()
 
-        q = (
-            db.session.query(Cuota)
-            .join(Prestamo, Cuota.prestamo_id == Prestamo.id)
-            .join(Empleado, Prestamo.empleado_id == Empleado.id)
-            .filter(Cuota.estado == "Pendiente", Cuota.anio == anio, Cuota.mes == mes)
-        )
-        if dni:
-            q = q.filter(Empleado.dni == dni)
-
-        cuotas = q.all()
-        total = Decimal("0.00")
-        pids_tocados = set()
-
-        for c in cuotas:
-            c.estado = "Descontada"
-            c.fecha_descuento_real = fecha_desc
-            pids_tocados.add(c.prestamo_id)
-            total += Decimal(c.monto)
-
-        cancelados = 0
-        parciales = 0
-        for pid in pids_tocados:
-            p = Prestamo.query.get(pid)
-            if all(cc.estado != "Pendiente" for cc in p.cuotas):
-                p.estado = "Cancelado"
-                cancelados += 1
-            else:
-                p.estado = "Amortizado Parcial"
-                parciales += 1
-
-        db.session.commit()
-        return jsonify(
-            {
-                "ok": True,
-                "cerradas": len(cuotas),
-                "monto": float(total.quantize(Decimal("0.01"))),
-                "prestamos_cancelados": cancelados,
-                "prestamos_parciales": parciales,
-            }
-        )
+        # UPDATE por conjuntos + estados en un CASE, con candado (prestamos/cierre.py)
+        return jsonify(cerrar_mes(anio, mes, fecha_desc, dni))
     except Exception as e:
         db.session.rollback()
         current_app.logger.exception("Fallo en /api/prestamos/cerrar_mes")
@@ -917,56 +953,8 @@ def api_aperturar_mes():
             bool(d.get("limpiar_fecha")) if d.get("limpiar_fecha") is not None else True
         )
 
-        # Solo reabrimos cuotas que fueron cerradas por planilla:
-        q = (
-            db.session.query(Cuota)
-            .join(Prestamo, Cuota.prestamo_id == Prestamo.id)
-            .join(Empleado, Prestamo.empleado_id == Empleado.id)
-            .filter(
-                Cuota.estado == "Descontada",
-                Cuota.anio == anio,
-                Cuota.mes == mes,
-            )
-        )
-        if dni:
-            q = q.filter(Empleado.dni == dni)
-
-        cuotas = q.all()
-        if not cuotas:
-            return jsonify({"ok": True, "reabiertas": 0, "prestamos_afectados": 0})
-
-        reabiertas = 0
-        pids_tocados = set()
-
-        for c in cuotas:
-            c.estado = "Pendiente"
-            if limpiar_fecha:
-                c.fecha_descuento_real = None
-            pids_tocados.add(c.prestamo_id)
-            reabiertas += 1
-
-        # Recalcular estado de cada préstamo afectado:
-        for pid in pids_tocados:
-            p = Prestamo.query.get(pid)
-            n_total = len(p.cuotas or [])
-            n_pend = sum(
-                1 for cc in p.cuotas if (cc.estado or "Pendiente") == "Pendiente"
-            )
-            if n_pend == n_total:
-                p.estado = "Emitido"
-            elif n_pend == 0:
-                p.estado = "Cancelado"
-            else:
-                p.estado = "Amortizado Parcial"
-
-        db.session.commit()
-        return jsonify(
-            {
-                "ok": True,
-                "reabiertas": reabiertas,
-                "prestamos_afectados": len(pids_tocados),
-            }
-        )
+        # Solo reabrimos cuotas que fueron cerradas por planilla ('Descontada')
+        return jsonify(aperturar_mes(anio, mes, dni, limpiar_fecha))
 
     except Exception as e:
         db.session.rollback()
@@ -0,0 +1,181 @@
+# prestamos/saldos.py
+"""
+Columnas guardadas de saldo en ``Prestamo``: ``saldo_pendiente``,
+``cuotas_pendientes`` y ``proxima_cuota`` (``orden`` de la próxima cuota
+'Pendiente').
+
+Se recalculan con un UPDATE por lotes de préstamos, en la misma transacción
+que el cambio a sus cuotas: por flush del ORM (``after_flush``) y por
+INSERT/UPDATE/DELETE masivos del ORM sobre ``Cuota`` (``do_orm_execute``).
+``amortizar``, el cierre/apertura de mes, la importación y el borrado pasan
+por ahí. Así los listados leen una fila por préstamo, sin agrupar cuotas.
+
+Las escrituras con SQL directo (fuera del ORM) no los actualizan; para eso
+está ``flask prestamos reconciliar-saldos [--reparar]``, que compara lo
+guardado contra las cuotas.
+"""
+from __future__ import annotations
+import logging
+import os
+from itertools import chain
+
+from sqlalchemy import and_, event, func, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from .consultas import subconsulta_saldos
+from .models import Prestamo, Cuota
+
+log = logging.getLogger(__name__)
+
+LOTE = int(os.getenv("SALDOS_LOTE", "1000"))  # préstamos por UPDATE
+CAMPOS = ("saldo_pendiente", "cuotas_pendientes", "proxima_cuota")
+
+_tabla = Prestamo.__table__
+_TOCADOS = "saldos_prestamos_tocados"
+
+
+def _esperados() -> dict:
+    """Subconsultas correlacionadas (contra ``prestamos``) con el valor correcto de cada campo."""
+    pendientes = and_(Cuota.prestamo_id == _tabla.c.id, Cuota.estado == "Pendiente")
+    return {
+        "saldo_pendiente": select(func.round(func.coalesce(func.sum(Cuota.monto), 0), 2))
+        .where(pendientes)
+        .scalar_subquery(),
+        "cuotas_pendientes": select(func.count(Cuota.id)).where(pendientes).scalar_subquery(),
+        "proxima_cuota": select(func.min(Cuota.orden)).where(pendientes).scalar_subquery(),
+    }
+
+
+def recalcular(conn, ids=None) -> int:
+    """
+    Recalcula los campos de los préstamos ``ids`` (todos si es None) con
+    ``conn`` (Connection, dentro de la transacción en curso). Devuelve las
+    filas actualizadas.
+    """
+    stmt = update(_tabla).values(**_esperados())
+    if ids is None:
+        return conn.execute(stmt).rowcount
+    ids = sorted(i for i in set(ids) if i is not None)
+    n = 0
+    for i in range(0, len(ids), LOTE):
+        n += conn.execute(stmt.where(_tabla.c.id.in_(ids[i : i + LOTE]))).rowcount
+    return n
+
+
+def diferencias(session: Session, limite: int | None = None) -> list:
+    """Préstamos cuyo valor guardado no coincide con sus cuotas (guardado vs. esperado)."""
+    s = subconsulta_saldos()
+    esperado = {
+        "saldo_pendiente": func.round(func.coalesce(s.c.saldo, 0), 2),
+        "cuotas_pendientes": func.coalesce(s.c.pendientes, 0),
+        "proxima_cuota": s.c.proxima_orden,
+    }
+    q = (
+        select(Prestamo.id, *(getattr(Prestamo, c) for c in CAMPOS), *esperado.values())
+        .outerjoin(s, s.c.prestamo_id == Prestamo.id)
+        .where(or_(*(getattr(Prestamo, c).is_distinct_from(e) for c, e in esperado.items())))
+        .order_by(Prestamo.id)
+        .limit(limite)
+    )
+    filas = []
+    for pid, *valores in session.execute(q):
+        guardado, correcto = valores[: len(CAMPOS)], valores[len(CAMPOS) :]
+        filas.append(
+            {
+                "prestamo_id": pid,
+                "guardado": dict(zip(CAMPOS, guardado)),
+                "esperado": dict(zip(CAMPOS, correcto)),
+            }
+        )
+    return filas
+
+
+def reconciliar(session: Session, reparar: bool = False) -> list:
+    """
+    Lista las diferencias y, con ``reparar``, recalcula esos préstamos en la
+    transacción de ``session`` (el commit queda a cargo de quien llama).
+    """
+    malas = diferencias(session)
+    if reparar and malas:
+        recalcular(session.connection(), [d["prestamo_id"] for d in malas])
+        _expirar(session, [d["prestamo_id"] for d in malas])
+    return malas
+
+
+# ------------------------------ Mantenimiento ------------------------------
+
+def _expirar(session: Session, ids):
+    """Los Prestamo ya cargados vuelven a leer los campos (el UPDATE no pasa por el ORM)."""
+    if ids is None:
+        objetos = [o for o in session.identity_map.values() if isinstance(o, Prestamo)]
+    else:
+        objetos = [session.identity_map.get(session.identity_key(Prestamo, (i,))) for i in ids]
+    for p in objetos:
+        if p is not None:
+            session.expire(p, CAMPOS)
+
+
+@event.listens_for(Session, "after_flush")
+def _tras_flush(session, _ctx):
+    # new/dirty/deleted aún muestran el estado previo al flush
+    ids = {c.prestamo_id for c in chain(session.new, session.deleted) if isinstance(c, Cuota)}
+    for c in session.dirty:
+        if isinstance(c, Cuota) and session.is_modified(c, include_collections=False):
+            ids.add(c.prestamo_id)
+            ids.update(inspect(c).attrs.prestamo_id.history.deleted)  # si cambió de préstamo
+    ids.discard(None)
+    if ids:
+        recalcular(session.connection(), ids)
+        session.info.setdefault(_TOCADOS, set()).update(ids)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _refrescar(session, _ctx):
+    _expirar(session, session.info.pop(_TOCADOS, ()))
+
+
+def _afectados_antes(estado):
+    """Préstamos que tocará un UPDATE/DELETE masivo de Cuota (None = no se puede acotar)."""
+    params = estado.parameters
+    if isinstance(params, list) and params and "id" in params[0]:
+        # UPDATE masivo por llave primaria: lista de dicts con 'id'
+        cuotas = [p["id"] for p in params]
+        ids = set()
+        for i in range(0, len(cuotas), LOTE):
+            ids.update(
+                estado.session.execute(
+                    select(Cuota.prestamo_id).where(Cuota.id.in_(cuotas[i : i + LOTE])).distinct()
+                ).scalars()
+            )
+        return ids
+    criterio = estado.statement.whereclause
+    if criterio is None:
+        return None
+    return set(estado.session.execute(select(Cuota.prestamo_id).where(criterio).distinct()).scalars())
+
+
+def _insertados(estado):
+    params = estado.parameters
+    filas = params if isinstance(params, list) else [params] if isinstance(params, dict) else []
+    if not filas or any("prestamo_id" not in f for f in filas):
+        return None  # insert().values(...) o desde SELECT: se recalcula todo
+    return {f["prestamo_id"] for f in filas}
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _tras_escritura_masiva(estado):
+    if not (estado.is_update or estado.is_delete or estado.is_insert):
+        return None
+    mapper = estado.bind_mapper
+    if mapper is None or not issubclass(mapper.class_, Cuota):
+        return None
+    ids = _insertados(estado) if estado.is_insert else _afectados_antes(estado)
+    resultado = estado.invoke_statement()
+    if len(estado.statement.exported_columns):
+        # leer RETURNING antes de ejecutar otra sentencia en la conexión
+        resultado = resultado.freeze()()
+    if ids is None:
+        log.info("Escritura masiva de cuotas sin filtro acotable: se recalculan todos los saldos")
+    recalcular(estado.session.connection(), ids)
+    _expirar(estado.session, ids)
+    return resultado
@@ -1,4 +1,7 @@
 from __future__ import annotations
+import hashlib
+import json
+import os
 from datetime import date, datetime
 from decimal import Decimal, ROUND_HALF_UP
 from typing import List, Dict, Optional, Tuple, Iterable
@@ -206,6 +209,59 @@ small { color: #444; }
 .badge { font-size: 9pt; padding: 2px 6px; border: 1px solid #999; border-radius: 4px; }
 """
 
+_PLANTILLA_PDF = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "templates", "prestamos", "pdf.html"
+)
+_huella_formato: Optional[str] = None
+
+
+def _huella_formato_pdf() -> str:
+    """Hash de la plantilla + PDF_CSS: cambia si cambia el diseño del documento."""
+    global _huella_formato
+    if _huella_formato is None:
+        h = hashlib.sha256(PDF_CSS.encode("utf-8"))
+        try:
+            with open(_PLANTILLA_PDF, "rb") as f:
+                h.update(f.read())
+        except OSError:
+            pass
+        _huella_formato = h.hexdigest()
+    return _huella_formato
+
+
+def huella_prestamo(prestamo: Prestamo, motor: str = "weasyprint",
+                    fecha: Optional[date] = None) -> str:
+    """
+    SHA-256 de todo lo que se imprime en el PDF GP-R-004 (préstamo, colaborador,
+    cronograma, versión de formato y la 'Fecha:' del documento, ``fecha`` o
+    hoy). Si no cambia, el PDF guardado sigue vigente: se reutiliza dentro del
+    mismo día. ``motor`` distingue los PDF de ReportLab.
+    """
+    emp = prestamo.empleado
+    formato = [prestamo.version_formato, _huella_formato_pdf()]
+    if motor != "weasyprint":
+        formato.append(motor)
+    datos = {
+        "formato": formato,
+        "fecha_doc": str(fecha or date.today()),
+        "prestamo": [
+            prestamo.id,
+            prestamo.tipo,
+            prestamo.motivo_especifico,
+            str(dec(prestamo.monto_total)),
+            prestamo.n_cuotas,
+            str(prestamo.fecha_solicitud or ""),
+            str(prestamo.fecha_firma or ""),
+        ],
+        "empleado": [nombre_empleado(emp) if emp else "", getattr(emp, "dni", "")],
+        "cuotas": [
+            [c.orden, c.etiqueta, str(dec(c.monto))] for c in prestamo.cuotas
+        ],
+    }
+    raw = json.dumps(datos, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
 # ======================================================================
 # =============  EXCEL: CRONOGRAMA EN COLUMNAS (post 'AÑO')  ===========
 # =============  ORDEN: DESDE EL MES PRESENTE HACIA FUTURO  ===========
@@ -242,14 +298,25 @@ def _info_cuota(c: Cuota) -> Tuple[Optional[datetime], bool]:
     return None, es_grati
 
 
+def columna_cronograma(anio: int, mes: int, es_grati: bool = False) -> str:
+    """Cabecera de la columna del cronograma: 'abr 25' o 'grati jul 25'."""
+    etiqueta = f"{MESES_ABBR.get(mes, '')} {str(anio)[-2:]}"
+    return f"grati {etiqueta}" if es_grati else etiqueta
+
+
+def orden_columna_cronograma(anio: int, mes: int, es_grati: bool, hoy: date) -> float:
+    """Meses desde ``hoy``; la grati (-0.5) va justo antes de su mes."""
+    return (anio - hoy.year) * 12 + (mes - hoy.month) + (-0.5 if es_grati else 0.0)
+
+
 def _label_mes(fecha: datetime) -> str:
     """Etiqueta de mes: 'abr 25'."""
-    return f"{MESES_ABBR[fecha.month]} {str(fecha.year)[-2:]}"
+    return columna_cronograma(fecha.year, fecha.month)
 
 
 def _label_grati(fecha: datetime) -> str:
     """Etiqueta de gratificación, siempre con mes para evitar duplicados: 'grati jul 25'."""
-    return f"grati {MESES_ABBR[fecha.month]} {str(fecha.year)[-2:]}"
+    return columna_cronograma(fecha.year, fecha.month, True)
 
 
 def _months_diff(start: datetime, target: datetime) -> int:
@@ -257,6 +324,47 @@ def _months_diff(start: datetime, target: datetime) -> int:
     return (target.year - start.year) * 12 + (target.month - start.month)
 
 
+def pivot_cronograma(cuotas, hoy: Optional[date] = None, index=None):
+    """
+    Pivot vectorizado del cronograma: una fila por préstamo y una columna por
+    mes/grati (``columna_cronograma``), ordenadas desde el mes de ``hoy``.
+
+    ``cuotas`` es un DataFrame con prestamo_id, anio, mes, es_grati y monto;
+    las filas sin año/mes válidos se ignoran. Con ``index`` (ids de préstamo)
+    el resultado se alinea a esos ids, con 0.0 donde no hay cuotas.
+    """
+    import numpy as np  # import local, como pandas
+    import pandas as pd
+
+    hoy = hoy or date.today()
+    anio = pd.to_numeric(cuotas["anio"], errors="coerce").to_numpy(dtype=float)
+    mes = pd.to_numeric(cuotas["mes"], errors="coerce").to_numpy(dtype=float)
+    validas = (anio > 0) & (mes >= 1) & (mes <= 12)
+
+    anio = anio[validas].astype(np.int64)
+    mes = mes[validas].astype(np.int64)
+    grati = cuotas["es_grati"].fillna(False).to_numpy(dtype=bool)[validas]
+    monto = cuotas["monto"].to_numpy()[validas].astype(float)
+    ids = cuotas["prestamo_id"].to_numpy()[validas]
+
+    # Llave entera por columna: 2 * meses desde hoy - grati (mismo orden que
+    # orden_columna_cronograma, sin flotantes)
+    llave = 2 * ((anio - hoy.year) * 12 + (mes - hoy.month)) - grati
+    llaves, primera, col = np.unique(llave, return_index=True, return_inverse=True)
+    filas_ids, fila = np.unique(ids, return_inverse=True)
+
+    n_cols = len(llaves)
+    matriz = np.bincount(
+        fila * n_cols + col, weights=monto, minlength=len(filas_ids) * n_cols
+    ).reshape(len(filas_ids), n_cols)
+    columnas = [columna_cronograma(int(anio[i]), int(mes[i]), bool(grati[i])) for i in primera]
+
+    out = pd.DataFrame(matriz, index=pd.Index(filas_ids, name="prestamo_id"), columns=columnas)
+    if index is not None:
+        out = out.reindex(index, fill_value=0.0)
+    return out
+
+
 def preparar_columnas_cronograma_desde_hoy(
     prestamos: Iterable[Prestamo], hoy: Optional[date] = None
 ) -> Tuple[List[str], Dict[int, Dict[str, Decimal]]]:
@@ -326,8 +434,15 @@ def anexar_cronograma_a_dataframe(
     """
     import pandas as pd  # import local
 
-    cols, valores = preparar_columnas_cronograma_desde_hoy(prestamos, hoy=hoy)
-    if not cols:
+    registros = []
+    for p in prestamos:
+        for c in p.cuotas or []:
+            fecha, es_grati = _info_cuota(c)
+            if fecha:
+                registros.append(
+                    (int(p.id), fecha.year, fecha.month, es_grati, float(getattr(c, "monto", 0) or 0))
+                )
+    if not registros:
         return df.copy()
 
     if col_ano not in df.columns:
@@ -336,16 +451,10 @@ def anexar_cronograma_a_dataframe(
     pos = df.columns.get_loc(col_ano) + 1
 
     base = df.set_index(llave_col, drop=False)
-    cron = pd.DataFrame(0, index=base.index, columns=cols)
-
-    # Volcar montos en sus columnas
-    for pid, mapping in valores.items():
-        if pid in cron.index:
-            for col, monto in mapping.items():
-                if col in cron.columns:
-                    cron.at[pid, col] = float(
-                        monto
-                    )  # usar Decimal si tu writer lo soporta
+    cuotas = pd.DataFrame.from_records(
+        registros, columns=["prestamo_id", "anio", "mes", "es_grati", "monto"]
+    )
+    cron = pivot_cronograma(cuotas, hoy=hoy, index=base.index)
 
     # Reconstruir pegando justo después de 'AÑO'
     left = base.iloc[:, :pos]
@@ -0,0 +1,273 @@
+# prestamos/storage.py
+"""
+Almacenamiento de los PDF GP-R-004 indexado por huella.
+
+``Documento.hash`` guarda la huella SHA-256 del contenido del préstamo
+(``huella_prestamo``): mientras el préstamo y sus cuotas no cambien, el PDF
+ya emitido se reutiliza sin volver a renderizar y no se crean filas nuevas
+(una fila por contenido distinto).
+
+Los bytes van al almacén direccionado por contenido (``documentos.storage``)
+y ``Documento.ruta_pdf`` guarda la referencia ``cas:<sha256>``. Las filas
+antiguas con una ruta de ``storage/prestamos`` se siguen leyendo y el GC las
+migra al almacén. La escritura ocurre fuera de la petición: la respuesta
+sale de memoria.
+
+GC (``recolectar_basura``), cada DOCUMENT_GC_INTERVALO segundos (default
+21600; DOCUMENT_GC=0 lo desactiva):
+- deja una sola fila (la más reciente) por préstamo y huella;
+- borra filas cuyo archivo ya no existe (se re-emiten a demanda), solo si
+  se emitieron hace más de DOCUMENT_GC_GRACIA segundos (el archivo de una
+  emisión reciente puede estar aún pendiente en otro worker) y si son a lo
+  más DOCUMENT_GC_MAX_PERDIDAS (default 200); si hay más se asume el almacén
+  no disponible, se registra en el log y no se borra nada;
+- migra al almacén los archivos antiguos aún referenciados;
+- borra del almacén el contenido que ninguna fila referencia (tras una
+  gracia de DOCUMENT_GC_GRACIA segundos, default 3600);
+- cuenta los archivos sueltos de storage/prestamos sin referencia y solo los
+  borra con DOCUMENT_GC_BORRAR_LEGACY=1.
+"""
+from __future__ import annotations
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional, Tuple
+
+from sqlalchemy import func, or_
+
+from documentos.storage import document_store
+from models import db
+from .models import Prestamo, Documento
+from .services import huella_prestamo
+
+log = logging.getLogger(__name__)
+
+CARPETA_LEGACY = os.path.join("storage", "prestamos")
+PREFIJO_REF = "cas:"
+
+
+def ref_de(clave: str) -> str:
+    return PREFIJO_REF + clave
+
+
+def clave_de(ref: Optional[str]) -> Optional[str]:
+    if ref and ref.startswith(PREFIJO_REF):
+        return ref[len(PREFIJO_REF):]
+    return None
+
+
+def leer_pdf(ref: Optional[str]) -> Optional[bytes]:
+    """Bytes del PDF referenciado (almacén o ruta antigua); None si no existe."""
+    if not ref:
+        return None
+    clave = clave_de(ref)
+    if clave:
+        return document_store.leer(clave)
+    try:
+        with open(ref, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _disponible(ref: str) -> bool:
+    clave = clave_de(ref)
+    return document_store.disponible(clave) if clave else os.path.isfile(ref)
+
+
+def documento_vigente(p: Prestamo, huella: Optional[str] = None) -> Tuple[Optional[Documento], str]:
+    """
+    Documento más reciente cuya huella coincide con el estado actual del
+    préstamo (solo lectura; los duplicados los limpia ``recolectar_basura``).
+    """
+    huella = huella or huella_prestamo(p)
+    doc = (
+        Documento.query.filter_by(prestamo_id=p.id, hash=huella)
+        .order_by(Documento.id.desc())
+        .first()
+    )
+    return doc, huella
+
+
+def obtener_pdf_prestamo(p: Prestamo, render: Callable[[], bytes],
+                         huella: Optional[str] = None) -> bytes:
+    """
+    PDF del préstamo: reutiliza el emitido si la huella no cambió; si no,
+    llama a ``render()``, lo guarda en el almacén (en segundo plano) y
+    registra/actualiza el Documento.
+    """
+    doc, huella = documento_vigente(p, huella)
+    if doc is not None:
+        pdf = leer_pdf(doc.ruta_pdf)
+        if pdf is not None:
+            return pdf
+
+    pdf = render()
+    ref = ref_de(document_store.put_diferido(pdf))
+    if doc is None:
+        db.session.add(Documento(prestamo_id=p.id, ruta_pdf=ref, hash=huella))
+    else:
+        # Fila vigente pero archivo perdido: se vuelve a apuntar
+        doc.ruta_pdf = ref
+        doc.emitido_en = datetime.utcnow()  # nueva gracia para el GC
+    db.session.commit()
+    return pdf
+
+
+def liberar_pdfs(refs: Iterable[Optional[str]]):
+    """
+    Borra los archivos de ``refs`` que ya no referencia ninguna fila (llamar
+    después del commit que eliminó los Documentos). El contenido compartido
+    entre préstamos se conserva.
+    """
+    refs = {r for r in refs if r}
+    if not refs:
+        return
+    en_uso = {
+        r
+        for (r,) in db.session.query(Documento.ruta_pdf)
+        .filter(Documento.ruta_pdf.in_(refs))
+        .distinct()
+    }
+    for ref in refs - en_uso:
+        try:
+            clave = clave_de(ref)
+            if clave:
+                document_store.borrar(clave)
+            elif os.path.exists(ref):
+                os.remove(ref)
+        except OSError:
+            log.warning("No se pudo borrar archivo %s", ref)
+
+
+def _env_int(nombre: str, default: int) -> int:
+    try:
+        return int(os.getenv(nombre, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def recolectar_basura(gracia: Optional[int] = None) -> dict:
+    """Reconcilia ``Documento.ruta_pdf`` con el almacén y la carpeta antigua."""
+    gracia = _env_int("DOCUMENT_GC_GRACIA", 3600) if gracia is None else gracia
+    resumen = {
+        "duplicados_borrados": 0,
+        "filas_sin_archivo": 0,
+        "migrados": 0,
+        "huerfanos_borrados": 0,
+        "legacy_sin_referencia": 0,
+    }
+
+    # 0) Emisiones duplicadas (misma huella): queda la más reciente
+    ultimas = (
+        db.session.query(func.max(Documento.id))
+        .filter(Documento.hash.isnot(None))
+        .group_by(Documento.prestamo_id, Documento.hash)
+    )
+    sobrantes = (
+        db.session.query(Documento.id, Documento.ruta_pdf)
+        .filter(Documento.hash.isnot(None), Documento.id.not_in(ultimas))
+        .all()
+    )
+    for i in range(0, len(sobrantes), 500):
+        resumen["duplicados_borrados"] += Documento.query.filter(
+            Documento.id.in_([d for d, _r in sobrantes[i:i + 500]])
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    liberar_pdfs(r for _d, r in sobrantes)
+
+    refs = {r for (r,) in db.session.query(Documento.ruta_pdf).distinct() if r}
+
+    # 1) Filas cuyo archivo desapareció (fuera de la gracia: el archivo de una
+    #    emisión reciente puede seguir en la cola de escritura de otro worker)
+    corte = datetime.utcnow() - timedelta(seconds=gracia)
+    antiguas = or_(Documento.emitido_en.is_(None), Documento.emitido_en < corte)
+    candidatas = {
+        r for (r,) in db.session.query(Documento.ruta_pdf).filter(antiguas).distinct() if r
+    }
+    perdidas = sorted(r for r in candidatas if not _disponible(r))
+    maximo = _env_int("DOCUMENT_GC_MAX_PERDIDAS", 200)
+    if len(perdidas) > maximo:
+        log.error(
+            "GC de documentos: %d referencias sin archivo (máximo %d); ¿almacén no "
+            "disponible? No se borra ninguna fila. Primeras: %s",
+            len(perdidas), maximo, perdidas[:10],
+        )
+        perdidas = []
+    for i in range(0, len(perdidas), 500):
+        lote = perdidas[i:i + 500]
+        log.warning("GC de documentos: filas sin archivo borradas: %s", lote)
+        resumen["filas_sin_archivo"] += Documento.query.filter(
+            Documento.ruta_pdf.in_(lote), antiguas
+        ).delete(synchronize_session=False)
+    db.session.commit()
+    refs.difference_update(perdidas)
+
+    # 2) Archivos antiguos (rutas planas) aún referenciados -> almacén
+    for ruta in sorted(r for r in refs if not clave_de(r)):
+        data = leer_pdf(ruta)
+        if data is None:
+            continue
+        ref = ref_de(document_store.put(data))
+        Documento.query.filter(Documento.ruta_pdf == ruta).update(
+            {Documento.ruta_pdf: ref}, synchronize_session=False
+        )
+        db.session.commit()
+        refs.discard(ruta)
+        refs.add(ref)
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+        resumen["migrados"] += 1
+
+    # 3) Contenido del almacén sin referencia
+    usadas = {clave_de(r) for r in refs}
+    limite = time.time() - gracia
+    for clave, mtime in list(document_store.claves()):
+        if clave in usadas or mtime > limite or document_store.pendiente(clave):
+            continue
+        document_store.borrar(clave)
+        resumen["huerfanos_borrados"] += 1
+
+    # 4) Archivos sueltos de la carpeta antigua
+    borrar_legacy = os.getenv("DOCUMENT_GC_BORRAR_LEGACY", "0") == "1"
+    if os.path.isdir(CARPETA_LEGACY):
+        for nombre in os.listdir(CARPETA_LEGACY):
+            ruta = os.path.join(CARPETA_LEGACY, nombre)
+            if ruta in refs or not os.path.isfile(ruta) or os.path.getmtime(ruta) > limite:
+                continue
+            resumen["legacy_sin_referencia"] += 1
+            if borrar_legacy:
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    log.warning("No se pudo borrar archivo %s", ruta)
+
+    log.info("GC de documentos: %s", resumen)
+    return resumen
+
+
+def iniciar_gc(app):
+    """Hilo que ejecuta ``recolectar_basura`` periódicamente en este worker."""
+    if os.getenv("DOCUMENT_GC", "1") == "0":
+        return None
+    intervalo = max(60, _env_int("DOCUMENT_GC_INTERVALO", 21600))
+
+    def _bucle():
+        # Desfase aleatorio: los workers de gunicorn no barren a la vez
+        time.sleep(random.uniform(60, 60 + intervalo / 4))
+        while True:
+            try:
+                with app.app_context():
+                    recolectar_basura()
+            except Exception:
+                log.exception("Falló el GC de documentos")
+            time.sleep(intervalo)
+
+    t = threading.Thread(target=_bucle, name="documentos-gc", daemon=True)
+    t.start()
+    return t
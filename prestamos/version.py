@@ -0,0 +1,117 @@
+# prestamos/version.py
+"""
+Marca de versión de los datos de préstamos.
+
+``VersionDatos(clave="prestamos").version`` sube en la misma transacción
+que cualquier escritura a Prestamo, Cuota, Amortizacion o Empleado (el
+Excel muestra DNI y nombre). Los flush del ORM (``after_flush``) y los
+UPDATE/DELETE/INSERT masivos del ORM (``do_orm_execute``) solo marcan la
+sesión; el UPDATE de la fila es uno solo, en ``before_commit``. Así esa fila
+(la misma para todos los escritores) es el último candado de la transacción
+y se retiene solo hasta el commit, no durante una importación o un cierre
+de mes completos. Si la transacción se revierte, la versión también.
+
+Sirve como llave de caché para reportes derivados de estos datos
+(``exportar.abrir_excel_prestamos``). Las escrituras con SQL directo
+(fuera del ORM) no suben la versión.
+"""
+from __future__ import annotations
+import logging
+from datetime import datetime
+from itertools import chain
+from typing import Callable, List
+
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session
+
+from models import db, Empleado
+from .models import Prestamo, Cuota, Amortizacion, VersionDatos
+
+log = logging.getLogger(__name__)
+
+CLAVE = "prestamos"
+MODELOS_VERSIONADOS = (Prestamo, Cuota, Amortizacion, Empleado)
+
+_tabla = VersionDatos.__table__
+_oyentes: List[Callable[[], None]] = []
+_PENDIENTE = "version_prestamos_pendiente"  # hubo cambios: subir al commit
+_SUBIO = "version_prestamos_subio"  # se subió: avisar a los oyentes tras el commit
+
+
+def version_actual() -> int:
+    v = db.session.query(VersionDatos.version).filter(VersionDatos.clave == CLAVE).scalar()
+    return v or 0
+
+
+def asegurar_version():
+    """Crea la fila del contador si no existe (al arrancar)."""
+    if db.session.get(VersionDatos, CLAVE) is None:
+        db.session.add(VersionDatos(clave=CLAVE, version=0))
+        db.session.commit()
+
+
+def al_cambiar(fn: Callable[[], None]):
+    """Registra ``fn()``, llamada tras cada commit que subió la versión (debe ser rápida)."""
+    _oyentes.append(fn)
+
+
+def _incrementar(session: Session):
+    conn = session.connection()
+    res = conn.execute(
+        update(_tabla)
+        .where(_tabla.c.clave == CLAVE)
+        .values(version=_tabla.c.version + 1, actualizado_en=datetime.utcnow())
+    )
+    if res.rowcount == 0:
+        conn.execute(insert(_tabla).values(clave=CLAVE, version=1, actualizado_en=datetime.utcnow()))
+    session.info[_SUBIO] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _tras_flush(session, _ctx):
+    # new/dirty/deleted aún muestran el estado previo al flush
+    cambios = any(
+        isinstance(o, MODELOS_VERSIONADOS) for o in chain(session.new, session.deleted)
+    ) or any(
+        isinstance(o, MODELOS_VERSIONADOS) and session.is_modified(o, include_collections=False)
+        for o in session.dirty
+    )
+    if cambios:
+        session.info[_PENDIENTE] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _tras_escritura_masiva(estado):
+    if not (estado.is_update or estado.is_delete or estado.is_insert):
+        return
+    mapper = estado.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, MODELOS_VERSIONADOS):
+        estado.session.info[_PENDIENTE] = True
+
+
+@event.listens_for(Session, "before_commit")
+def _antes_commit(session):
+    if session.in_nested_transaction():
+        return  # SAVEPOINT: se sube al commit de la transacción de afuera
+    # commit() hace el último flush después de este evento: se adelanta aquí
+    # para que sus cambios también marquen la sesión
+    session.flush()
+    if session.info.pop(_PENDIENTE, False):
+        _incrementar(session)
+
+
+@event.listens_for(Session, "after_commit")
+def _tras_commit(session):
+    if session.info.pop(_SUBIO, False):
+        for fn in _oyentes:
+            try:
+                fn()
+            except Exception:
+                log.exception("Falló un oyente de version_datos")
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _fin_transaccion(session, transaccion):
+    if transaccion.parent is None:  # la de afuera (rollback o cierre)
+        session.info.pop(_PENDIENTE, None)
+        session.info.pop(_SUBIO, None)
@@ -0,0 +1,94 @@
+# presupuesto_sql.py
+"""
+Presupuesto de sentencias SQL por petición (modo desarrollo y pruebas).
+
+Cuenta las sentencias que ejecuta cada petición y, si pasa del
+presupuesto, lo registra en el log (con las sentencias más repetidas, que
+suelen delatar un N+1) o lanza ``PresupuestoSQLExcedido``. La respuesta
+lleva ``X-SQL-Sentencias`` con el conteo (las respuestas en streaming
+cuentan solo hasta que empieza el cuerpo).
+
+Solo se activa con ``app.debug`` o ``app.testing`` (o si se fija
+``SQL_PRESUPUESTO`` explícitamente); en producción no cuesta nada.
+Las vistas que escalan a propósito con el tamaño de los datos (cargas
+masivas, lotes) declaran su propio límite con ``@presupuesto_sql(n)`` o
+quedan fuera con ``@presupuesto_sql(None)``.
+
+Configuración (entorno):
+    SQL_PRESUPUESTO         máximo de sentencias por petición (default 30; 0 = apagado)
+    SQL_PRESUPUESTO_ACCION  log | error (default: error con app.testing, log si no)
+"""
+from __future__ import annotations
+
+import os
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+POR_DEFECTO = 30
+_ATRIBUTO = "_presupuesto_sql"
+
+
+class PresupuestoSQLExcedido(RuntimeError):
+    pass
+
+
+def presupuesto_sql(limite):
+    """Decorador de vista: presupuesto propio (``None`` = sin límite)."""
+
+    def _decorar(fn):
+        # functools.wraps (login_required, etc.) copia el atributo hacia afuera
+        setattr(fn, _ATRIBUTO, limite)
+        return fn
+
+    return _decorar
+
+
+def _limite_global(app):
+    crudo = os.getenv("SQL_PRESUPUESTO")
+    if crudo is not None and crudo.strip():
+        return int(crudo) or None
+    return POR_DEFECTO if (app.debug or app.testing) else None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _contar(conn, cursor, sentencia, parametros, contexto, executemany):
+    if has_request_context():
+        conteo = g.get("sql_conteo")
+        if conteo is not None:
+            conteo[" ".join(sentencia.split())[:160]] += 1
+
+
+def iniciar_presupuesto_sql(app):
+    @app.before_request
+    def _iniciar():
+        limite = _limite_global(current_app)
+        if limite is None:
+            return
+        vista = current_app.view_functions.get(request.endpoint)
+        if vista is not None and hasattr(vista, _ATRIBUTO):
+            limite = getattr(vista, _ATRIBUTO)
+        if limite is not None:
+            g.sql_conteo = Counter()
+            g.sql_limite = limite
+
+    @app.after_request
+    def _revisar(resp):
+        conteo = g.get("sql_conteo")
+        if conteo is None:
+            return resp
+        total = sum(conteo.values())
+        resp.headers["X-SQL-Sentencias"] = str(total)
+        if total > g.sql_limite:
+            repetidas = "; ".join(f"{n}x {s}" for s, n in conteo.most_common(3))
+            msg = (
+                f"{request.method} {request.path} ({request.endpoint}) ejecutó {total} "
+                f"sentencias SQL (presupuesto {g.sql_limite}). Más repetidas: {repetidas}"
+            )
+            accion = os.getenv("SQL_PRESUPUESTO_ACCION") or ("error" if current_app.testing else "log")
+            if accion == "error":
+                raise PresupuestoSQLExcedido(msg)
+            current_app.logger.warning(msg)
+        return resp
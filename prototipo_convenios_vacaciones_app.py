@@ -1,16 +1,24 @@
 import os
 from datetime import timedelta
 from dotenv import load_dotenv
-from flask import Flask, render_template
+from flask import Flask, render_template, jsonify
 from flask_login import LoginManager, login_required
 
 # Blueprints
 from auth import auth_bp
 from convenios import convenios_bp  # <- ahora el paquete convenios expone el BP
 from prestamos import prestamos_bp
+from tareas import tareas_bp, tareas_worker
 
 # Modelos y utils
 from models import db, User
+from documentos import pdf_asset, pdf_cache, pdf_pool, RenderError
+from migraciones import migraciones_cli, preparar_base
+from presupuesto_sql import iniciar_presupuesto_sql
+from prestamos.services import PDF_CSS
+from prestamos.exportar import iniciar_precalculo_excel
+from prestamos.storage import iniciar_gc
+from prestamos.version import asegurar_version
 from utils import (
     normalize_db_url,
     fecha_literal,
@@ -28,6 +36,7 @@ app.jinja_env.globals.update(
     fecha_literal=fecha_literal,
     fecha_firma_literal=fecha_firma_literal,
     numero_a_letras=numero_a_letras,
+    pdf_asset=pdf_asset,  # imágenes de PDFs como data URI cacheado
 )
 
 
@@ -70,8 +79,9 @@ def create_app():
     # ---------- DB ----------
     db.init_app(app)
     with app.app_context():
-        db.create_all()
+        preparar_base()  # create_all + migraciones pendientes (migraciones/versiones.py)
         _seed_admin_if_empty()
+        asegurar_version()
 
     # ---------- Login ----------
     login_manager = LoginManager()
@@ -86,10 +96,41 @@ def create_app():
         except Exception:
             return None
 
+    # ---------- PDF ----------
+    # Pool de render por worker; sus procesos (precalentados: fuentes y CSS)
+    # se levantan con el primer PDF, así los comandos CLI no los crean
+    if os.getenv("PDF_WARMUP", "1") != "0":
+        pdf_pool.iniciar(css=(PDF_CSS,))
+
+    @app.errorhandler(RenderError)
+    def _render_error(e):
+        app.logger.warning("Render PDF fallido: %s", e)
+        resp = jsonify({"error": str(e)})
+        resp.status_code = e.status_code
+        if e.status_code == 503:
+            resp.headers["Retry-After"] = "5"
+        return resp
+
     # ---------- Blueprints ----------
     app.register_blueprint(auth_bp, url_prefix="/")
     app.register_blueprint(convenios_bp)  # /convenios/...
     app.register_blueprint(prestamos_bp)
+    app.register_blueprint(tareas_bp)  # /tareas/...
+    app.cli.add_command(migraciones_cli)  # flask migraciones estado|aplicar|planes
+
+    # Conteo de sentencias SQL por petición (solo debug/testing; ver presupuesto_sql.py)
+    iniciar_presupuesto_sql(app)
+
+    # ---------- Tareas en segundo plano ----------
+    # Un consumidor por worker web; TAREAS_WORKER=0 para procesos que solo encolan
+    if os.getenv("TAREAS_WORKER", "1") != "0":
+        tareas_worker.iniciar(app)
+
+    # GC del almacén de PDFs (filas sin archivo, archivos sin fila)
+    iniciar_gc(app)
+
+    # Excel de préstamos regenerado en segundo plano tras cambios (opcional)
+    iniciar_precalculo_excel(app)
 
     # ---------- Rutas base ----------
     @app.get("/health")
@@ -111,6 +152,11 @@ def create_app():
             lines.append(f"{r.rule:40s}  =>  {r.endpoint}  [{methods}]")
         return "<pre>" + "\n".join(lines) + "</pre>"
 
+    @app.get("/__pdf_cache")
+    @login_required
+    def __pdf_cache():
+        return pdf_cache.stats(), 200
+
     app.config["_INIT_DONE"] = True
     return app
 
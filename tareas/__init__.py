@@ -0,0 +1,9 @@
+# tareas/__init__.py
+from flask import Blueprint
+
+tareas_bp = Blueprint("tareas", __name__, url_prefix="/tareas")
+
+from .cola import encolar, encolar_desde_request, tareas_worker  # noqa: E402,F401
+
+# Importa las rutas para que se registren sobre este blueprint
+from . import routes  # noqa: E402,F401
@@ -0,0 +1,335 @@
+# tareas/cola.py
+"""
+Cola de tareas local respaldada por la base de datos.
+
+Las operaciones largas (Excel de préstamos, ZIP de PDFs, reconciliación de
+vacaciones) no caben en el --timeout de gunicorn. Se registran como filas de
+``tareas`` y un hilo por worker web las va tomando:
+
+- reclamo optimista: ``UPDATE ... WHERE estado='Pendiente'``; solo un worker
+  gana cada tarea aunque haya varios procesos gunicorn;
+- reintentos con espera exponencial hasta ``max_intentos`` (los ValueError
+  se consideran errores de datos y no se reintentan);
+- mientras corre, la tarea renueva ``latido_en`` cada TAREAS_LATIDO
+  segundos; si pasa TAREAS_TIMEOUT sin latido (proceso muerto a mitad) se
+  libera. El cierre (completada / fallida / reintento) es un UPDATE
+  condicionado a que la tarea siga en curso con el mismo worker e intento:
+  si otro la reclamó entretanto, el resultado de esta ejecución se descarta;
+- el artefacto queda en ``storage/tareas/<id>/`` y se purga junto con la
+  fila tras TAREAS_RETENCION_DIAS.
+
+Configuración (entorno):
+    TAREAS_WORKER          0 = no arrancar el hilo en este proceso
+    TAREAS_HILOS           hilos consumidores por proceso, default 1
+    TAREAS_INTERVALO       segundos entre sondeos de la cola, default 2
+    TAREAS_LATIDO          segundos entre latidos de una tarea en curso, default 30
+    TAREAS_TIMEOUT         segundos sin latido antes de dar por colgada una tarea, default 1800
+    TAREAS_BACKOFF         espera base (s) entre reintentos, default 30
+    TAREAS_RETENCION_DIAS  días que se guardan tareas terminadas, default 7
+    TAREAS_DIR             carpeta de artefactos
+"""
+import logging
+import os
+import shutil
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from flask import jsonify, request, url_for
+from flask_login import current_user
+from sqlalchemy import func
+from werkzeug.datastructures import MultiDict
+
+from documentos import BASE_DIR, BASE_URL
+from models import db
+from .models import Tarea, PENDIENTE, EN_CURSO, COMPLETADA, FALLIDA
+
+log = logging.getLogger(__name__)
+
+CARPETA_TAREAS = os.getenv("TAREAS_DIR", os.path.join(BASE_DIR, "storage", "tareas"))
+
+# tipo -> fn(params: MultiDict, carpeta: str) -> dict | None
+# El dict puede traer "archivo" (nombre dentro de ``carpeta``), "nombre"
+# (nombre de descarga) y "mimetype"; el resto se guarda como resumen.
+HANDLERS: Dict[str, Callable] = {}
+
+
+def handler(tipo: str):
+    """Decorador: registra la función que ejecuta las tareas de ``tipo``."""
+
+    def _registrar(fn):
+        HANDLERS[tipo] = fn
+        return fn
+
+    return _registrar
+
+
+def _cargar_handlers():
+    # Import diferido: los handlers dependen de los blueprints de la app
+    from . import handlers  # noqa: F401
+
+
+def _env_int(nombre: str, default: int) -> int:
+    try:
+        return int(os.getenv(nombre, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _normalizar_params(params) -> dict:
+    """{clave: [str, ...]} para poder leerlos como un MultiDict."""
+    if isinstance(params, MultiDict):
+        return {k: params.getlist(k) for k in params.keys()}
+    salida = {}
+    for k, v in (params or {}).items():
+        valores = v if isinstance(v, (list, tuple)) else [v]
+        salida[str(k)] = [str(x) for x in valores if x is not None]
+    return salida
+
+
+def encolar(tipo: str, params=None, creado_por: Optional[str] = None,
+            max_intentos: int = 3) -> Tarea:
+    """Registra una tarea pendiente (hace commit) y la devuelve."""
+    _cargar_handlers()
+    if tipo not in HANDLERS:
+        raise ValueError(f"Tipo de tarea desconocido: {tipo}")
+    t = Tarea(
+        tipo=tipo,
+        params=_normalizar_params(params),
+        max_intentos=max(1, int(max_intentos)),
+        creado_por=creado_por,
+    )
+    db.session.add(t)
+    db.session.commit()
+    return t
+
+
+def respuesta_encolada(t: Tarea):
+    """202 + Location con la URL de estado (para sondear)."""
+    data = t.to_dict()
+    data["estado_url"] = url_for("tareas.estado", tarea_id=t.id)
+    data["descarga_url"] = url_for("tareas.descarga", tarea_id=t.id)
+    resp = jsonify(data)
+    resp.status_code = 202
+    resp.headers["Location"] = data["estado_url"]
+    return resp
+
+
+def encolar_desde_request(tipo: str):
+    """Encola ``tipo`` con los query params de la petición actual (sin ?async)."""
+    params = MultiDict(
+        [(k, v) for k, v in request.args.items(multi=True) if k != "async"]
+    )
+    usuario = getattr(current_user, "username", None)
+    return respuesta_encolada(encolar(tipo, params, creado_por=usuario))
+
+
+class TareasWorker:
+    """Hilos que consumen la cola dentro de un worker web."""
+
+    def __init__(self):
+        self.app = None
+        self.nombre = f"{socket.gethostname()}:{os.getpid()}"
+        self._parar = threading.Event()
+        self._hilos = []
+        self._ultimo_mantenimiento = None
+
+    @property
+    def intervalo(self) -> int:
+        return max(1, _env_int("TAREAS_INTERVALO", 2))
+
+    def iniciar(self, app):
+        if self._hilos:
+            return
+        _cargar_handlers()
+        self.app = app
+        # pid actual: con gunicorn --preload el módulo se importa antes del fork
+        self.nombre = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(max(1, _env_int("TAREAS_HILOS", 1))):
+            t = threading.Thread(target=self._bucle, name=f"tareas-{i}", daemon=True)
+            t.start()
+            self._hilos.append(t)
+
+    def detener(self):
+        self._parar.set()
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            try:
+                hecho = self.procesar_una()
+            except Exception:
+                log.exception("Error en el bucle de tareas")
+                hecho = False
+            if not hecho:
+                self._parar.wait(self.intervalo)
+
+    def procesar_una(self) -> bool:
+        """Toma y ejecuta una tarea disponible. Devuelve False si no había."""
+        # Contexto de petición sintético: las plantillas de PDF usan url_for
+        with self.app.test_request_context(base_url=BASE_URL):
+            try:
+                self._mantenimiento()
+                tarea_id = self._reclamar()
+                if tarea_id is None:
+                    return False
+                self._ejecutar(tarea_id)
+                return True
+            finally:
+                db.session.remove()
+
+    # ---------- reclamo ----------
+    def _reclamar(self) -> Optional[int]:
+        ahora = datetime.utcnow()
+        candidatos = (
+            db.session.query(Tarea.id)
+            .filter(Tarea.estado == PENDIENTE, Tarea.disponible_en <= ahora)
+            .order_by(Tarea.disponible_en.asc(), Tarea.id.asc())
+            .limit(5)
+            .all()
+        )
+        for (tid,) in candidatos:
+            n = (
+                db.session.query(Tarea)
+                .filter(Tarea.id == tid, Tarea.estado == PENDIENTE)
+                .update(
+                    {
+                        Tarea.estado: EN_CURSO,
+                        Tarea.intentos: Tarea.intentos + 1,
+                        Tarea.iniciado_en: ahora,
+                        Tarea.latido_en: ahora,
+                        Tarea.worker: self.nombre,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            db.session.commit()
+            if n == 1:
+                return tid
+        return None
+
+    # ---------- ejecución ----------
+    def _propia(self, intentos: int) -> tuple:
+        """Criterio de la tarea mientras siga reclamada por este worker en este intento."""
+        return (Tarea.worker == self.nombre, Tarea.intentos == intentos)
+
+    def _ejecutar(self, tarea_id: int):
+        t = db.session.get(Tarea, tarea_id)
+        propia = self._propia(t.intentos)
+        fn = HANDLERS.get(t.tipo)
+        carpeta = os.path.join(CARPETA_TAREAS, str(t.id))
+        if fn is None:
+            self._fallar(t, f"Tipo de tarea desconocido: {t.tipo}", False, *propia)
+            return
+        os.makedirs(carpeta, exist_ok=True)
+        params = MultiDict(_normalizar_params(t.params))
+        fin = threading.Event()
+        latido = threading.Thread(
+            target=self._latir, args=(tarea_id, propia, fin), name=f"tareas-latido-{tarea_id}", daemon=True
+        )
+        latido.start()
+        try:
+            res = dict(fn(params, carpeta) or {})
+        except Exception as e:
+            db.session.rollback()
+            datos = isinstance(e, ValueError)
+            if datos:
+                log.warning("Tarea %s (%s) rechazada: %s", tarea_id, t.tipo, e)
+            else:
+                log.exception("Tarea %s (%s) falló", tarea_id, t.tipo)
+            t = db.session.get(Tarea, tarea_id)
+            self._fallar(t, f"{type(e).__name__}: {e}", not datos, *propia)
+            return
+        finally:
+            fin.set()
+            latido.join()
+
+        valores = {
+            Tarea.estado: COMPLETADA,
+            Tarea.error: None,
+            Tarea.terminado_en: datetime.utcnow(),
+        }
+        archivo = res.pop("archivo", None)
+        if archivo:
+            valores[Tarea.archivo_ruta] = os.path.join(carpeta, archivo)
+            valores[Tarea.archivo_nombre] = res.pop("nombre", archivo)
+            valores[Tarea.archivo_mimetype] = res.pop("mimetype", None) or "application/octet-stream"
+        valores[Tarea.resumen] = res or None
+        self._cerrar(tarea_id, valores, *propia)
+
+    def _cerrar(self, tarea_id: int, valores: dict, *criterio) -> bool:
+        """
+        UPDATE condicionado a que la tarea siga en curso (y a ``criterio``).
+        Si otro worker la reclamó entretanto, no toca nada y devuelve False.
+        """
+        n = (
+            db.session.query(Tarea)
+            .filter(Tarea.id == tarea_id, Tarea.estado == EN_CURSO, *criterio)
+            .update(valores, synchronize_session=False)
+        )
+        db.session.commit()
+        if n != 1:
+            log.warning("Tarea %s ya no pertenece a esta ejecución; se descarta su resultado", tarea_id)
+        return n == 1
+
+    def _fallar(self, t: Tarea, error: str, reintentar: bool = True, *criterio) -> bool:
+        valores = {Tarea.error: error[:2000]}
+        if reintentar and t.intentos < t.max_intentos:
+            espera = _env_int("TAREAS_BACKOFF", 30) * 2 ** max(0, t.intentos - 1)
+            valores[Tarea.estado] = PENDIENTE
+            valores[Tarea.disponible_en] = datetime.utcnow() + timedelta(seconds=espera)
+        else:
+            valores[Tarea.estado] = FALLIDA
+            valores[Tarea.terminado_en] = datetime.utcnow()
+        return self._cerrar(t.id, valores, Tarea.intentos == t.intentos, *criterio)
+
+    def _latir(self, tarea_id: int, propia: tuple, fin: threading.Event):
+        """Renueva ``latido_en`` hasta ``fin`` o hasta que la tarea deje de ser propia."""
+        cada = max(1, _env_int("TAREAS_LATIDO", 30))
+        with self.app.app_context():
+            try:
+                while not fin.wait(cada):
+                    try:
+                        n = (
+                            db.session.query(Tarea)
+                            .filter(Tarea.id == tarea_id, Tarea.estado == EN_CURSO, *propia)
+                            .update({Tarea.latido_en: datetime.utcnow()}, synchronize_session=False)
+                        )
+                        db.session.commit()
+                    except Exception:
+                        db.session.rollback()
+                        log.exception("No se pudo renovar el latido de la tarea %s", tarea_id)
+                        continue
+                    if n != 1:
+                        log.warning("Tarea %s reclamada por otro worker; se deja de renovar", tarea_id)
+                        return
+            finally:
+                db.session.remove()
+
+    # ---------- mantenimiento ----------
+    def _mantenimiento(self):
+        """Libera tareas colgadas y purga las antiguas (como mucho 1 vez/min)."""
+        ahora = datetime.utcnow()
+        if self._ultimo_mantenimiento and ahora - self._ultimo_mantenimiento < timedelta(minutes=1):
+            return
+        self._ultimo_mantenimiento = ahora
+
+        limite = ahora - timedelta(seconds=_env_int("TAREAS_TIMEOUT", 1800))
+        sin_latido = func.coalesce(Tarea.latido_en, Tarea.iniciado_en) < limite
+        for t in Tarea.query.filter(Tarea.estado == EN_CURSO, sin_latido).all():
+            desde = t.latido_en or t.iniciado_en
+            if self._fallar(t, "Tiempo máximo excedido (worker caído o tarea colgada)", True, sin_latido):
+                log.warning("Tarea %s sin latido desde %s; se libera", t.id, desde)
+
+        retencion = ahora - timedelta(days=_env_int("TAREAS_RETENCION_DIAS", 7))
+        viejas = Tarea.query.filter(
+            Tarea.estado.in_((COMPLETADA, FALLIDA)), Tarea.terminado_en < retencion
+        ).all()
+        for t in viejas:
+            shutil.rmtree(os.path.join(CARPETA_TAREAS, str(t.id)), ignore_errors=True)
+            db.session.delete(t)
+        if viejas:
+            db.session.commit()
+
+
+tareas_worker = TareasWorker()
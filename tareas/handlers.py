@@ -0,0 +1,66 @@
+# tareas/handlers.py
+"""Tareas disponibles en la cola (ver ``cola.handler``)."""
+import os
+from datetime import date
+
+from documentos.lote import pdfs_en_paralelo, zip_en_stream
+from .cola import handler
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _escribir_zip(docs, ruta: str):
+    """Vuelca el ZIP en streaming a ``ruta`` (atómico: .tmp + replace)."""
+    tmp = ruta + ".tmp"
+    with open(tmp, "wb") as f:
+        for trozo in zip_en_stream(pdfs_en_paralelo(docs)):
+            f.write(trozo)
+    os.replace(tmp, ruta)
+
+
+@handler("export_excel")
+def export_excel(params, carpeta):
+    from prestamos.exportar import generar_excel_prestamos
+
+    generar_excel_prestamos(os.path.join(carpeta, "Prestamos.xlsx"))
+    return {"archivo": "Prestamos.xlsx", "mimetype": MIME_XLSX}
+
+
+@handler("pdf_lote_prestamos")
+def pdf_lote_prestamos(params, carpeta):
+    from prestamos.routes import documentos_prestamos_lote, ids_prestamos_lote
+
+    ids = ids_prestamos_lote(params)
+    if not ids:
+        raise ValueError("No hay préstamos para los filtros indicados")
+    nombre = f"prestamos_{date.today().isoformat()}.zip"
+    _escribir_zip(documentos_prestamos_lote(ids), os.path.join(carpeta, nombre))
+    return {"archivo": nombre, "mimetype": "application/zip", "documentos": len(ids)}
+
+
+@handler("pdf_lote_convenios")
+def pdf_lote_convenios(params, carpeta):
+    from convenios.routes import documentos_convenios_lote, ids_convenios_lote
+
+    ids = ids_convenios_lote(params)
+    if not ids:
+        raise ValueError("No hay convenios para los filtros indicados")
+    nombre = f"convenios_{date.today().isoformat()}.zip"
+    _escribir_zip(documentos_convenios_lote(ids), os.path.join(carpeta, nombre))
+    return {"archivo": nombre, "mimetype": "application/zip", "documentos": len(ids)}
+
+
+@handler("gc_documentos")
+def gc_documentos(params, carpeta):
+    from prestamos.storage import recolectar_basura
+
+    return recolectar_basura()
+
+
+@handler("reconciliar_acumulacion")
+def reconciliar_acumulacion(params, carpeta):
+    from models import PeriodoVacacional
+    from utils import reconciliar_acumulacion_global
+
+    reconciliar_acumulacion_global()
+    return {"periodos": PeriodoVacacional.query.count()}
@@ -0,0 +1,62 @@
+from __future__ import annotations
+from datetime import datetime
+
+from models import db
+
+
+PENDIENTE = "Pendiente"
+EN_CURSO = "En curso"
+COMPLETADA = "Completada"
+FALLIDA = "Fallida"
+
+
+class Tarea(db.Model):
+    """Trabajo en segundo plano (Excel, ZIP de PDFs, reconciliaciones...)."""
+
+    __tablename__ = "tareas"
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.JSON, default=dict)  # {"dni": ["123", ...], ...}
+    estado = db.Column(db.String(20), nullable=False, default=PENDIENTE)
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    max_intentos = db.Column(db.Integer, nullable=False, default=3)
+    # No se toma antes de esta hora (reintentos con espera)
+    disponible_en = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    worker = db.Column(db.String(80))
+    error = db.Column(db.Text)
+    resumen = db.Column(db.JSON)
+
+    archivo_ruta = db.Column(db.String(500))
+    archivo_nombre = db.Column(db.String(255))
+    archivo_mimetype = db.Column(db.String(100))
+
+    creado_por = db.Column(db.String(80))
+    creado_en = db.Column(db.DateTime, default=datetime.utcnow)
+    iniciado_en = db.Column(db.DateTime)
+    # Lo renueva el worker mientras la tarea corre; sin latido se da por colgada
+    latido_en = db.Column(db.DateTime)
+    terminado_en = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index("ix_tareas_estado_disponible", "estado", "disponible_en"),)
+
+    @property
+    def terminada(self) -> bool:
+        return self.estado in (COMPLETADA, FALLIDA)
+
+    def to_dict(self) -> dict:
+        def _iso(dt):
+            return dt.isoformat(timespec="seconds") + "Z" if dt else None
+
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "estado": self.estado,
+            "intentos": self.intentos,
+            "max_intentos": self.max_intentos,
+            "error": self.error,
+            "resumen": self.resumen,
+            "archivo": self.archivo_nombre,
+            "creado_en": _iso(self.creado_en),
+            "iniciado_en": _iso(self.iniciado_en),
+            "terminado_en": _iso(self.terminado_en),
+        }
@@ -0,0 +1,66 @@
+# tareas/routes.py
+import os
+
+from flask import request, jsonify, send_file, url_for
+from flask_login import login_required, current_user
+
+from models import db
+from . import tareas_bp
+from .cola import encolar, respuesta_encolada
+from .models import Tarea, COMPLETADA
+
+
+@tareas_bp.post("", endpoint="crear")
+@login_required
+def crear_tarea():
+    """
+    Encola una tarea.
+    Body JSON: {"tipo": <registrado en tareas/handlers.py>, "params": {...}}
+    (export_excel, pdf_lote_prestamos, pdf_lote_convenios, gc_documentos,
+    reconciliar_acumulacion)
+    """
+    d = request.get_json(silent=True) or {}
+    tipo = (d.get("tipo") or "").strip()
+    params = d.get("params") or {}
+    if not isinstance(params, dict):
+        return jsonify({"error": "params debe ser un objeto"}), 400
+    try:
+        t = encolar(
+            tipo,
+            params,
+            creado_por=getattr(current_user, "username", None),
+            max_intentos=d.get("max_intentos") or 3,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return respuesta_encolada(t)
+
+
+@tareas_bp.get("/<int:tarea_id>", endpoint="estado")
+@login_required
+def estado_tarea(tarea_id: int):
+    t = db.get_or_404(Tarea, tarea_id)
+    data = t.to_dict()
+    if t.estado == COMPLETADA and t.archivo_ruta:
+        data["descarga_url"] = url_for("tareas.descarga", tarea_id=t.id)
+    return jsonify(data)
+
+
+@tareas_bp.get("/<int:tarea_id>/descarga", endpoint="descarga")
+@login_required
+def descargar_tarea(tarea_id: int):
+    t = db.get_or_404(Tarea, tarea_id)
+    if t.estado != COMPLETADA:
+        resp = jsonify({"error": "La tarea aún no termina", "estado": t.estado})
+        resp.status_code = 409
+        if not t.terminada:
+            resp.headers["Retry-After"] = "5"
+        return resp
+    if not t.archivo_ruta or not os.path.exists(t.archivo_ruta):
+        return jsonify({"error": "La tarea no generó archivo o ya fue purgado"}), 404
+    return send_file(
+        t.archivo_ruta,
+        mimetype=t.archivo_mimetype,
+        as_attachment=True,
+        download_name=t.archivo_nombre,
+    )